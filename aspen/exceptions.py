@@ -46,6 +46,29 @@ class NotFound(Exception):
         self.message = message or "not found"
 
 
+class NotModified(Exception):
+    """The client's cached copy of the resource is still valid (HTTP status code 304).
+
+    The :attr:`output` attribute is an :class:`~aspen.output.Output` object
+    without a body, it carries the validators (``etag`` and ``last_modified``)
+    of the resource.
+    """
+
+    def __init__(self, output):
+        self.output = output
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested byte ranges overlap the resource (HTTP status code 416).
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def __str__(self):
+        return "none of the requested ranges can be satisfied (size=%i)" % self.size
+
+
 class AttemptedBreakout(Exception):
     """Raised when a request is dispatched to a symlinked file which is outside
     :attr:`~aspen.request_processor.DefaultConfiguration.www_root`.
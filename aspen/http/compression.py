@@ -0,0 +1,112 @@
+"""
+This module implements compressing outputs with gzip, and deciding when to do it.
+"""
+import os
+import re
+import zlib
+
+
+COMPRESSIBLE_MEDIA_TYPES = frozenset([
+    'application/ecmascript',
+    'application/javascript',
+    'application/json',
+    'application/manifest+json',
+    'application/rss+xml',
+    'application/atom+xml',
+    'application/x-javascript',
+    'application/xhtml+xml',
+    'application/xml',
+    'image/svg+xml',
+    'image/x-icon',
+])
+
+MIN_SIZE = 1024
+"Files smaller than this many bytes aren't worth compressing."
+
+ACCEPT_ENCODING_RE = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([^\s,;]+))?[^,]*(?:,|$)')
+
+
+def accepts_gzip(accept_encoding):
+    """Given the value of an ``Accept-Encoding`` header, return a boolean.
+
+    >>> accepts_gzip('gzip, deflate, br')
+    True
+    >>> accepts_gzip('gzip;q=0, *')
+    False
+    >>> accepts_gzip('*;q=0.5')
+    True
+    >>> accepts_gzip('identity')
+    False
+    """
+    star = None
+    for m in ACCEPT_ENCODING_RE.finditer(accept_encoding):
+        coding, q = m.groups()
+        try:
+            acceptable = q is None or float(q) > 0
+        except ValueError:
+            acceptable = False
+        coding = coding.lower()
+        if coding in ('gzip', 'x-gzip'):
+            return acceptable
+        if coding == '*':
+            star = acceptable
+    return bool(star)
+
+
+def is_compressible(media_type):
+    """Return :obj:`True` if compressing content of the given media type is worthwhile.
+    """
+    if not media_type:
+        return False
+    media_type = media_type.split(';', 1)[0].strip().lower()
+    return (
+        media_type.startswith('text/') or
+        media_type in COMPRESSIBLE_MEDIA_TYPES or
+        media_type.endswith('+json') or
+        media_type.endswith('+xml')
+    )
+
+
+def gzip_compress(data, level=9):
+    """Compress :class:`bytes` into the gzip format, using :mod:`zlib`.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_etag(etag):
+    """Derive the entity tag of a gzipped representation from the original one.
+
+    >>> gzip_etag('W/"foo"')
+    'W/"foo-gzip"'
+    """
+    return etag[:-1] + '-gzip"'
+
+
+def precompress_file(fspath, level=9):
+    """Create or update the ``.gz`` sibling of a file.
+
+    The sibling's modification time is set to the original file's, so that
+    :class:`~aspen.http.resource.Static` can detect stale siblings.
+
+    Returns:
+        :obj:`True` if the sibling was (re)written, :obj:`False` if it was
+        already up-to-date
+    """
+    gz_fspath = fspath + '.gz'
+    st = os.stat(fspath)
+    try:
+        if os.stat(gz_fspath).st_mtime_ns >= st.st_mtime_ns:
+            return False
+    except FileNotFoundError:
+        pass
+    with open(fspath, 'rb') as f:
+        compressed = gzip_compress(f.read(), level)
+    # Write to a hidden temporary file first, so that the sibling is replaced atomically
+    dirpath, name = os.path.split(gz_fspath)
+    tmp_fspath = os.path.join(dirpath, '.%s.tmp' % name)
+    with open(tmp_fspath, 'wb') as f:
+        f.write(compressed)
+    os.utime(tmp_fspath, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(tmp_fspath, gz_fspath)
+    return True
@@ -0,0 +1,83 @@
+"""
+This module implements the evaluation of conditional requests, as specified in
+`RFC 7232 <https://tools.ietf.org/html/rfc7232>`_.
+"""
+from email.utils import parsedate_to_datetime
+import re
+
+
+ETAG_RE = re.compile(r'\s*(?:W/)?("[^"]*")\s*(?:,|$)')
+
+
+def parse_etags(header):
+    """Parse the value of an ``If-None-Match`` header.
+
+    Returns:
+        ``'*'``, or a :class:`frozenset` of opaque tags (weak indicators are
+        stripped, because ``If-None-Match`` uses the weak comparison function)
+
+    >>> sorted(parse_etags('"foo", W/"bar"'))
+    ['"bar"', '"foo"']
+    >>> parse_etags(' * ')
+    '*'
+    """
+    header = header.strip()
+    if header == '*':
+        return header
+    return frozenset(m.group(1) for m in ETAG_RE.finditer(header))
+
+
+def parse_http_date(header):
+    """Parse an HTTP date into an :class:`int` POSIX timestamp.
+
+    Returns :obj:`None` if the date is invalid.
+
+    >>> parse_http_date('Sun, 06 Nov 1994 08:49:37 GMT')
+    784111777
+    >>> parse_http_date('yesterday') is None
+    True
+    """
+    try:
+        return int(parsedate_to_datetime(header).timestamp())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class Conditions:
+    """The preconditions of a request that can result in a 304 response.
+
+    Args:
+        if_none_match (str): the value of the ``If-None-Match`` header
+        if_modified_since (str): the value of the ``If-Modified-Since`` header
+    """
+
+    __slots__ = ('etags', 'modified_since')
+
+    def __init__(self, if_none_match=None, if_modified_since=None):
+        self.etags = parse_etags(if_none_match) if if_none_match else None
+        self.modified_since = (
+            parse_http_date(if_modified_since) if if_modified_since else None
+        )
+
+    def __bool__(self):
+        return self.etags is not None or self.modified_since is not None
+
+    def is_not_modified(self, etag, last_modified):
+        """Return :obj:`True` if the client's copy of the resource is still valid.
+
+        Args:
+            etag (str): the current entity tag of the resource, or :obj:`None`
+            last_modified (int): the current modification time of the resource,
+                or :obj:`None`
+
+        ``If-Modified-Since`` is ignored when ``If-None-Match`` is present.
+        """
+        if self.etags is not None:
+            if self.etags == '*' or etag is None:
+                return self.etags == '*'
+            if etag.startswith('W/'):
+                etag = etag[2:]
+            return etag in self.etags
+        if self.modified_since is not None and last_modified is not None:
+            return last_modified <= self.modified_since
+        return False
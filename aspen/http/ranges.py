@@ -0,0 +1,82 @@
+"""
+This module implements parsing the HTTP ``Range`` header, as specified in
+`RFC 7233 <https://tools.ietf.org/html/rfc7233>`_.
+"""
+import re
+
+from ..exceptions import RangeNotSatisfiable
+
+
+BYTE_RANGE_SPEC = re.compile(r'(\d*)[ \t]*-[ \t]*(\d*)$', re.ASCII)
+
+
+def parse_byte_ranges(header, size):
+    """Parse the value of a ``Range`` header.
+
+    Args:
+        header (str): the value of the ``Range`` header, e.g. ``'bytes=0-499'``
+        size (int): the total size of the resource, in bytes
+
+    Returns:
+        a list of ``(offset, length)`` tuples, in the order they were requested,
+        or :obj:`None` if the header isn't a valid byte range specifier (the
+        spec says that such a header should be ignored)
+
+    :raises RangeNotSatisfiable:
+        if none of the requested ranges overlap the resource
+
+    Examples:
+
+    >>> parse_byte_ranges('bytes=0-499', 10000)
+    [(0, 500)]
+    >>> parse_byte_ranges('bytes=9500-', 10000)
+    [(9500, 500)]
+    >>> parse_byte_ranges('bytes=-500', 10000)
+    [(9500, 500)]
+    >>> parse_byte_ranges('bytes=0-0, 5000-5999, 9999-20000', 10000)
+    [(0, 1), (5000, 1000), (9999, 1)]
+    >>> parse_byte_ranges('items=0-9', 10000) is None
+    True
+    >>> parse_byte_ranges('bytes=20000-', 10000)
+    Traceback (most recent call last):
+    ...
+    aspen.exceptions.RangeNotSatisfiable: none of the requested ranges can be satisfied (size=10000)
+
+    """
+    unit, sep, specs = header.partition('=')
+    if not sep or unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    specs = [spec.strip() for spec in specs.split(',')]
+    # Empty list elements are allowed by the spec, e.g. `bytes=0-9,,20-29`
+    specs = [spec for spec in specs if spec]
+    if not specs:
+        return None
+    for spec in specs:
+        match = BYTE_RANGE_SPEC.match(spec)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if first == '':
+            # Suffix range, e.g. `-500` means the last 500 bytes
+            if last == '':
+                return None
+            length = min(int(last), size)
+            if length == 0:
+                continue
+            ranges.append((size - length, length))
+            continue
+        first = int(first)
+        if last == '':
+            last = size - 1
+        else:
+            last = int(last)
+            if last < first:
+                return None
+            last = min(last, size - 1)
+        if first >= size:
+            continue
+        ranges.append((first, last - first + 1))
+    if not ranges:
+        raise RangeNotSatisfiable(size)
+    return ranges
@@ -1,10 +1,11 @@
-import os.path
+import os
 
 import mimeparse
-import mimetypes
 
-from ..exceptions import AttemptedBreakout, NegotiationFailure, NotFound
-from ..output import Output
+from ..exceptions import AttemptedBreakout, NegotiationFailure, NotFound, NotModified
+from .compression import gzip_etag, is_compressible
+from ..output import FileOutput, Output
+from ..utils import file_digest
 
 
 def _is_subpath(path, root):
@@ -29,11 +30,20 @@ def open_resource(request_processor, resource_path):
 def check_resource_path(request_processor, resource_path):
     """Return the “real” path of a file (i.e. a path without symlinks).
 
+    The result is cached in :attr:`request_processor.resources.real_paths
+    <aspen.resources.Resources.real_paths>`, so the symlinks are only resolved
+    the first time a resource is loaded, and again when it's reloaded because
+    it has been modified.
+
     :raises AttemptedBreakout:
         if the :obj:`resource_path` points to a file that isn't inside any of
         the known
         :attr:`~aspen.request_processor.DefaultConfiguration.resource_directories`
     """
+    real_paths = request_processor.resources.real_paths
+    real_path = real_paths.get(resource_path)
+    if real_path is not None:
+        return real_path
     real_path = os.path.realpath(resource_path)
     is_outside = all(
         not _is_subpath(real_path, resource_dir)
@@ -41,16 +51,32 @@ def check_resource_path(request_processor, resource_path):
     )
     if is_outside:
         raise AttemptedBreakout(resource_path, real_path)
+    real_paths[resource_path] = real_path
     return real_path
 
 
 class Static:
     """Model a static HTTP resource.
+
+    The :attr:`size` and :attr:`mtime_ns` attributes are taken from the file's
+    :class:`~aspen.request_processor.dispatcher.FileNode` when the dispatcher
+    has one, otherwise the file is stat'ed once.
     """
 
-    __slots__ = ('request_processor', 'fspath', 'raw', 'media_type', 'charset')
+    __slots__ = (
+        'request_processor', 'fspath', 'raw', 'media_type', 'charset', 'size', 'mtime_ns',
+        'etag', 'last_modified', 'gzip_fspath', 'gzip_raw', 'gzip_size',
+    )
 
     def __init__(self, request_processor, fspath):
+        node = request_processor.get_file_node(fspath)
+        if node is None:
+            st = os.stat(fspath)
+            self.size, self.mtime_ns = st.st_size, st.st_mtime_ns
+            self.media_type = request_processor.guess_media_type(fspath)
+        else:
+            self.size, self.mtime_ns = node.size, node.mtime_ns
+            self.media_type = node.media_type or request_processor.guess_media_type(fspath)
         raw = None
         read_file = (
             request_processor.store_static_files_in_ram or
@@ -62,7 +88,6 @@ class Static:
         self.request_processor = request_processor
         self.fspath = fspath
         self.raw = raw if request_processor.store_static_files_in_ram else None
-        self.media_type = request_processor.guess_media_type(fspath)
         self.charset = None
         if request_processor.charset_static:
             try:
@@ -70,28 +95,204 @@ class Static:
                 self.charset = request_processor.charset_static
             except UnicodeDecodeError:
                 pass
+        self.last_modified = self.mtime_ns // 1000000000
+        self.etag = None
+        etags = request_processor.static_etags
+        if etags == 'stat':
+            self.etag = '"%x-%x"' % (self.mtime_ns, self.size)
+        elif etags == 'digest':
+            # the path is checked before the file is read, even if it's a node's
+            real_path = check_resource_path(request_processor, fspath)
+            self.etag = '"%s"' % (node.digest if node else file_digest(real_path))
+        elif etags is not None:
+            raise ValueError("%r is not a valid value for `static_etags`" % etags)
+        # Look for an up-to-date precompressed sibling
+        self.gzip_fspath = self.gzip_raw = self.gzip_size = None
+        if request_processor.compress_static_files and is_compressible(self.media_type):
+            gzip_fspath = fspath + '.gz'
+            try:
+                gzip_st = os.stat(gzip_fspath)
+            except OSError:
+                gzip_st = None
+            if gzip_st is not None and gzip_st.st_mtime_ns >= self.mtime_ns:
+                self.gzip_fspath = gzip_fspath
+                self.gzip_size = gzip_st.st_size
+                if request_processor.store_static_files_in_ram:
+                    with open_resource(request_processor, gzip_fspath) as f:
+                        self.gzip_raw = f.read()
 
-    def render(self, *ignored):
+    def render(self, context=None, *ignored):
         """Returns the file's content as :class:`bytes`.
 
         If the ``store_static_files_in_ram`` configuration option was set to
         :obj:`False` (the default), then the file is read from the filesystem,
         otherwise its content is returned directly.
+
+        If the ``static_file_handoff`` configuration option was set to
+        :obj:`True`, and the file isn't stored in RAM, then the file isn't read,
+        a :class:`~aspen.output.FileOutput` object is returned instead.
+
+        If the ``compress_static_files`` configuration option was set to
+        :obj:`True`, the client accepts gzip (``context['__accept_gzip__']``), and
+        the file has an up-to-date ``.gz`` sibling, then the sibling's content
+        is returned instead, and the output's ``encoding`` is set to ``'gzip'``.
+
+        If ``context['__metadata_only__']`` is true, then the file isn't read, the
+        returned output has no body but its ``length`` is set.
+
+        :raises NotModified:
+            if the :class:`~aspen.http.conditional.Conditions` object stored in
+            ``context['__conditions__']`` says the client's copy is still valid, in
+            which case the file isn't read
         """
-        output = Output(media_type=self.media_type, charset=self.charset)
-        if self.raw is None:
-            with open_resource(self.request_processor, self.fspath) as f:
+        if self.gzip_fspath and context and context.get('__accept_gzip__'):
+            fspath, raw, encoding = self.gzip_fspath, self.gzip_raw, 'gzip'
+            etag = gzip_etag(self.etag) if self.etag else None
+            size = self.gzip_size
+        else:
+            fspath, raw, encoding, etag = self.fspath, self.raw, None, self.etag
+            size = self.size
+        conditions = context.get('__conditions__') if context else None
+        if conditions and conditions.is_not_modified(etag, self.last_modified):
+            raise NotModified(Output(
+                media_type=self.media_type, charset=self.charset,
+                etag=etag, last_modified=self.last_modified, encoding=encoding,
+            ))
+        if context and context.get('__metadata_only__'):
+            return Output(
+                media_type=self.media_type, charset=self.charset, etag=etag,
+                last_modified=self.last_modified, encoding=encoding, length=size,
+            )
+        if raw is None and self.request_processor.static_file_handoff:
+            f = open_resource(self.request_processor, fspath)
+            size = os.fstat(f.fileno()).st_size
+            return FileOutput(
+                f, size, media_type=self.media_type, charset=self.charset,
+                etag=etag, last_modified=self.last_modified, encoding=encoding,
+            )
+        output = Output(
+            media_type=self.media_type, charset=self.charset,
+            etag=etag, last_modified=self.last_modified, encoding=encoding,
+        )
+        if raw is None:
+            with open_resource(self.request_processor, fspath) as f:
                 output.body = f.read()
         else:
-            output.body = self.raw
+            output.body = raw
         return output
 
+    async def render_async(self, context=None, *ignored):
+        """Same as :meth:`render`, for
+        :meth:`~aspen.request_processor.RequestProcessor.process_async`.
+
+        The file is still read synchronously, unless the ``static_file_handoff``
+        configuration option is enabled.
+        """
+        return self.render(context)
+
+
+def _lru_get(cache, key, compute, maxsize):
+    """Get a value from a `dict` used as an LRU cache, computing it on a miss.
+    """
+    try:
+        value = cache.pop(key)
+    except KeyError:
+        value = compute(key)
+        if len(cache) >= maxsize:
+            # Evict the least recently used entry
+            cache.pop(next(iter(cache)), None)
+    cache[key] = value
+    return value
+
 
 class Dynamic:
     """Model a dynamic HTTP resource.
+
+    The results of content negotiation are cached in :attr:`extension_types`
+    and :attr:`accept_types`, so that repeat requests are negotiated with a
+    single dict lookup. Subclasses should call :meth:`precompute_negotiation`
+    once :attr:`available_types` is known, otherwise the tables are created
+    the first time they're needed.
     """
 
-    __slots__ = ('request_processor', 'available_types')
+    __slots__ = ('request_processor', 'available_types', 'extension_types', 'accept_types')
+
+    max_negotiations = 64
+    "The maximum number of negotiation results cached per resource, for each table."
+
+    def precompute_negotiation(self):
+        """Initialize the negotiation tables.
+
+        The table of URL extensions is prefilled with the extensions of the
+        available media types.
+        """
+        self.extension_types = {}
+        self.accept_types = {}
+        for media_type in self.available_types:
+            for ext in self.request_processor.media_types.guess_extensions(media_type):
+                ext = ext[1:]
+                if len(self.extension_types) < self.max_negotiations:
+                    self.extension_types[ext] = self._negotiate_extension(ext)
+
+    def negotiate_extension(self, extension):
+        """Return the media type to render for a URL extension.
+
+        :raises NotFound: if the extension is unknown or doesn't match any of
+            the available types
+        """
+        try:
+            table = self.extension_types
+        except AttributeError:
+            self.precompute_negotiation()
+            table = self.extension_types
+        media_type = _lru_get(
+            table, extension, self._negotiate_extension, self.max_negotiations,
+        )
+        if media_type is None:
+            raise NotFound()
+        return media_type
+
+    def _negotiate_extension(self, extension):
+        accept = self.request_processor.media_types.type_of_extension(extension)
+        if accept is None:
+            # The extension is unknown
+            return None
+        # Accept `media/type` for `media/x-type`
+        i = accept.find('/x-')
+        if i > 0:
+            accept += ',' + accept[:i+1] + accept[i+3:]
+        # Accept custom JSON media type
+        if accept == 'application/json':
+            accept += ',' + self.request_processor.media_type_json
+        best_match = self._best_match(accept)
+        if best_match == '':
+            # e.g. client requested `/foo.json` but `/foo.spt` has no JSON page
+            return None
+        return best_match
+
+    def negotiate_accept(self, accept_header):
+        """Return the media type to render for an ``Accept`` header.
+
+        :raises NegotiationFailure: if none of the available types is acceptable
+        """
+        try:
+            table = self.accept_types
+        except AttributeError:
+            self.precompute_negotiation()
+            table = self.accept_types
+        media_type = _lru_get(table, accept_header, self._best_match, self.max_negotiations)
+        if media_type == '':
+            raise NegotiationFailure(accept_header, self.available_types)
+        return media_type
+
+    def _best_match(self, accept):
+        try:
+            best_match = mimeparse.best_match(self.available_types, accept)
+        except ValueError:
+            # Unparseable accept header
+            best_match = None
+        # Fall back to the first available type
+        return self.available_types[0] if best_match is None else best_match
 
     def render(self, context, dispatch_result, accept_header):
         """Render the resource.
@@ -117,44 +318,36 @@ class Dynamic:
         Returns: an :class:`Output` object.
 
         """
-        available = self.available_types
+        return self.render_for_type(self.negotiate(dispatch_result, accept_header), context)
+
+    async def render_async(self, context, dispatch_result, accept_header):
+        """Same as :meth:`render`, but the resource is rendered by
+        :meth:`render_for_type_async`.
+        """
+        return await self.render_for_type_async(
+            self.negotiate(dispatch_result, accept_header), context
+        )
+
+    async def render_for_type_async(self, media_type, context):
+        """Render the resource without blocking the event loop.
 
+        Subclasses that can do so override this method, by default the resource
+        is rendered synchronously by :meth:`render_for_type`.
+        """
+        return self.render_for_type(media_type, context)
+
+    def negotiate(self, dispatch_result, accept_header):
+        """Return the media type to render (see :meth:`render`).
+        """
+        available = self.available_types
         dispatch_extension = dispatch_result.extension
         if dispatch_extension:
             # There's an extension in the URI path, guess the media type from it
-            dispatch_accept = mimetypes.guess_type('a.' + dispatch_extension, strict=False)[0]
-            if dispatch_accept is None:
-                # The extension is unknown, raise NotFound
-                raise NotFound()
-            accept = dispatch_accept
-            # Accept `media/type` for `media/x-type`
-            i = accept.find('/x-')
-            if i > 0:
-                accept += ',' + accept[:i+1] + accept[i+3:]
-            # Accept custom JSON media type
-            if accept == 'application/json':
-                accept += ',' + self.request_processor.media_type_json
-        elif len(available) == 1:
+            media_type = self.negotiate_extension(dispatch_extension)
+        elif len(available) == 1 or not accept_header:
             # If there's only one available type and no extension in the path,
             # then we ignore the Accept header
-            return self.render_for_type(available[0], context)
+            media_type = available[0]
         else:
-            dispatch_accept = None
-            accept = accept_header
-
-        if accept:
-            try:
-                best_match = mimeparse.best_match(available, accept)
-            except ValueError:
-                # Unparseable accept header
-                best_match = None
-            if best_match:
-                return self.render_for_type(best_match, context)
-            elif best_match == '':
-                if dispatch_accept is not None:
-                    # e.g. client requested `/foo.json` but `/foo.spt` has no JSON page
-                    raise NotFound()
-                raise NegotiationFailure(accept, available)
-
-        # Fall back to the first available type
-        return self.render_for_type(available[0], context)
+            media_type = self.negotiate_accept(accept_header)
+        return media_type
@@ -1,18 +1,246 @@
+import os
+
 from .utils import auto_repr
 
 
+def is_stream(body):
+    """Return :obj:`True` if :obj:`body` is an iterable of chunks rather than
+    a string.
+    """
+    return body is not None and not isinstance(body, (bytes, str))
+
+
+class Stream:
+    """Mark an iterable of :class:`str` or :class:`bytes` chunks as content to be
+    streamed.
+
+    Template renderers that support streaming (``stdlib_format`` and
+    ``stdlib_template``) insert the chunks of a :class:`Stream` value into the
+    body as they're sent, instead of formatting the value. Other values, even
+    iterators, are always formatted.
+
+    A :class:`Stream` takes ownership of its iterable: closing the stream, or
+    the body it's part of, closes the iterable as well if it has a ``close``
+    method.
+
+    A stream formatted with a format spec (e.g. ``{rows:>10}``) isn't streamed,
+    its :class:`str` chunks are joined and the result is formatted.
+
+    >>> list(Stream(['a', 'b'])), format(Stream(['a', 'b']), '>4')
+    (['a', 'b'], '  ab')
+    """
+
+    __slots__ = ('chunks',)
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+    def __format__(self, spec):
+        try:
+            joined = ''.join(self)
+        finally:
+            self.close()
+        return format(joined, spec)
+
+
+def chain_chunks(parts):
+    """Yield the chunks of a body made of strings and :class:`Stream` objects,
+    skipping empty strings. The streams are closed at the end.
+
+    >>> list(chain_chunks(['<ul>', Stream(['<li>1', '<li>2']), '', '</ul>']))
+    ['<ul>', '<li>1', '<li>2', '</ul>']
+    """
+    try:
+        for part in parts:
+            if type(part) is Stream:
+                yield from part
+            elif part:
+                yield part
+    finally:
+        for part in parts:
+            if type(part) is Stream:
+                part.close()
+
+
+def encode_chunks(chunks, charset):
+    """Encode an iterable of :class:`str` chunks lazily, skipping empty chunks.
+
+    Chunks that are already :class:`bytes` are passed through.
+
+    >>> list(encode_chunks(['{', '', '"é"', b'}'], 'utf8'))
+    [b'{', b'"\\xc3\\xa9"', b'}']
+    """
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            if chunk:
+                yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
 @auto_repr
 class Output:
     """The result of rendering a resource.
     """
 
-    __slots__ = ('body', 'media_type', 'charset')
+    __slots__ = (
+        'body', 'media_type', 'charset', 'etag', 'last_modified', 'encoding', 'length',
+    )
 
-    def __init__(self, body=None, media_type=None, charset=None):
+    def __init__(self, body=None, media_type=None, charset=None, etag=None,
+                 last_modified=None, encoding=None, length=None):
         self.body = body
+        """
+        The content of the output, as :class:`bytes`, or as an iterator of
+        :class:`bytes` chunks if the output is streamed (see :attr:`is_streamed`).
+        """
         self.media_type = media_type
         self.charset = charset
+        self.etag = etag
+        "The entity tag of the output, including the quotes, e.g. ``W/\"1a2b3c\"``."
+        self.last_modified = last_modified
+        "The modification time of the output, as an :class:`int` POSIX timestamp."
+        self.encoding = encoding
+        """
+        The content coding applied to the body, e.g. ``'gzip'`` (it belongs in
+        the ``Content-Encoding`` header), or :obj:`None`.
+        """
+        self.length = length
+        """
+        The length of the body in bytes, for metadata-only outputs that don't
+        have a :attr:`body`, or :obj:`None` if it's unknown.
+        """
+
+    @property
+    def content_length(self):
+        """The length of the body in bytes, or :obj:`None` if it's unknown.
+        """
+        if self.body is None or self.is_streamed:
+            return self.length
+        return len(self.body)
+
+    @property
+    def is_streamed(self):
+        """:obj:`True` if the body is an iterator of chunks instead of a string.
+
+        A streamed body should be sent with chunked transfer encoding, since its
+        length isn't known in advance.
+        """
+        return is_stream(self.body)
+
+    @property
+    def text(self):
+        if not self.charset or self.body is None or self.is_streamed:
+            return None
+        return self.body.decode(self.charset)
+
+    def close(self):
+        """Close the streamed body, if there is one, e.g. when it won't be sent.
+        """
+        close = getattr(self.body, 'close', None)
+        if close is not None and self.is_streamed:
+            close()
+
+
+@auto_repr
+class FileOutput(Output):
+    """The result of rendering a static file without reading it.
+
+    Instead of a :attr:`body`, objects of this class carry an open :attr:`file`,
+    so that a host framework can send it efficiently, for example with
+    :func:`os.sendfile` or ``wsgi.file_wrapper``. When that isn't possible,
+    iterating over the object yields the content in chunks.
+
+    The host framework is responsible for calling :meth:`close` once the
+    response has been sent. Iterating until the end closes the file as well.
+    """
+
+    __slots__ = ('file', 'size', 'ranges')
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, file, size, media_type=None, charset=None, ranges=None, etag=None,
+                 last_modified=None, encoding=None):
+        super(FileOutput, self).__init__(
+            None, media_type, charset, etag, last_modified, encoding
+        )
+        self.file = file
+        "The open file, in read-only binary mode."
+
+        self.size = size
+        "The total size of the file, in bytes."
+
+        self.ranges = ranges
+        """
+        The requested byte ranges as a list of ``(offset, length)`` tuples, or
+        :obj:`None` if the entire file should be sent.
+        """
+
+    @property
+    def content_length(self):
+        """The number of bytes that will be sent (excluding multipart overhead).
+        """
+        if self.ranges is None:
+            return self.size
+        return sum(length for offset, length in self.ranges)
 
     @property
     def text(self):
-        return self.body.decode(self.charset) if self.charset else None
+        return None
+
+    def fileno(self):
+        """Return the file descriptor, e.g. for :func:`os.sendfile`.
+        """
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+    def iter_range(self, offset, length, chunk_size=None):
+        """Yield the bytes of a range of the file in chunks.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        fd = self.file.fileno()
+        pread = getattr(os, 'pread', None)
+        if pread is None:
+            self.file.seek(offset)
+        while length > 0:
+            n = min(chunk_size, length)
+            if pread is None:
+                chunk = self.file.read(n)
+            else:
+                chunk = pread(fd, n, offset)
+            if not chunk:
+                # The file has been truncated
+                break
+            offset += len(chunk)
+            length -= len(chunk)
+            yield chunk
+
+    def __iter__(self):
+        """Yield the content in chunks, then close the file.
+
+        :raises ValueError: if multiple ranges have been requested
+        """
+        if self.ranges is None:
+            offset, length = 0, self.size
+        elif len(self.ranges) == 1:
+            offset, length = self.ranges[0]
+        else:
+            raise ValueError("can't iterate over multiple ranges")
+        try:
+            yield from self.iter_range(offset, length)
+        finally:
+            self.close()
@@ -3,18 +3,28 @@ The request processor dispatches requests to the filesystem, typecasts URL
 path variables, loads the resource from the filesystem, and then renders and
 encodes the resource (if it's dynamic).
 """
+from contextlib import suppress
 from copy import copy
 import errno
-import mimetypes
+from hashlib import sha256
 import os
 import sys
 from collections import defaultdict
 
 from . import typecasting
-from .dispatcher import DispatchStatus, HybridDispatcher, UserlandDispatcher
+from .media_types import BUNDLED_FILE, MediaTypeIndex
+from .startup import StartupProfiler
+from .dispatcher import (
+    DispatchStatus, HybridDispatcher, UserlandDispatcher, skip_hidden_and_precompressed_files,
+)
 from .typecasting import defaults as default_typecasters
 from ..resources import Resources
-from ..http.resource import Static
+from ..exceptions import NotModified
+from ..http.compression import MIN_SIZE, accepts_gzip, is_compressible, precompress_file
+from ..http.conditional import Conditions
+from ..http.ranges import parse_byte_ranges
+from ..http.resource import Static, check_resource_path
+from ..output import FileOutput, encode_chunks
 from ..exceptions import ConfigurationError
 
 
@@ -31,17 +41,34 @@ class RequestProcessor:
     for valid keys and default values.
     """
 
+    startup_report = None
+    """
+    A :class:`~aspen.request_processor.startup.StartupReport` if the
+    :attr:`~DefaultConfiguration.profile_startup` option is enabled,
+    otherwise :obj:`None`.
+    """
+
     def __init__(self, **kwargs):
+        profiler = StartupProfiler(
+            kwargs.get('profile_startup', DefaultConfiguration.profile_startup)
+        )
+        try:
+            self._initialize(kwargs, profiler)
+        except BaseException:
+            # stop tracing memory, without masking the original exception
+            with suppress(Exception):
+                profiler.stop()
+            raise
+        self.startup_report = profiler.stop()
+
+    def _initialize(self, kwargs, profiler):
+        profiler.phase('configuration')
+
         # Do some base-line configuration.
         # ================================
         # We want to do the following configuration of our Python environment
         # regardless of the user's configuration preferences
 
-        # mimetypes
-        aspens_mimetypes = os.path.join(os.path.dirname(__file__), 'mime.types')
-        mimetypes.knownfiles += [aspens_mimetypes]
-        # mimetypes.init is called below after the user has a turn.
-
         # XXX register codecs here
 
         # Configure from defaults and kwargs.
@@ -85,10 +112,6 @@ class RequestProcessor:
             self.project_root = os.path.realpath(self.project_root)
             self.resource_directories.insert(0, self.project_root)
 
-            # mime.types
-            users_mimetypes = os.path.join(self.project_root, 'mime.types')
-            mimetypes.knownfiles += [users_mimetypes]
-
             # PYTHONPATH
             sys.path.insert(0, self.project_root)
 
@@ -103,6 +126,7 @@ class RequestProcessor:
         self.resource_directories.insert(0, self.www_root)
 
         # kludge simplates -- should move out into a simplate plugin
+        profiler.phase('simplates')
         from ..simplates.renderers import factories
         from ..simplates.simplate import Simplate, SimplateDefaults
         Simplate.renderer_factories = factories(self)
@@ -119,28 +143,41 @@ class RequestProcessor:
         # set up dynamic class mapping
         self.dynamic_classes_by_file_extension = dict(spt=Simplate)
 
+        # mime.types
+        # ==========
+        # Parsing the mime.types files is somewhat expensive, so it's done once
+        # per process (or not at all if the index is cached on disk), instead of
+        # going through the global `mimetypes` registry on every lookup. This
+        # has to happen before the dispatch tree is built, because the media
+        # types of static files are guessed then.
+        profiler.phase('media_types')
+
+        media_types_files = [BUNDLED_FILE]
+        if self.project_root is not None:
+            media_types_files.append(os.path.join(self.project_root, 'mime.types'))
+        self.media_types = MediaTypeIndex.get(
+            media_types_files, self.media_type_overrides, self.media_type_index_cache,
+        )
+
         # create the dispatcher
+        profiler.phase('dispatcher')
         if self.dispatcher_class is None:
             self.dispatcher_class = (
                 HybridDispatcher if self.changes_reload else UserlandDispatcher
             )
+        dispatcher_options = dict(guess_media_type=self.guess_media_type)
+        if self.compress_static_files:
+            # Don't serve `foo.css.gz` as a separate resource
+            dispatcher_options['file_skipper'] = skip_hidden_and_precompressed_files
+        dispatcher_options.update(kwargs.get('dispatcher_options', {}))
         self.dispatcher = self.dispatcher_class(
             self.www_root, self.is_dynamic, self.indices, self.typecasters,
-            **kwargs.get('dispatcher_options', {})
+            **dispatcher_options
         )
         self.dispatcher.build_dispatch_tree()
 
-        # mime.types
-        # ==========
-        # It turns out that init'ing mimetypes is somewhat expensive. This is
-        # significant in testing, though in dev/production you wouldn't notice.
-        # In any case this means that if a devuser inits mimetypes themselves
-        # then we won't do so again here, which is fine. Right?
-
-        if not mimetypes.inited:
-            mimetypes.init()
-
         # create the resources cache
+        profiler.phase('resources')
         self.resources = Resources(self)
 
     def dispatch(self, path):
@@ -158,7 +195,11 @@ class RequestProcessor:
                 path[k] = v
         return dispatch_result
 
-    def process(self, path, querystring, accept_header, context):
+    def process(
+        self, path, querystring, accept_header, context, range_header=None,
+        if_none_match=None, if_modified_since=None, accept_encoding=None,
+        metadata_only=False,
+    ):
         """Process a request.
 
         Args:
@@ -166,27 +207,155 @@ class RequestProcessor:
             querystring (Querystring): the query parameters, e.g. :obj:`Querystring('?bar=baz')`
             accept_header (str): the value of the HTTP header ``Accept``
             context (dict): the context variables passed to dynamic resources
+            range_header (str): the value of the HTTP header ``Range``, it's
+                only taken into account when the output is a :class:`FileOutput`
+            if_none_match (str): the value of the HTTP header ``If-None-Match``
+            if_modified_since (str): the value of the HTTP header ``If-Modified-Since``
+            accept_encoding (str): the value of the HTTP header ``Accept-Encoding``,
+                it allows serving compressed outputs (see the ``encoding``
+                attribute of :class:`~aspen.output.Output`)
+            metadata_only (bool): if true, the returned output only carries
+                the metadata (media type, charset, length and validators),
+                its ``body`` is :obj:`None`; this is meant for ``HEAD`` requests
 
         Returns:
             A 3-tuple ``(dispatch_result, resource, output)``. The latter two are
-            set to :obj:`None` if dispatching failed.
+            set to :obj:`None` if dispatching failed. The output's body can be
+            an iterator of :class:`bytes` chunks (see
+            :attr:`~aspen.output.Output.is_streamed`), in which case dynamic
+            etags aren't computed.
+
+        :raises NotModified:
+            if the conditional headers show that the client's copy of the
+            resource is still valid (static files aren't read in that case,
+            and simplates aren't rendered if their second page sets validators)
+        :raises RangeNotSatisfiable:
+            if none of the ranges requested in :obj:`range_header` are satisfiable
 
         """
 
+        dispatch_result, resource, conditions = self._start_processing(
+            path, querystring, context, if_none_match, if_modified_since,
+            accept_encoding, metadata_only,
+        )
+        if resource is None:
+            return dispatch_result, None, None
+        output = resource.render(context, dispatch_result, accept_header)
+        output = self._finish_processing(output, conditions, range_header, metadata_only)
+        return dispatch_result, resource, output
+
+    async def process_async(
+        self, path, querystring, accept_header, context, range_header=None,
+        if_none_match=None, if_modified_since=None, accept_encoding=None,
+        metadata_only=False,
+    ):
+        """Process a request without blocking the event loop while the second
+        page of a simplate awaits something (e.g. an HTTP or database client).
+
+        The arguments, return value and exceptions are the same as
+        :meth:`process`'s. Asynchronous simplates, i.e. the ones whose second
+        page uses ``await`` outside of a function, can only be processed by
+        this method. Dispatching, loading resources and reading static files
+        are still done synchronously.
+        """
+        dispatch_result, resource, conditions = self._start_processing(
+            path, querystring, context, if_none_match, if_modified_since,
+            accept_encoding, metadata_only,
+        )
+        if resource is None:
+            return dispatch_result, None, None
+        output = await resource.render_async(context, dispatch_result, accept_header)
+        output = self._finish_processing(output, conditions, range_header, metadata_only)
+        return dispatch_result, resource, output
+
+    def _start_processing(
+        self, path, querystring, context, if_none_match, if_modified_since,
+        accept_encoding, metadata_only,
+    ):
+        """Dispatch a request and fill its context. Return the dispatch result,
+        the resource to render (:obj:`None` if dispatching failed), and the
+        request's :class:`Conditions` (if any).
+        """
         dispatch_result = self.dispatch(path)
 
         typecasting.apply_typecasters(self.typecasters, path, context)
 
-        if dispatch_result.match and dispatch_result.status == DispatchStatus.okay:
-            resource = self.resources.get(dispatch_result.match)
-            context['querystring'] = querystring
-            output = resource.render(context, dispatch_result, accept_header)
-            if not isinstance(output.body, bytes):
-                output.charset = self.encode_output_as
-                output.body = output.body.encode(output.charset)
-            return dispatch_result, resource, output
+        if not (dispatch_result.match and dispatch_result.status == DispatchStatus.okay):
+            return dispatch_result, None, None
+        resource = self.resources.get(dispatch_result.match)
+        context['querystring'] = querystring
+        conditions = None
+        if if_none_match or if_modified_since:
+            conditions = context['__conditions__'] = Conditions(if_none_match, if_modified_since)
+        if accept_encoding and accepts_gzip(accept_encoding):
+            context['__accept_gzip__'] = True
+        if metadata_only:
+            context['__metadata_only__'] = True
+        return dispatch_result, resource, conditions
+
+    def _finish_processing(self, output, conditions, range_header, metadata_only):
+        """Encode the output of a resource and check its validators.
+        """
+        if isinstance(output, FileOutput):
+            if range_header:
+                try:
+                    output.ranges = parse_byte_ranges(range_header, output.size)
+                except Exception:
+                    output.close()
+                    raise
+            return output
+        if output.is_streamed:
+            # Encode the chunks lazily, without joining them
+            output.charset = self.encode_output_as
+            output.body = encode_chunks(output.body, output.charset)
+        elif output.body is not None and not isinstance(output.body, bytes):
+            output.charset = self.encode_output_as
+            output.body = output.body.encode(output.charset)
+            if self.dynamic_etags and output.etag is None:
+                output.etag = '"%s"' % sha256(output.body).hexdigest()
+        if conditions and conditions.is_not_modified(output.etag, output.last_modified):
+            output.close()
+            output.body = None
+            raise NotModified(output)
+        if metadata_only and output.body is not None:
+            if output.is_streamed:
+                output.close()
+            else:
+                output.length = len(output.body)
+            output.body = None
+        return output
+
+    def precompress_static_files(self, min_size=MIN_SIZE):
+        """Create or update the ``.gz`` siblings of compressible static files.
 
-        return dispatch_result, None, None
+        This is meant to be called at build or warmup time, when the
+        ``compress_static_files`` configuration option is enabled. Only the
+        files in the dispatch tree are taken into account.
+
+        Returns:
+            the list of siblings that were (re)written
+        """
+        written = []
+        file_nodes = getattr(self.dispatcher, 'file_nodes', None) or {}
+        for fspath, node in sorted(file_nodes.items()):
+            if node.type != 'static' or node.size < min_size:
+                continue
+            if not is_compressible(node.media_type):
+                continue
+            real_path = check_resource_path(self, fspath)
+            if precompress_file(real_path):
+                written.append(real_path + '.gz')
+        return written
+
+    def get_file_node(self, fspath):
+        """Return the :class:`~aspen.request_processor.dispatcher.FileNode` of
+        a file, or :obj:`None` if the dispatcher doesn't have one.
+
+        File nodes carry metadata (size, modification time, media type) that is
+        collected when the dispatch tree is built.
+        """
+        file_nodes = getattr(self.dispatcher, 'file_nodes', None)
+        return file_nodes.get(fspath) if file_nodes else None
 
     def is_dynamic(self, fspath):
         """Given a filesystem path, return a boolean.
@@ -203,11 +372,12 @@ class RequestProcessor:
     def guess_media_type(self, filename):
         """Guess the media type of a file by looking at its extension.
 
-        This method is a small wrapper around :func:`mimetypes.guess_type`. It
-        returns :attr:`~DefaultConfiguration.media_type_default` if the guessing
-        fails.
+        This method is a small wrapper around
+        :meth:`~aspen.request_processor.media_types.MediaTypeIndex.guess_type`.
+        It returns :attr:`~DefaultConfiguration.media_type_default` if the
+        guessing fails.
         """
-        media_type = mimetypes.guess_type(filename, strict=False)[0]
+        media_type = self.media_types.guess_type(filename)
         if not media_type:
             media_type = self.media_type_default
         elif media_type == 'application/json':
@@ -231,6 +401,21 @@ class DefaultConfiguration:
     ``Content-Type`` HTTP headers (if the framework on top of Aspen supports that).
     """
 
+    compress_dynamic_output = False
+    """
+    If set to ``True``, the outputs of simplates that set ``output.etag`` in
+    their second page are gzipped for clients that accept it, and cached in
+    compressed form, so that repeated requests are served without rendering.
+    """
+
+    compress_static_files = False
+    """
+    If set to ``True``, static files that have an up-to-date ``.gz`` sibling
+    are served compressed to clients that accept gzip. The siblings can be
+    created by :meth:`RequestProcessor.precompress_static_files`. The
+    dispatcher ignores them, so they aren't served as separate resources.
+    """
+
     dispatcher_class = None
     """
     The kind of dispatcher that will be used to route requests to files. By
@@ -238,18 +423,102 @@ class DefaultConfiguration:
     set to ``True``, then :class:`HybridDispatcher` is used.
     """
 
+    dynamic_etags = False
+    """
+    If set to ``True``, an ``ETag`` is computed by hashing the output of dynamic
+    resources, unless they provide one themselves (see
+    :meth:`~aspen.simplates.simplate.Simplate.render_for_type`). This doesn't
+    avoid rendering, but it allows responding to revalidation requests without
+    sending the body.
+    """
+
     encode_output_as = 'UTF-8'
     "The encoding to use for dynamically-generated output."
 
     indices = default_indices
     "List of file names that will be treated as directory indexes. The order matters."
 
+    json_compact = False
+    """
+    Serialize the output of ``json_dump`` and ``jsonp_dump`` pages compactly,
+    i.e. without indentation and without sorting the keys. This is much faster,
+    because it allows using the C accelerator of the :mod:`json` module, or
+    orjson or ujson if one of them is installed. A page can override this by
+    setting ``json_compact`` in its first or second Python section.
+    """
+
+    json_stream = False
+    """
+    Stream the output of ``json_dump`` and ``jsonp_dump`` pages, i.e. produce
+    the body as an iterator of chunks instead of a single string (see
+    :attr:`~aspen.output.Output.is_streamed`). This reduces the memory usage of
+    very large JSON responses, but the encoding is slower. A page can override
+    this by setting ``json_stream`` in its first or second Python section.
+    """
+
+    json_stream_chunk_size = 64 * 1024
+    "The approximate size of the chunks of streamed JSON outputs, in characters."
+
     media_type_default = 'text/plain'
     "If the ``Content-Type`` of a response can't be determined, then this one is used."
 
+    media_type_index_cache = None
+    """
+    The path of a file in which the compiled index of media types is cached,
+    so that the ``mime.types`` files don't have to be parsed again when the
+    request processor is recreated. The cache is rebuilt automatically when
+    it's stale.
+    """
+
     media_type_json = 'application/json'
     "The media type to use for the JSON format."
 
+    media_type_overrides = {}
+    """
+    A mapping of file extensions to media types, e.g. ``{'md': 'text/markdown'}``.
+    It takes precedence over the ``mime.types`` files and the types registered
+    with :func:`mimetypes.add_type`.
+    """
+
+    page_two_as_function = False
+    """
+    Run the second page of simplates as the body of a function, instead of
+    executing it with the request context as its globals. The variables that
+    the page assigns are then fast local variables, which speeds up pages that
+    loop a lot. They're copied into the context afterwards for the renderers
+    (only the ones listed in ``__all__``, if the page defines it), and the
+    variables of the context that the page reassigns are loaded into them
+    beforehand, so pages behave the same in both modes, except that
+    :func:`globals` doesn't contain the page's variables and ``del`` doesn't
+    remove a variable from the context. A page that can't be a function body
+    (e.g. one that contains ``import *``) is executed as usual. A simplate can
+    also opt in or out by setting a ``page_two_as_function`` variable in its
+    first page.
+    """
+
+    prerender_simplates = False
+    """
+    Render the content pages of simplates whose output can't depend on the
+    request only once, and serve the cached bytes afterwards. A content page is
+    considered request-independent if the second page of the simplate is empty
+    and the page only uses variables defined by the first page, without
+    accessing their attributes or items (this is only known for the ``stdlib_*``
+    and ``aspen_template`` renderers). The values of these variables must not
+    change between requests, e.g. an object whose string form is the current
+    time would be frozen, that's why this is off by default. A simplate can
+    also opt in or out by setting a ``prerender`` variable to :obj:`True` or
+    :obj:`False` in its first page. Prerendering is disabled when
+    :attr:`changes_reload` is on.
+    """
+
+    profile_startup = False
+    """
+    Measure the wall time, memory allocations and module imports of each phase
+    of the request processor's construction. The results are stored in the
+    :attr:`~RequestProcessor.startup_report` attribute. Tracing allocations
+    slows the startup down, so the measured times are somewhat inflated.
+    """
+
     project_root = None
     "The root directory of your project."
 
@@ -264,6 +533,33 @@ class DefaultConfiguration:
     well if it exists.
     """
 
+    skip_rendering_for_metadata_only = False
+    """
+    Don't render the content pages of simplates for metadata-only requests
+    (i.e. ``HEAD`` requests, see :meth:`RequestProcessor.process`), unless the
+    body is needed to compute an ``ETag``. This is faster, but the response
+    can then differ from the one to a full request, e.g. a page that would
+    fail to render gets a successful response, and its charset is guessed. A
+    simplate can also opt in or out by setting a
+    ``skip_rendering_for_metadata_only`` variable in its first or second page.
+    By default the content is rendered and discarded, unless the output has
+    been prerendered or cached.
+    """
+
+    static_etags = 'stat'
+    """
+    How the ``ETag`` of static files is computed: ``'stat'`` derives it from the
+    file's modification time and size, ``'digest'`` from a hash of its content
+    (computed once each time the file is loaded), and :obj:`None` disables it.
+    """
+
+    static_file_handoff = False
+    """
+    If set to ``True``, static files that aren't stored in RAM aren't read,
+    they're returned as :class:`~aspen.output.FileOutput` objects instead, so
+    that the host framework can send them efficiently and serve byte ranges.
+    """
+
     store_static_files_in_ram = False
     "If set to ``True``, store the contents of static files in RAM."
 
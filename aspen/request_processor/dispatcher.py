@@ -15,7 +15,7 @@ except ImportError:
 
 from ..exceptions import PossibleBreakout, SlugCollision, WildcardCollision
 
-from ..utils import auto_repr, Constant
+from ..utils import auto_repr, file_digest, Constant
 
 
 def debug_noop(msg, *args):
@@ -122,9 +122,13 @@ MISSING = DispatchResult(DispatchStatus.missing, None, None, None, None)
 class FileNode:
     """Represents a file in a dispatch tree."""
 
-    __slots__ = ('fspath', 'type', 'wildcard', 'extension')
+    __slots__ = (
+        'fspath', 'type', 'wildcard', 'extension', 'size', 'mtime_ns', 'media_type',
+        '_digest',
+    )
 
-    def __init__(self, fspath, type, wildcard, extension):
+    def __init__(self, fspath, type, wildcard, extension, size=None, mtime_ns=None,
+                 media_type=None):
         self.fspath = fspath
         "The absolute filesystem path of this node."
 
@@ -137,6 +141,38 @@ class FileNode:
         self.extension = extension
         "The sub-extension of a dynamic file, e.g. ``json`` for ``foo.json.spt``."
 
+        self.size = size
+        "The size of the file in bytes, as of the last time it was stat'ed."
+
+        self.mtime_ns = mtime_ns
+        "The last modification time of the file, in nanoseconds."
+
+        self.media_type = media_type
+        "The media type of a static file (:obj:`None` for dynamic files)."
+
+        self._digest = None
+
+    @property
+    def digest(self):
+        """The SHA-256 hex digest of the file's content.
+
+        It's computed the first time it's accessed, and cached until
+        :meth:`update` detects a change. The file is read without checking
+        that it's inside a resource directory, that's the caller's job (see
+        :func:`~aspen.http.resource.check_resource_path`).
+        """
+        if self._digest is None:
+            self._digest = file_digest(self.fspath)
+        return self._digest
+
+    def update(self, stat_result):
+        """Refresh the file's metadata from the result of a :func:`os.stat` call.
+        """
+        if stat_result.st_mtime_ns != self.mtime_ns or stat_result.st_size != self.size:
+            self.size = stat_result.st_size
+            self.mtime_ns = stat_result.st_mtime_ns
+            self._digest = None
+
 
 @auto_repr
 class DirectoryNode:
@@ -244,6 +280,15 @@ def skip_hidden_files(name, dirpath):
     return name[0] == '.' and name != '.well-known'
 
 
+def skip_hidden_and_precompressed_files(name, dirpath):
+    """Skip the same files as :func:`skip_hidden_files`, as well as the ``.gz``
+    siblings of other files (e.g. ``style.css.gz`` if ``style.css`` exists).
+    """
+    if skip_hidden_files(name, dirpath):
+        return True
+    return name.endswith('.gz') and os.path.isfile(os.path.join(dirpath, name[:-3]))
+
+
 def skip_nothing(name, dirpath):
     """Always returns :obj:`False`.
     """
@@ -270,11 +315,15 @@ class Dispatcher:
         a function that takes a file name and a directory path and returns a boolean
     collision_handler
         a function that takes 3 arguments (`slug, node1, node2`) and returns a string
+    guess_media_type
+        a function that takes a file path and returns a media type, used to
+        fill the :attr:`~FileNode.media_type` attribute of static file nodes
     """
 
     def __init__(
         self, www_root, is_dynamic, indices, typecasters,
-        file_skipper=skip_hidden_files, collision_handler=hybrid_collision_handler
+        file_skipper=skip_hidden_files, collision_handler=hybrid_collision_handler,
+        guess_media_type=None,
     ):
         self.www_root = os.path.realpath(www_root)
         self.is_dynamic = is_dynamic
@@ -282,6 +331,9 @@ class Dispatcher:
         self.typecasters = typecasters
         self.file_skipper = file_skipper
         self.collision_handler = collision_handler
+        self.guess_media_type = guess_media_type
+        self.file_nodes = {}
+        "A dict of the :class:`FileNode` objects in the dispatch tree, keyed by filesystem path."
 
     def build_dispatch_tree(self):
         """Called to build the dispatch tree.
@@ -583,6 +635,7 @@ class UserlandDispatcher(Dispatcher):
 
     def build_dispatch_tree(self):
         """"""
+        self.file_nodes = {}
         children, mtime = self._build_subtree(self.www_root, {})
         self.tree = self.make_dir_node(self.www_root, None, children, mtime)
 
@@ -621,7 +674,9 @@ class UserlandDispatcher(Dispatcher):
                 if is_dir:
                     slug = self.DIR_WILDCARD
                 else:
-                    node = FileNode(fspath, node_type, wildcard, extension)
+                    node = self._make_file_node(entry, fspath, node_type, wildcard, extension)
+                    if node is None:
+                        continue
                     wildleafs = children.setdefault(self.LEAF_WILDCARDS, {})
                     wildleafs[extension] = node
                     continue
@@ -636,7 +691,9 @@ class UserlandDispatcher(Dispatcher):
                 subtree, mtime = self._build_subtree(fspath, subvarnames)
                 node = self.make_dir_node(fspath, wildcard, subtree, mtime)
             else:
-                node = FileNode(fspath, node_type, wildcard, extension)
+                node = self._make_file_node(entry, fspath, node_type, wildcard, extension)
+                if node is None:
+                    continue
             if slug in children:
                 previous = children[slug]
                 action = self.collision_handler(slug, previous, node)
@@ -656,6 +713,25 @@ class UserlandDispatcher(Dispatcher):
                 children[''] = node
         return children, mtime
 
+    def _make_file_node(self, entry, fspath, node_type, wildcard, extension):
+        """Create a :class:`FileNode`, using the stat info cached by the `DirEntry`.
+
+        Returns :obj:`None` if the file can't be stat'ed (e.g. a broken symlink).
+        """
+        try:
+            st = entry.stat()
+        except OSError as e:
+            debug("skipping %r: %s", fspath, e)
+            return None
+        media_type = None
+        if node_type == 'static' and self.guess_media_type:
+            media_type = self.guess_media_type(fspath)
+        node = FileNode(
+            fspath, node_type, wildcard, extension, st.st_size, st.st_mtime_ns, media_type
+        )
+        self.file_nodes[fspath] = node
+        return node
+
     def dispatch(self, path, path_segments):
         """"""
         DIR_WILDCARD = self.DIR_WILDCARD
@@ -808,6 +884,13 @@ class TestDispatcher:
     def __init__(self, *args, **kw):
         self.dispatchers = [cls(*args, **kw) for cls in DISPATCHER_CLASSES]
 
+    @property
+    def file_nodes(self):
+        for dispatcher in self.dispatchers:
+            if dispatcher.file_nodes:
+                return dispatcher.file_nodes
+        return {}
+
     def build_dispatch_tree(self):
         for dispatcher in self.dispatchers:
             dispatcher.build_dispatch_tree()
@@ -0,0 +1,251 @@
+"""
+This module implements a compiled index of media types, which replaces runtime
+lookups through the :mod:`mimetypes` module.
+"""
+from hashlib import sha256
+import json
+import mimetypes
+import os
+from posixpath import splitext
+from types import MappingProxyType
+
+
+BUNDLED_FILE = os.path.join(os.path.dirname(__file__), 'mime.types')
+"The ``mime.types`` file shipped with Aspen."
+
+CACHE_FORMAT_VERSION = 2
+
+MAX_MEMOIZED = 8
+_memo = {}
+
+
+def _init_registry():
+    if not mimetypes.inited:
+        mimetypes.init()
+
+
+def _new_database():
+    """Return a :class:`mimetypes.MimeTypes` object that contains the types of
+    the :mod:`mimetypes` module's global registry: the built-in types, the ones
+    read from the system's files by :func:`mimetypes.init`, and the ones
+    registered by the application with :func:`mimetypes.add_type`.
+    """
+    _init_registry()
+    db = mimetypes.MimeTypes()
+    # Python >= 3.9 only copies the built-in types into new objects
+    for ext, media_type in mimetypes.common_types.items():
+        db.add_type(media_type, ext, False)
+    for ext, media_type in mimetypes.types_map.items():
+        db.add_type(media_type, ext, True)
+    db.suffix_map = dict(mimetypes.suffix_map)
+    db.encodings_map = dict(mimetypes.encodings_map)
+    return db
+
+
+def _registry_digest():
+    """Return a digest of the :mod:`mimetypes` module's global registry, so
+    that the indexes built from it can be invalidated when it changes.
+    """
+    _init_registry()
+    registry = [
+        mimetypes.types_map, mimetypes.common_types, mimetypes.suffix_map,
+        mimetypes.encodings_map,
+    ]
+    return sha256(json.dumps(registry, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def _stat_sources(files):
+    sources = []
+    for fspath in files:
+        try:
+            st = os.stat(fspath)
+        except OSError:
+            continue
+        sources.append([fspath, st.st_mtime_ns, st.st_size])
+    return sources
+
+
+class MediaTypeIndex:
+    """A frozen mapping of file extensions to media types.
+
+    Args:
+        types_map (dict): a mapping of extensions (including the leading dot,
+            e.g. ``'.css'``) to media types
+        suffix_map (dict): a mapping of extension aliases, e.g. ``'.tgz'`` to
+            ``'.tar.gz'``
+        encodings_map (dict): a mapping of the extensions of content codings,
+            e.g. ``'.gz'`` to ``'gzip'``; those extensions are skipped when
+            guessing the type of a file
+
+    Objects of this class are normally created by :meth:`get`.
+    """
+
+    __slots__ = ('types_map', 'suffix_map', 'encodings_map', 'extensions_map', 'sources')
+
+    def __init__(self, types_map, suffix_map=None, encodings_map=None, sources=()):
+        self.types_map = MappingProxyType(dict(types_map))
+        self.suffix_map = MappingProxyType(dict(
+            mimetypes.suffix_map if suffix_map is None else suffix_map
+        ))
+        self.encodings_map = MappingProxyType(dict(
+            mimetypes.encodings_map if encodings_map is None else encodings_map
+        ))
+        extensions_map = {}
+        for ext, media_type in self.types_map.items():
+            extensions_map.setdefault(media_type, []).append(ext)
+        self.extensions_map = MappingProxyType({
+            media_type: tuple(extensions) for media_type, extensions in extensions_map.items()
+        })
+        self.sources = tuple(tuple(source) for source in sources)
+        "The files the index was built from, as ``(fspath, mtime_ns, size)`` tuples."
+
+    @classmethod
+    def build(cls, files=(), overrides=None, system_files=True):
+        """Compile an index.
+
+        Args:
+            files (list): paths of ``mime.types`` files to read, in increasing
+                order of precedence, files that don't exist are skipped
+            overrides (dict): a mapping of extensions to media types, which
+                takes precedence over the files
+            system_files (bool): whether the system's ``mime.types`` files
+                listed in :data:`mimetypes.knownfiles` are sources of the index,
+                i.e. whether it's stale when they change
+
+        The index starts with the types of the :mod:`mimetypes` module's global
+        registry, which includes the system's files and the types registered
+        with :func:`mimetypes.add_type`. The ``files`` and ``overrides`` take
+        precedence over it.
+        """
+        db = _new_database()
+        if system_files:
+            files = list(mimetypes.knownfiles) + list(files)
+        sources = _stat_sources(files)
+        for fspath, mtime_ns, size in sources:
+            if fspath in mimetypes.knownfiles:
+                # already read into the global registry
+                continue
+            db.read(fspath)
+        # Strict types take precedence over non-strict ones
+        types_map = dict(db.types_map[False])
+        types_map.update(db.types_map[True])
+        for ext, media_type in (overrides or {}).items():
+            types_map['.' + ext.lstrip('.')] = media_type
+        return cls(types_map, db.suffix_map, db.encodings_map, sources)
+
+    @classmethod
+    def get(cls, files=(), overrides=None, cache_fspath=None, system_files=True):
+        """Return an up-to-date index, reusing a previously compiled one if possible.
+
+        Indexes are memoized in memory by source files and overrides, so
+        creating multiple request processors in the same process doesn't parse
+        the same files repeatedly. On a miss, the index is loaded from the
+        ``cache_fspath`` file if one is given (see :meth:`load`), otherwise
+        it's built from scratch (see :meth:`build`).
+        """
+        if system_files:
+            files = list(mimetypes.knownfiles) + list(files)
+        overrides = {'.' + k.lstrip('.'): v for k, v in (overrides or {}).items()}
+        sources = _stat_sources(files)
+        # Files that don't exist don't contribute to the index
+        key = (
+            tuple(tuple(source) for source in sources),
+            tuple(sorted(overrides.items())), cache_fspath, _registry_digest(),
+        )
+        index = _memo.get(key)
+        if index is None:
+            if cache_fspath:
+                index = cls.load(cache_fspath, files, overrides, system_files=False)
+            else:
+                index = cls.build(files, overrides, system_files=False)
+            if len(_memo) >= MAX_MEMOIZED:
+                _memo.pop(next(iter(_memo)), None)
+            _memo[key] = index
+        return index
+
+    @classmethod
+    def load(cls, cache_fspath, files=(), overrides=None, system_files=True):
+        """Load an index from a cache file, rebuilding it if it's stale.
+
+        The cache is stale if any of the source files have been modified,
+        added or removed, or if the ``overrides`` or the :mod:`mimetypes`
+        module's global registry have changed. When that's
+        the case, the index is rebuilt by calling :meth:`build` and the cache
+        file is rewritten.
+        """
+        if system_files:
+            files = list(mimetypes.knownfiles) + list(files)
+        overrides = {'.' + k.lstrip('.'): v for k, v in (overrides or {}).items()}
+        try:
+            with open(cache_fspath) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+        if cached and cached.get('version') == CACHE_FORMAT_VERSION:
+            fresh = (
+                cached['files'] == list(files) and
+                cached['sources'] == _stat_sources(files) and
+                cached['overrides'] == overrides and
+                cached['registry'] == _registry_digest()
+            )
+            if fresh:
+                return cls(
+                    cached['types'], cached['suffixes'], cached['encodings'],
+                    cached['sources'],
+                )
+        index = cls.build(files, overrides, system_files=False)
+        index.dump(cache_fspath, files, overrides)
+        return index
+
+    def dump(self, cache_fspath, files, overrides):
+        """Write the index to a cache file.
+        """
+        data = {
+            'version': CACHE_FORMAT_VERSION,
+            'files': list(files),
+            'sources': [list(source) for source in self.sources],
+            'overrides': overrides,
+            'registry': _registry_digest(),
+            'types': dict(self.types_map),
+            'suffixes': dict(self.suffix_map),
+            'encodings': dict(self.encodings_map),
+        }
+        # Write to a temporary file first, so that the cache is replaced atomically
+        tmp_fspath = '%s.%i.tmp' % (cache_fspath, os.getpid())
+        with open(tmp_fspath, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_fspath, cache_fspath)
+
+    def guess_type(self, filename):
+        """Guess the media type of a file from its name.
+
+        Returns :obj:`None` if the extension is unknown. Like
+        :func:`mimetypes.guess_type`, the extensions of content codings are
+        skipped, and extensions are looked up case-sensitively first.
+
+        >>> index = MediaTypeIndex({'.css': 'text/css', '.tar': 'application/x-tar'})
+        >>> index.guess_type('style.CSS')
+        'text/css'
+        >>> index.guess_type('style.css.gz')
+        'text/css'
+        >>> index.guess_type('archive.tgz')
+        'application/x-tar'
+        >>> index.guess_type('README') is None
+        True
+        """
+        base, ext = splitext(filename)
+        while ext in self.suffix_map:
+            base, ext = splitext(base + self.suffix_map[ext])
+        if ext in self.encodings_map:
+            base, ext = splitext(base)
+        return self.types_map.get(ext) or self.types_map.get(ext.lower())
+
+    def type_of_extension(self, extension):
+        """Return the media type of an extension (without the dot), or :obj:`None`.
+        """
+        return self.guess_type('a.' + extension)
+
+    def guess_extensions(self, media_type):
+        """Return a tuple of the extensions (including the dot) of a media type.
+        """
+        return self.extensions_map.get(media_type, ())
@@ -0,0 +1,146 @@
+"""
+This module implements the optional instrumentation of the construction of
+:class:`~aspen.request_processor.RequestProcessor` objects, which is enabled by
+the :attr:`~aspen.request_processor.DefaultConfiguration.profile_startup`
+configuration option.
+"""
+import sys
+from time import perf_counter
+import tracemalloc
+
+from ..utils import auto_repr
+
+
+@auto_repr
+class StartupPhase:
+    """The measurements of one phase of the startup.
+    """
+
+    __slots__ = ('name', 'wall_time', 'allocated', 'imports')
+
+    def __init__(self, name, wall_time, allocated, imports):
+        self.name = name
+        "The name of the phase, e.g. ``'dispatcher'``."
+        self.wall_time = wall_time
+        "The duration of the phase, in seconds."
+        self.allocated = allocated
+        """
+        The net amount of memory allocated during the phase, in bytes, as traced
+        by :mod:`tracemalloc`.
+        """
+        self.imports = imports
+        "The sorted list of the modules that were imported during the phase."
+
+    def as_dict(self):
+        return {
+            'name': self.name, 'wall_time': self.wall_time,
+            'allocated': self.allocated, 'imports': list(self.imports),
+        }
+
+
+@auto_repr
+class StartupReport:
+    """The list of phases of a :class:`~aspen.request_processor.RequestProcessor`
+    construction, in chronological order.
+    """
+
+    __slots__ = ('phases',)
+
+    def __init__(self, phases=None):
+        self.phases = phases or []
+
+    def __getitem__(self, name):
+        for phase in self.phases:
+            if phase.name == name:
+                return phase
+        raise KeyError(name)
+
+    @property
+    def wall_time(self):
+        "The total duration of the startup, in seconds."
+        return sum(phase.wall_time for phase in self.phases)
+
+    @property
+    def allocated(self):
+        "The net amount of memory allocated during the startup, in bytes."
+        return sum(phase.allocated for phase in self.phases)
+
+    def as_dict(self):
+        """Return the report as a :class:`dict` of JSON-compatible values.
+        """
+        return {
+            'wall_time': self.wall_time,
+            'allocated': self.allocated,
+            'phases': [phase.as_dict() for phase in self.phases],
+        }
+
+    def format(self):
+        """Return the report as a human-readable table.
+        """
+        rows = [
+            (phase.name, phase.wall_time, phase.allocated, len(phase.imports))
+            for phase in self.phases
+        ]
+        rows.append(('total', self.wall_time, self.allocated, sum(row[3] for row in rows)))
+        lines = ['%-16s %10s %12s %8s' % ('phase', 'time (ms)', 'alloc (KiB)', 'imports')]
+        for name, wall_time, allocated, n_imports in rows:
+            lines.append('%-16s %10.2f %12.1f %8i' % (
+                name, wall_time * 1000, allocated / 1024, n_imports
+            ))
+        return '\n'.join(lines)
+
+
+class StartupProfiler:
+    """Measure the phases of a startup.
+
+    Calling :meth:`phase` ends the current phase (if any) and starts a new one.
+    Calling :meth:`stop` ends the last phase and returns the report.
+
+    If :mod:`tracemalloc` isn't already tracing, it's started by the profiler
+    and stopped at the end.
+
+    Args:
+        enabled (bool): if false, the profiler doesn't measure anything
+    """
+
+    __slots__ = ('enabled', 'report', '_current', '_started_tracing')
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.report = StartupReport() if enabled else None
+        self._current = None
+        self._started_tracing = False
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def phase(self, name):
+        """Start a new phase.
+        """
+        if not self.enabled:
+            return
+        self._end_phase()
+        self._current = (
+            name, set(sys.modules), tracemalloc.get_traced_memory()[0], perf_counter(),
+        )
+
+    def _end_phase(self):
+        if self._current is None:
+            return
+        end = perf_counter()
+        name, modules, memory, start = self._current
+        allocated = tracemalloc.get_traced_memory()[0] - memory
+        imports = sorted(set(sys.modules) - modules)
+        self.report.phases.append(StartupPhase(name, end - start, allocated, imports))
+        self._current = None
+
+    def stop(self):
+        """End the current phase and return the report (:obj:`None` if disabled).
+        """
+        if not self.enabled:
+            return None
+        self._end_phase()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return self.report
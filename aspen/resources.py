@@ -1,5 +1,5 @@
 import os
-import stat
+import tokenize
 
 
 class Entry:
@@ -10,7 +10,7 @@ class Entry:
     def __init__(self, fspath, mtime, resource):
         #: The filesystem path [string]
         self.fspath = fspath
-        #: The timestamp of the last change [int]
+        #: The timestamp of the last change, in nanoseconds [int]
         self.mtime = mtime
         #: The loaded resource [Static or Dynamic]
         self.resource = resource
@@ -20,11 +20,20 @@ class Resources:
     """This class implements loading resources, and caching them.
     """
 
-    __slots__ = ('request_processor', 'cache')
+    __slots__ = ('request_processor', 'cache', 'real_paths', 'sources')
+
+    max_sources = 16
+    "The maximum number of file contents cached by :meth:`read_source`."
 
     def __init__(self, request_processor):
         self.request_processor = request_processor
         self.cache = {}
+        #: The verified real paths of resources [dict]
+        #: (see :func:`~aspen.http.resource.check_resource_path`)
+        self.real_paths = {}
+        #: The contents of recently read source files, with their modification
+        #: times [dict] (see :meth:`read_source`)
+        self.sources = {}
 
     def get(self, fspath):
         """Return a resource object, with caching.
@@ -35,15 +44,99 @@ class Resources:
 
         # Process the resource.
         if not entry or self.request_processor.changes_reload:
-            mtime = os.stat(fspath)[stat.ST_MTIME]
+            mtime = self.get_mtime(fspath)
             if getattr(entry, 'mtime', None) != mtime:  # cache miss
+                if entry:
+                    # The file has changed, so the symlinks need to be checked again
+                    self.real_paths.pop(fspath, None)
                 resource = self.load(fspath)
                 entry = self.cache[fspath] = Entry(fspath, mtime, resource)
 
         return entry.resource
 
+    def read_source(self, fspath):
+        """Return the decoded content of a source file (e.g. a simplate).
+
+        The file is opened like resources are, i.e. after checking its real
+        path (see :func:`~aspen.http.resource.check_resource_path`), and its
+        encoding is detected in the same way as Python's. The content is cached
+        until the file's modification time changes, for at most
+        :attr:`max_sources` files.
+
+        :raises OSError: if the file can't be accessed
+        """
+        from .http.resource import check_resource_path
+        mtime = self.get_mtime(fspath)
+        cached = self.sources.get(fspath)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        if cached is not None:
+            # The file has changed, so the symlinks need to be checked again
+            self.real_paths.pop(fspath, None)
+        with tokenize.open(check_resource_path(self.request_processor, fspath)) as f:
+            source = f.read()
+        if cached is None and len(self.sources) >= self.max_sources:
+            del self.sources[next(iter(self.sources))]
+        self.sources[fspath] = (mtime, source)
+        return source
+
+    def get_mtime(self, fspath):
+        """Return the modification time of a file, in nanoseconds.
+
+        The metadata collected by the dispatcher is used if possible, unless
+        ``changes_reload`` is on, in which case the file is always checked (and
+        the dispatcher's metadata is refreshed).
+
+        :raises OSError: if the file can't be accessed
+        """
+        changes_reload = self.request_processor.changes_reload
+        node = self.request_processor.get_file_node(fspath)
+        if node is None or changes_reload:
+            st = os.stat(fspath)
+            if node is not None:
+                node.update(st)
+            return st.st_mtime_ns
+        return node.mtime_ns
+
     def load(self, fspath):
         """Create and return a resource object, without caching.
         """
         Class = self.request_processor.get_resource_class(fspath)
         return Class(self.request_processor, fspath)
+
+
+class Dependencies:
+    """The modification times of a set of files, used to find out whether any
+    of them has changed, for example since a template was compiled.
+
+    Args:
+        resources (Resources): the source of the modification times
+        fspaths: the paths of the files, or :obj:`None` if they're unknown, in
+            which case the dependencies are always considered changed
+
+    A file that doesn't exist has no modification time, so creating it counts
+    as a change. Directories can be tracked too, but their modification time
+    only changes when entries are added, removed or renamed.
+    """
+
+    __slots__ = ('resources', 'mtimes')
+
+    def __init__(self, resources, fspaths):
+        self.resources = resources
+        self.mtimes = None
+        if fspaths is not None:
+            self.mtimes = {fspath: self._get_mtime(fspath) for fspath in fspaths}
+
+    def _get_mtime(self, fspath):
+        try:
+            return self.resources.get_mtime(fspath)
+        except OSError:
+            return None
+
+    def changed(self):
+        """Return :obj:`True` if any of the files has been modified, created or
+        deleted since this object was created.
+        """
+        if self.mtimes is None:
+            return True
+        return any(self._get_mtime(fspath) != mtime for fspath, mtime in self.mtimes.items())
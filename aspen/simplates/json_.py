@@ -1,5 +1,11 @@
 import datetime
 
+try:
+    import dataclasses
+except ImportError:
+    # Python < 3.7
+    dataclasses = None
+
 # Find a json module.
 # ===================
 # The standard library includes simplejson as json since 2.6, but without the
@@ -22,15 +28,21 @@ except ImportError:
 
 encoders = {}
 
+# The encoders resolved by `find_encoder`, by class. This cache is cleared when
+# the registry is modified.
+_resolved_encoders = {}
+
 
 def register_encoder(cls, encode):
     """Register the encode function for cls.
 
     An encoder should take an instance of cls and return something basically
-    serializable (strings, lists, dictionaries).
+    serializable (strings, lists, dictionaries). It's also used for instances
+    of subclasses of cls, unless they have their own encoder.
 
     """
     encoders[cls] = encode
+    _resolved_encoders.clear()
 
 
 def unregister_encoder(cls):
@@ -38,6 +50,68 @@ def unregister_encoder(cls):
     """
     if cls in encoders:
         del encoders[cls]
+        _resolved_encoders.clear()
+
+
+def _slot_names(cls):
+    """Return the public slots of a class, or None if its instances have a `__dict__`.
+    """
+    names = []
+    for c in reversed(cls.__mro__[:-1]):
+        slots = c.__dict__.get('__slots__')
+        if slots is None:
+            return None
+        if isinstance(slots, str):
+            slots = (slots,)
+        if '__dict__' in slots:
+            return None
+        names.extend(name for name in slots if name[0] != '_')
+    return tuple(names)
+
+
+def _make_attributes_encoder(names):
+    def encode(obj):
+        d = {}
+        for name in names:
+            try:
+                d[name] = getattr(obj, name)
+            except AttributeError:
+                # unset slot
+                pass
+        return d
+    return encode
+
+
+def find_encoder(cls):
+    """Return the encode function for instances of cls, or None.
+
+    The registered encoders are looked up along the class's MRO, so an encoder
+    registered for a base class applies to its subclasses. If none is found,
+    dataclasses and classes whose instances only have ``__slots__`` (no
+    ``__dict__``) are encoded as objects of their fields or public slots.
+
+    The result is memoized per class.
+
+    """
+    try:
+        return _resolved_encoders[cls]
+    except KeyError:
+        pass
+    encode = None
+    for base in cls.__mro__:
+        encode = encoders.get(base)
+        if encode is not None:
+            break
+    else:
+        if dataclasses is not None and dataclasses.is_dataclass(cls):
+            names = tuple(f.name for f in dataclasses.fields(cls))
+            encode = _make_attributes_encoder(names)
+        else:
+            names = _slot_names(cls)
+            if names:
+                encode = _make_attributes_encoder(names)
+    _resolved_encoders[cls] = encode
+    return encode
 
 
 # http://docs.python.org/library/json.html
@@ -53,8 +127,9 @@ class FriendlyEncoder(_json.JSONEncoder):
     """Add support for additional types to the default JSON encoder.
     """
     def default(self, obj):
-        cls = obj.__class__
-        encode = encoders.get(cls, super(FriendlyEncoder, self).default)
+        encode = find_encoder(obj.__class__)
+        if encode is None:
+            return super(FriendlyEncoder, self).default(obj)
         return encode(obj)
 
 
@@ -89,3 +164,135 @@ def dumps(*a, **kw):
     if 'indent' not in kw:
         kw['indent'] = 4
     return _json.dumps(*a, **kw)
+
+
+# Compact output.
+# ===============
+# The standard library only uses its C accelerator when `indent` is None, so the
+# beautified output of `dumps` is produced by the slow pure-Python encoder. The
+# compact mode below stays on the fast path, and uses orjson or ujson instead
+# if one of them is installed. Objects of unknown types are still passed to the
+# registered encoders.
+
+COMPACT_SEPARATORS = (',', ':')
+
+
+def _default(obj):
+    encode = find_encoder(obj.__class__)
+    if encode is None:
+        raise TypeError("Object of type %s is not JSON serializable" % obj.__class__.__name__)
+    return encode(obj)
+
+
+def _make_stdlib_dumps():
+    def dumps_compact(obj):
+        return _json.dumps(obj, cls=FriendlyEncoder, separators=COMPACT_SEPARATORS)
+    return dumps_compact
+
+
+def _make_orjson_dumps():
+    import orjson
+    # Datetimes are passed to the registered encoders, like with the stdlib
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps_compact(obj):
+        return orjson.dumps(obj, default=_default, option=option).decode('utf8')
+    return dumps_compact
+
+
+def _make_ujson_dumps():
+    import ujson
+    # Versions of ujson older than 5.0 don't support `default`
+    ujson.dumps(None, default=_default)
+
+    def dumps_compact(obj):
+        return ujson.dumps(obj, default=_default, escape_forward_slashes=False)
+    return dumps_compact
+
+
+COMPACT_BACKENDS = {
+    'orjson': _make_orjson_dumps,
+    'ujson': _make_ujson_dumps,
+    'json': _make_stdlib_dumps,
+}
+"The available compact encoders, in order of preference."
+
+compact_backend = None
+"The name of the encoder used by :func:`dumps_compact`, chosen on first use."
+
+_dumps_compact = None
+
+
+def select_compact_backend(name=None):
+    """Select the encoder used by :func:`dumps_compact`.
+
+    If :obj:`name` is :obj:`None`, the first backend of :data:`COMPACT_BACKENDS`
+    which can be imported is selected.
+
+    :raises ValueError: if the requested backend is unknown
+    :raises ImportError: if the requested backend isn't installed
+    """
+    global compact_backend, _dumps_compact
+    if name is not None and name not in COMPACT_BACKENDS:
+        raise ValueError("unknown JSON backend %r" % name)
+    for backend in ([name] if name else list(COMPACT_BACKENDS)):
+        try:
+            dumps_compact = COMPACT_BACKENDS[backend]()
+        except (ImportError, TypeError):
+            if name:
+                raise ImportError("the %r JSON backend isn't available" % name)
+            continue
+        compact_backend, _dumps_compact = backend, dumps_compact
+        return backend
+
+
+def dumps_compact(obj):
+    """Serialize :obj:`obj` to a compact JSON :class:`str`, as fast as possible.
+
+    The keys of objects aren't sorted and there is no whitespace. The output
+    isn't necessarily ASCII-only.
+
+    If a third-party encoder fails (e.g. on an integer that doesn't fit in 64
+    bits), the standard library is tried before giving up.
+    """
+    if _dumps_compact is None:
+        select_compact_backend()
+    try:
+        return _dumps_compact(obj)
+    except (TypeError, ValueError, OverflowError):
+        if compact_backend == 'json':
+            raise
+        return _json.dumps(obj, cls=FriendlyEncoder, separators=COMPACT_SEPARATORS)
+
+
+# Streaming output.
+# =================
+
+def iterdumps(obj, compact=False, chunk_size=64 * 1024):
+    """Serialize :obj:`obj` to JSON lazily, as an iterator of :class:`str` chunks.
+
+    The pieces produced by the encoder's ``iterencode`` method are buffered
+    into chunks of at least :obj:`chunk_size` characters (except the last one).
+    The output is the same as :func:`dumps` (or :func:`dumps_compact` with the
+    standard library backend if :obj:`compact` is true), but it's produced by
+    the pure-Python encoder, so it's slower.
+
+    Note that a :class:`TypeError` can be raised in the middle of the stream,
+    if :obj:`obj` contains an object that can't be serialized.
+
+    >>> list(iterdumps({'a': [1, 2]}, compact=True, chunk_size=4))
+    ['{"a"', ':[1,2', ']}']
+    """
+    if compact:
+        encoder = FriendlyEncoder(separators=COMPACT_SEPARATORS)
+    else:
+        encoder = FriendlyEncoder(sort_keys=True, indent=4)
+    buffer, size = [], 0
+    for piece in encoder.iterencode(obj):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
@@ -1,51 +1,181 @@
+from importlib import import_module
 import sys
-import pkg_resources
+
+from ...resources import Dependencies
+from ..pagination import parse_specline, split_and_escape
 
 
 # Built-in renderers
 BUILTIN_RENDERERS = [
     'stdlib_format', 'stdlib_percent', 'stdlib_template', 'json_dump', 'jsonp_dump',
+    'aspen_template',
 ]
 
-RENDERERS = BUILTIN_RENDERERS[:]
+ENTRY_POINTS_GROUP = 'aspen.renderers'
+
+_plugins = None
+
+
+def iter_entry_points(group):
+    """Return the entry points of the installed distributions for the given group.
+
+    This uses :mod:`importlib.metadata` (or its ``importlib_metadata`` backport
+    on older Pythons), and falls back to ``pkg_resources`` only if neither is
+    available, because importing the latter is slow.
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            import pkg_resources
+            return list(pkg_resources.iter_entry_points(group=group))
+    try:
+        return list(entry_points(group=group))
+    except TypeError:
+        # Python < 3.10
+        return list(entry_points().get(group, ()))
+
+
+def plugins():
+    """Return a dict of the renderers provided by other packages.
+
+    The installed distributions are only scanned the first time this function
+    is called.
+    """
+    global _plugins
+    if _plugins is None:
+        _plugins = {ep.name: ep for ep in iter_entry_points(ENTRY_POINTS_GROUP)}
+    return _plugins
+
+
+def renderer_names():
+    """Return a sorted list of the names of all the available renderers.
+    """
+    return sorted(set(BUILTIN_RENDERERS).union(plugins()))
+
+
+def __getattr__(name):
+    # `RENDERERS` used to be computed at import time, now it's computed lazily
+    if name == 'RENDERERS':
+        return renderer_names()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+class RendererFactories(dict):
+    """A dict of renderer names to factories, which creates factories lazily.
 
-for entrypoint in pkg_resources.iter_entry_points(group='aspen.renderers'):
-    RENDERERS.append(entrypoint.name)
+    The first time a renderer is looked up, its module is imported and its
+    ``Factory`` is instantiated. If the import fails, the :class:`ImportError`
+    is stored in place of the factory. A plugin that has the name of a
+    built-in renderer overrides it.
+    """
 
-RENDERERS.sort()
+    def __init__(self, configuration):
+        super(RendererFactories, self).__init__()
+        self.configuration = configuration
+
+    def __missing__(self, name):
+        if name in plugins():
+            make_renderer = plugins()[name].load().Factory(self.configuration)
+        elif name in BUILTIN_RENDERERS:
+            try:
+                module = import_module('aspen.simplates.renderers.%s' % name)
+                make_renderer = module.Factory(self.configuration)
+            except ImportError as err:
+                make_renderer = err
+                err.info = sys.exc_info()
+        else:
+            raise KeyError(name)
+        self[name] = make_renderer
+        return make_renderer
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def load_all(self):
+        """Create the factories of all the available renderers, and return ``self``.
+        """
+        for name in renderer_names():
+            self.get(name)
+        return self
 
 
 def factories(configuration):
     """return a dict of render factory names to the factories themselves"""
-    renderer_factories = {}
-    # import the built-in renderers
-    for name in BUILTIN_RENDERERS:
-        # Pre-populate renderers so we can report on ImportErrors early
-        try:
-            capture = {}
-            python_syntax = 'from aspen.simplates.renderers.%s import Factory'
-            exec(python_syntax % name, capture)
-            make_renderer = capture['Factory'](configuration)
-        except ImportError as err:
-            make_renderer = err
-            err.info = sys.exc_info()
-        renderer_factories[name] = make_renderer
-
-    # import renderers provided by other packages
-    for entrypoint in pkg_resources.iter_entry_points(group='aspen.renderers'):
-        render_module = entrypoint.load()
-        renderer_factories[entrypoint.name] = render_module.Factory(configuration)
-    return renderer_factories
+    return RendererFactories(configuration)
 
 
 # abstract bases
 # ==============
 # The base is actually functional. It's a pass-through.
 
+def read_page(resources, fspath, offset, media_type):
+    """Return the content of a simplate's content page, read from its file
+    through :meth:`~aspen.resources.Resources.read_source`.
+
+    The page is found by its line number, or by its media type if it has
+    moved since the simplate was loaded.
+
+    :raises LookupError: if the page has been removed from the file
+    """
+    pages = list(split_and_escape(resources.read_source(fspath)))
+    for page in pages:
+        if page.offset == offset:
+            return page.content
+    for page in pages:
+        if parse_specline(page.header)[0] == media_type:
+            return page.content
+    raise LookupError("the %s page of %s has been removed" % (media_type, fspath))
+
+
+class PageSource:
+    """A descriptor that reads the content page of a renderer from its simplate
+    file, for renderers that don't keep it in memory (see
+    :attr:`Renderer.keep_source`).
+
+    The file is read with :func:`read_page`, so if it has changed since the
+    renderer was created, the current content of the page is returned.
+    """
+
+    def __get__(self, renderer, owner=None):
+        if renderer is None:
+            return self
+        return read_page(
+            renderer._factory._configuration.resources, renderer._filepath,
+            renderer.offset, renderer.media_type,
+        )
+
+
 class Renderer:
     """The base class of renderers.
+
+    By default the content page is prefixed with as many newlines as there are
+    lines above it in the simplate before being passed to :meth:`compile`, so
+    that the line numbers of errors match the simplate file, and the padding is
+    stripped from the output. A renderer that maps line numbers in another way
+    can set :attr:`padding` to :obj:`False`, then :meth:`compile` receives the
+    content as is and the output isn't touched.
+
+    A renderer that doesn't need the source of its page after compiling it can
+    set :attr:`keep_source` to :obj:`False`, so that the source isn't kept in
+    memory. The :attr:`raw` attribute then reads the page from the simplate
+    file when it's accessed.
+
+    When ``changes_reload`` is on, the page is compiled again before rendering
+    if the factory's :attr:`~Factory.meta` has been recompiled, or if one of the
+    files returned by :meth:`get_dependencies` has changed.
     """
 
+    padding = True
+    keep_source = True
+
+    raw = PageSource()
+
     def __init__(self, factory, filepath, raw, media_type, offset):
         """Takes a Factory, three bytestrings, and an int.
         """
@@ -53,18 +183,41 @@ class Renderer:
         self._factory = factory
         self._changes_reload = factory._changes_reload
         self.meta = self._factory.meta
-        self.raw = raw
+        if self.keep_source:
+            self.raw = raw
         self.media_type = media_type
         self.offset = offset
-        self.padded = ('\n' * offset) + self.raw
-        self.compiled = self.compile(self._filepath, self.padded)
+        self._meta_version = factory._meta_version
+        self.compiled = self.compile(self._filepath, self._pad(raw))
+        self._dependencies = self._track_dependencies()
+
+    @property
+    def padded(self):
+        """The content passed to :meth:`compile`."""
+        return self._pad(self.raw)
+
+    def _pad(self, raw):
+        return ('\n' * self.offset) + raw if self.padding else raw
+
+    def _track_dependencies(self):
+        if not self._changes_reload:
+            return None
+        resources = self._factory._configuration.resources
+        return Dependencies(resources, self.get_dependencies())
 
     def __call__(self, context):
         if self._changes_reload:
             self.meta = self._factory._update_meta()
-            self.compiled = self.compile(self._filepath, self.padded)
+            stale = self._meta_version != self._factory._meta_version
+            if stale or self._dependencies.changed():
+                self._meta_version = self._factory._meta_version
+                self.compiled = self.compile(self._filepath, self.padded)
+                self._dependencies = self._track_dependencies()
         r = self.render_content(context)
-        if r[:self.offset] == self.padded[:self.offset]:
+        if not self.padding or not isinstance(r, str):
+            # e.g. an iterator of chunks
+            return r
+        if r.startswith('\n' * self.offset):
             # The padding is still there, strip it
             return r[self.offset:]
         return r
@@ -74,15 +227,43 @@ class Renderer:
 
         Whatever you return from this will be set on self.compiled the first
         time the renderer is called. If changes_reload is True then this will
-        be called every time the renderer is called. You can then use
-        self.compiled in your render_content method as needed.
+        be called again when the dependencies of the page change (see
+        get_dependencies). You can then use self.compiled in your
+        render_content method as needed.
 
         """
         return padded
 
+    def get_dependencies(self):
+        """Override.
+
+        Return the paths of the files that the compiled page depends on, other
+        than the simplate itself (e.g. included templates), or None if they're
+        unknown, in which case the page is compiled again every time the
+        renderer is called when changes_reload is True. This is called after
+        self.compile, and only if changes_reload is True.
+
+        """
+        return None
+
+    def get_names(self):
+        """Override.
+
+        Return the names of the context variables that the compiled page uses,
+        or None if they're unknown. This allows pages that don't depend on the
+        request to be rendered only once (see the prerender_simplates
+        configuration option), so only return a set of names if the output of
+        render_content is entirely determined by their values.
+
+        """
+        return None
+
     def render_content(self, context):
         """Override. Context is a dict.
 
+        The return value is normally a string, but it can also be an iterator
+        of string chunks, to stream the output.
+
         You can use these attributes::
 
             self.raw        the raw bytes of the content page
@@ -91,11 +272,24 @@ class Renderer:
             self.meta       the result of Factory.compile_meta
             self.media_type the media type of the page
             self.offset     the line number at which the page starts
+            self.padded     the content passed to self.compile
 
         """
         return self.raw  # pass-through
 
 
+class SelfContainedRenderer(Renderer):
+    """The base class of renderers whose pages don't include other files.
+
+    The compiled page only depends on the simplate file, which is tracked by
+    :class:`~aspen.resources.Resources`, so :meth:`get_dependencies` returns
+    an empty list and the page is never recompiled.
+    """
+
+    def get_dependencies(self):
+        return ()
+
+
 class Factory:
     """The base class of renderer factories.
     """
@@ -105,7 +299,9 @@ class Factory:
     def __init__(self, configuration):
         self._configuration = configuration
         self._changes_reload = configuration.changes_reload
+        self._meta_version = 0
         self.meta = self.compile_meta(configuration)
+        self._meta_dependencies = self._track_dependencies()
 
     def __call__(self, filepath, raw, media_type, offset):
         """Given three bytestrings and an int, return a callable.
@@ -113,17 +309,44 @@ class Factory:
         self._update_meta()
         return self.Renderer(self, filepath, raw, media_type, offset)
 
+    def _track_dependencies(self):
+        if not self._changes_reload:
+            return None
+        resources = self._configuration.resources
+        return Dependencies(resources, self.get_dependencies())
+
     def _update_meta(self):
-        if self._changes_reload:
+        if self._changes_reload and self._meta_dependencies.changed():
             self.meta = self.compile_meta(self._configuration)
+            self._meta_version += 1
+            self._meta_dependencies = self._track_dependencies()
         return self.meta  # used in our child, Renderer
 
     def compile_meta(self, configuration):
         """Takes a configuration object. Override as needed.
 
         Whatever you return from this will be set on self.meta the first time
-        the factory is called, or every time if changes_reload is True. You can
-        then use self.meta in your Renderer class as needed.
+        the factory is called. If changes_reload is True then this will be
+        called again when the dependencies of the factory change (see
+        get_dependencies). You can then use self.meta in your Renderer class
+        as needed.
+
+        """
+        return None
+
+    def get_dependencies(self):
+        """Override.
+
+        Return the paths of the files that self.meta depends on (e.g. a
+        template directory or a configuration file), or None if they're
+        unknown, in which case self.meta is compiled again every time a
+        renderer is called when changes_reload is True. This is called after
+        self.compile_meta, and only if changes_reload is True.
+
+        The default is None if compile_meta is overridden, and no dependencies
+        otherwise.
 
         """
+        if type(self).compile_meta is Factory.compile_meta:
+            return ()
         return None
@@ -0,0 +1,414 @@
+"""A small template language, compiled to Python bytecode.
+
+Templates contain literal text, expressions, statements and comments::
+
+    <h1>{{ title | upper }}</h1>
+    {# one item per row #}
+    <ul>
+    {% for item in items %}
+        {% if item.visible %}
+        <li>{{ item.name }}</li>
+        {% endif %}
+    {% endfor %}
+    </ul>
+
+Expressions are Python expressions, optionally followed by filters: ``{{ x |
+f | g(arg) }}`` is ``g(f(x), arg)``. Filters are looked up in :obj:`FILTERS`
+first, then in the context like other names. The supported statements are
+``if``/``elif``/``else``/``endif``, ``for``/``endfor`` and ``set``. A statement
+or comment that's alone on its line doesn't leave an empty line in the output.
+
+The values of expressions are escaped for HTML when the media type of the page
+is HTML or XML, unless they are marked as safe with the ``safe`` filter.
+
+The page is compiled once into a function, so rendering it is a single call
+that appends the pieces of the output to a list.
+"""
+
+import ast
+import html
+import io
+import re
+import sys
+import tokenize
+from types import FunctionType
+from urllib.parse import quote_plus
+
+from . import Factory as BaseFactory, SelfContainedRenderer
+
+
+class Markup(str):
+    """A string that is safe to insert in HTML, so it isn't escaped.
+    """
+
+    __slots__ = ()
+
+    def __html__(self):
+        return self
+
+
+def escape(value):
+    """Return the value as a string escaped for HTML, unless it's already safe.
+
+    >>> escape('<a href="?x=1&y=2">'), escape(Markup('<br>')), escape(None)
+    ('&lt;a href=&quot;?x=1&amp;y=2&quot;&gt;', '<br>', 'None')
+    """
+    if type(value) is str:
+        return html.escape(value)
+    if hasattr(value, '__html__'):
+        return value.__html__()
+    return html.escape(str(value))
+
+
+def _default(value, default=''):
+    return default if value is None else value
+
+
+def _join(value, separator=''):
+    return separator.join(map(str, value))
+
+
+FILTERS = {
+    'capitalize': lambda value: str(value).capitalize(),
+    'default': _default,
+    'e': lambda value: Markup(escape(value)),
+    'escape': lambda value: Markup(escape(value)),
+    'join': _join,
+    'length': len,
+    'lower': lambda value: str(value).lower(),
+    'safe': lambda value: Markup(value),
+    'strip': lambda value: str(value).strip(),
+    'title': lambda value: str(value).title(),
+    'upper': lambda value: str(value).upper(),
+    'urlencode': lambda value: quote_plus(str(value)),
+}
+"The built-in filters, by name."
+
+
+def autoescapes(media_type):
+    """Return :obj:`True` if expressions should be escaped in pages of the
+    given media type.
+
+    >>> autoescapes('text/html'), autoescapes('image/svg+xml'), autoescapes('text/plain')
+    (True, True, False)
+    """
+    media_type = (media_type or '').split(';', 1)[0].strip().lower()
+    return (
+        media_type in ('text/html', 'application/xhtml+xml', 'application/xml', 'text/xml') or
+        media_type.endswith('+xml')
+    )
+
+
+TOKEN_RE = re.compile(r"""
+    # A statement or comment alone on its line, including the line's whitespace
+    ^[ \t]*(?:\{%(?P<line_stmt>(?:[^%]|%(?!\}))*)%\}|\{\#(?:[^#]|\#(?!\}))*\#\})[ \t]*(?:\n|\Z)
+  | \{\{(?P<expr>(?:[^}]|\}(?!\}))*)\}\}
+  | \{%(?P<stmt>(?:[^%]|%(?!\}))*)%\}
+  | \{\#(?:[^#]|\#(?!\}))*\#\}
+""", re.MULTILINE | re.VERBOSE)
+
+PROLOGUE = "if %r in __context: %s = __context[%r]\n"
+
+FUNCTION = """\
+def render(__escape, __filters, __context):
+    __out = []
+    __append = __out.append
+    return ''.join(__out)
+"""
+
+KEYWORD_RE = re.compile(r'\s*(\w*)')
+
+BLOCK_ENDS = {'if': 'endif', 'for': 'endfor'}
+
+OPERATOR_TOKENS = (tokenize.OP, tokenize.NAME)
+
+# Calls, attributes and items can return anything (e.g. a property can change
+# every time it's read), and the names used in nested scopes or assigned by `:=`
+# aren't tracked, so the output of templates that contain these nodes can't be
+# described by the names they load.
+OPAQUE_NODES = tuple(getattr(ast, name) for name in (
+    'Call', 'Attribute', 'Subscript', 'Lambda', 'ListComp', 'SetComp', 'DictComp',
+    'GeneratorExp', 'NamedExpr',
+) if hasattr(ast, name))
+
+
+class TemplateCompiler:
+    """Compiles a template into a Python code object.
+
+    The nodes of the function's body are built from the expressions of the
+    template, with their line numbers shifted by ``offset`` so that errors
+    point to the right line of the simplate file.
+    """
+
+    def __init__(self, filepath, offset):
+        self.filepath = filepath
+        self.offset = offset
+        self.opaque = False
+        "Whether the output can depend on more than the values of the names it loads."
+        self.loaded = set()
+        "The names whose values can be read from the context."
+        self.stored = set()
+        "The names that are assigned by ``for`` and ``set`` statements."
+        self.assigned = set()
+        # The names that are assigned before the current point of the template
+        # in every case, and the snapshots of that set when blocks were opened
+        self.scopes = []
+
+    def compile(self, template):
+        """Return the code object of the ``render`` function.
+        """
+        module = ast.parse(FUNCTION, self.filepath)
+        function = module.body[0]
+        body = function.body[:2]
+        # The stack of open blocks, as (keyword, node, body, lineno) tuples
+        stack = [(None, None, body, 1)]
+        pos, lineno = 0, 1
+        for m in TOKEN_RE.finditer(template):
+            if m.start() > pos:
+                self.write_text(stack[-1][2], template[pos:m.start()], lineno)
+            lineno += template.count('\n', pos, m.start())
+            stmt = m.group('line_stmt') or m.group('stmt')
+            if m.group('expr') is not None:
+                self.write_value(stack[-1][2], m.group('expr'), lineno)
+            elif stmt is not None:
+                leading = len(stmt) - len(stmt.lstrip())
+                self.compile_statement(stack, stmt, lineno + stmt.count('\n', 0, leading))
+            lineno += template.count('\n', m.start(), m.end())
+            pos = m.end()
+        if pos < len(template):
+            self.write_text(stack[-1][2], template[pos:], lineno)
+        if len(stack) > 1:
+            keyword, node, block, start = stack[-1]
+            self.error("unclosed '%s' block" % keyword, start)
+        # The assigned names are local variables of the function, so the ones
+        # that can be read before they're assigned are loaded from the context
+        prologue = ''.join(
+            PROLOGUE % (name, name, name) for name in sorted(self.loaded & self.stored)
+        )
+        function.body = body[:2] + ast.parse(prologue).body + body[2:] + function.body[-1:]
+        ast.fix_missing_locations(module)
+        namespace = {}
+        exec(compile(module, self.filepath, 'exec'), namespace)
+        return namespace['render'].__code__
+
+    def compile_statement(self, stack, stmt, lineno):
+        # The rest of the statement is kept as is, so that line numbers are right
+        m = KEYWORD_RE.match(stmt)
+        keyword, rest = m.group(1), stmt[m.end():]
+        block = stack[-1][2]
+        if keyword == 'if':
+            node = self.locate(ast.If(
+                test=self.parse_value(rest, lineno), body=[ast.Pass()], orelse=[]
+            ), lineno)
+            block.append(node)
+            stack.append(('if', node, node.body, lineno))
+            self.scopes.append(set(self.assigned))
+        elif keyword in ('elif', 'else'):
+            if stack[-1][0] != 'if' or stack[-1][1].orelse:
+                self.error("unexpected '%s'" % keyword, lineno)
+            __, node, __, start = stack.pop()
+            # The assignments of the previous branches don't happen in this one
+            self.assigned = set(self.scopes[-1])
+            if keyword == 'elif':
+                orelse = self.locate(ast.If(
+                    test=self.parse_value(rest, lineno), body=[ast.Pass()], orelse=[]
+                ), lineno)
+                node.orelse = [orelse]
+                stack.append(('if', orelse, orelse.body, start))
+            else:
+                if rest.strip():
+                    self.error("unexpected text after 'else'", lineno)
+                node.orelse = [ast.Pass()]
+                # An `else` can't be followed by another one, so it's a new block
+                stack.append(('if', ast.If(orelse=[ast.Pass()]), node.orelse, start))
+        elif keyword == 'for':
+            target, line, value = self.split_statement(rest, 'in', lineno)
+            # The iterable is evaluated before the loop, which may not run at all
+            value = self.parse_value(value, lineno + line)
+            self.scopes.append(set(self.assigned))
+            node = self.locate(ast.For(
+                target=self.parse_target(target, lineno),
+                iter=value, body=[ast.Pass()], orelse=[],
+            ), lineno)
+            block.append(node)
+            stack.append(('for', node, node.body, lineno))
+        elif keyword == 'set':
+            target, line, value = self.split_statement(rest, '=', lineno)
+            value = self.parse_value(value, lineno + line)
+            block.append(self.locate(ast.Assign(
+                targets=[self.parse_target(target, lineno)], value=value,
+            ), lineno))
+        elif keyword in ('endif', 'endfor'):
+            if BLOCK_ENDS.get(stack[-1][0]) != keyword or rest.strip():
+                self.error("unexpected '%s'" % stmt.strip(), lineno)
+            stack.pop()
+            self.assigned = self.scopes.pop()
+        else:
+            self.error("unknown statement %r" % stmt.strip(), lineno)
+
+    def split_statement(self, source, operator, lineno):
+        """Split the source of a statement on its first top-level ``operator``,
+        and return the part before it, the index of the line on which the part
+        after it starts, and that part.
+        """
+        offsets = find_operators(source, operator)
+        if not offsets:
+            self.error("expected '%s'" % operator, lineno)
+        start = offsets[0] + len(operator)
+        return source[:offsets[0]], source.count('\n', 0, start), source[start:]
+
+    def write_text(self, block, text, lineno):
+        node = ast.Expr(value=ast.Call(
+            func=ast.Name(id='__append', ctx=ast.Load()),
+            args=[self.constant(text, lineno)],
+            keywords=[],
+        ))
+        block.append(self.locate(node, lineno))
+
+    def write_value(self, block, source, lineno):
+        node = ast.Expr(value=ast.Call(
+            func=ast.Name(id='__append', ctx=ast.Load()),
+            args=[ast.Call(
+                func=ast.Name(id='__escape', ctx=ast.Load()),
+                args=[self.parse_value(source, lineno)],
+                keywords=[],
+            )],
+            keywords=[],
+        ))
+        block.append(self.locate(node, lineno))
+
+    def parse_value(self, source, lineno):
+        """Return the node of an expression followed by filters.
+        """
+        offsets = find_operators(source, '|')
+        starts = [0] + [offset + 1 for offset in offsets]
+        ends = offsets + [len(source)]
+        segments = [
+            (lineno + source.count('\n', 0, start), source[start:end])
+            for start, end in zip(starts, ends)
+        ]
+        value = self.parse_expression(*segments[0][::-1])
+        for line, segment in segments[1:]:
+            f = self.parse_expression(segment, line, track=False)
+            if isinstance(f, ast.Call) and isinstance(f.func, ast.Name):
+                name, args, keywords = f.func.id, f.args, f.keywords
+            elif isinstance(f, ast.Name):
+                name, args, keywords = f.id, [], []
+            else:
+                self.error("invalid filter %r" % segment.strip(), line)
+            for arg in args + [k.value for k in keywords]:
+                self.track(arg)
+            if name in FILTERS:
+                func = ast.Subscript(
+                    value=ast.Name(id='__filters', ctx=ast.Load()),
+                    slice=self.constant(name, line),
+                    ctx=ast.Load(),
+                )
+                if sys.version_info < (3, 9):
+                    func.slice = ast.Index(value=func.slice)
+            else:
+                # A function from the context, it could return anything
+                self.opaque = True
+                self.load(name)
+                func = ast.Name(id=name, ctx=ast.Load())
+            value = ast.Call(func=func, args=[value] + args, keywords=keywords)
+        return value
+
+    def parse_expression(self, source, lineno, track=True):
+        # Leading newlines are stripped, so they're added to the line number
+        stripped = source.lstrip()
+        lineno += source.count('\n', 0, len(source) - len(stripped))
+        try:
+            node = ast.parse(stripped.rstrip(), self.filepath, 'eval').body
+        except SyntaxError as e:
+            self.error(e.msg, lineno + (e.lineno or 1) - 1)
+        ast.increment_lineno(node, lineno - 1 + self.offset)
+        if track:
+            self.track(node)
+        return node
+
+    def parse_target(self, source, lineno):
+        node = self.parse_expression(source, lineno, track=False)
+        for child in ast.walk(node):
+            if isinstance(child, (ast.Name, ast.Tuple, ast.List)):
+                child.ctx = ast.Store()
+            elif not isinstance(child, ast.expr_context):
+                self.error("invalid target %r" % source.strip(), lineno)
+        self.track(node)
+        return node
+
+    def track(self, node):
+        """Record the names that are loaded and assigned by a node.
+        """
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name):
+                if isinstance(child.ctx, ast.Store):
+                    self.stored.add(child.id)
+                    self.assigned.add(child.id)
+                else:
+                    self.load(child.id)
+            elif isinstance(child, OPAQUE_NODES):
+                self.opaque = True
+
+    def load(self, name):
+        if name not in self.assigned:
+            self.loaded.add(name)
+
+    def constant(self, value, lineno):
+        node = ast.parse(repr(value), mode='eval').body
+        return ast.increment_lineno(node, lineno - 1 + self.offset)
+
+    def locate(self, node, lineno):
+        node.lineno = node.end_lineno = lineno + self.offset
+        node.col_offset = node.end_col_offset = 0
+        return node
+
+    def error(self, msg, lineno):
+        raise SyntaxError(msg, (self.filepath, lineno + self.offset, None, None))
+
+
+def find_operators(source, operator):
+    """Return the offsets of the given operator in an expression, where it
+    isn't nested in brackets.
+
+    >>> find_operators("a | f('|', x | y) | g", '|'), find_operators('a in b', 'in')
+    ([2, 18], [2])
+    """
+    line_starts = [0] + [m.end() for m in re.finditer('\n', source)]
+    offsets, depth = [], 0
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.string in ('(', '[', '{'):
+                depth += 1
+            elif token.string in (')', ']', '}'):
+                depth -= 1
+            elif token.string == operator and depth == 0 and token.type in OPERATOR_TOKENS:
+                row, col = token.start
+                offsets.append(line_starts[row - 1] + col)
+    except (tokenize.TokenError, IndentationError):
+        # The expression is invalid, let the parser report the error
+        pass
+    return offsets
+
+
+class Renderer(SelfContainedRenderer):
+
+    padding = False
+    keep_source = False
+
+    def compile(self, filepath, padded):
+        self.escape = escape if autoescapes(self.media_type) else str
+        compiler = TemplateCompiler(filepath, self.offset)
+        code = compiler.compile(padded)
+        self.names = None if compiler.opaque else compiler.loaded
+        return code
+
+    def get_names(self):
+        return self.names
+
+    def render_content(self, context):
+        return FunctionType(self.compiled, context)(self.escape, FILTERS, context)
+
+
+class Factory(BaseFactory):
+    Renderer = Renderer
@@ -1,14 +1,42 @@
-from . import Renderer as BaseRenderer, Factory as BaseFactory
+import ast
+
+from . import Factory as BaseFactory, SelfContainedRenderer
 from .. import json_
 
 
-class Renderer(BaseRenderer):
+class Renderer(SelfContainedRenderer):
+
+    padding = False
+    keep_source = False
+
+    def compile(self, filepath, padded):
+        # The content is a Python expression, compile it once instead of
+        # passing the source string to `eval` on every request. The line
+        # numbers are shifted so that tracebacks point into the simplate.
+        try:
+            tree = ast.parse(padded, filepath, 'eval')
+        except SyntaxError as e:
+            for attr in ('lineno', 'end_lineno'):
+                if getattr(e, attr, None) is not None:
+                    setattr(e, attr, getattr(e, attr) + self.offset)
+            raise
+        return compile(ast.increment_lineno(tree, self.offset), filepath, 'eval')
 
     def render_content(self, context):
         output = context['output']
+        request_processor = context['request_processor']
         if not output.media_type:
-            output.media_type = context['request_processor'].media_type_json
-        r = json_.dumps(eval(self.compiled, globals(), context))
+            output.media_type = request_processor.media_type_json
+        obj = eval(self.compiled, globals(), context)
+        compact = context.get('json_compact', request_processor.json_compact)
+        if context.get('json_stream', request_processor.json_stream):
+            return json_.iterdumps(
+                obj, compact=compact, chunk_size=request_processor.json_stream_chunk_size
+            )
+        if compact:
+            r = json_.dumps_compact(obj)
+        else:
+            r = json_.dumps(obj)
         if isinstance(r, bytes):
             r = r.decode('ascii')
         return r
@@ -39,8 +39,17 @@ class Renderer(JsonRenderer):
 
         # return the wrapped json
         # (preceding comment block prevent a Rosetta-Flash based attack)
+        if not isinstance(json, str):
+            # streamed json
+            return _wrap_chunks("/**/ " + callback + "(", json, ");")
         return "/**/ " + callback + "(" + json + ");"
 
 
+def _wrap_chunks(prefix, chunks, suffix):
+    yield prefix
+    yield from chunks
+    yield suffix
+
+
 class Factory(Factory):
     Renderer = Renderer
@@ -1,10 +1,117 @@
-from . import Renderer, Factory
+from string import Formatter
+from sys import intern
+from _string import formatter_field_name_split
 
+from ...output import Stream, chain_chunks
+from . import Factory, SelfContainedRenderer
 
-class Renderer(Renderer):
+
+CONVERSIONS = {None: None, 'r': repr, 's': str, 'a': ascii}
+
+
+class FormatTemplate:
+    """A format string that has been parsed in advance.
+
+    The template is split into literal chunks and replacement fields, so that
+    :meth:`format_map` only has to look up the fields in the context and join
+    the pieces, instead of parsing the whole string on every call.
+
+    >>> FormatTemplate.parse('{a}, {b.real:>4}{c[0]!r} {{}}').format_map({'a': 1, 'b': 2, 'c': 'x'})
+    "1,    2'x' {}"
+    """
+
+    __slots__ = ('parts', 'fields', 'names', 'specs')
+
+    def __init__(self, parts, fields):
+        self.parts = parts
+        "The literal chunks, with a :obj:`None` placeholder after each one but the last."
+        self.fields = fields
+        "The replacement fields, as ``(name, lookups, conversion, spec)`` tuples."
+        self.specs = [field[3] for field in fields]
+        "The format specs of the fields."
+        self.names = None
+        """
+        The names of the fields, if none of them has lookups or a conversion,
+        in which case the values can be fetched from the context in one go.
+        """
+        if not any(lookups or convert for name, lookups, convert, spec in fields):
+            self.names = [field[0] for field in fields]
+
+    @classmethod
+    def parse(cls, template):
+        """Return a :class:`FormatTemplate` for the given string, or the string
+        itself if it contains something that isn't supported by the fast path
+        (e.g. positional fields or nested fields in a format spec), or if it's
+        malformed (the error will be raised when the string is formatted).
+        """
+        parts, fields, literals, seen = [], [], [], {}
+        try:
+            for literal, field_name, spec, conversion in Formatter().parse(template):
+                literals.append(literal)
+                if field_name is None:
+                    continue
+                first, rest = formatter_field_name_split(field_name)
+                if not first or not isinstance(first, str):
+                    return template
+                if '{' in spec or conversion not in CONVERSIONS:
+                    return template
+                # Repeated fields share the same tuple, to save memory
+                field = (intern(first), tuple(rest), CONVERSIONS[conversion], spec)
+                fields.append(seen.setdefault(field, field))
+                parts += (''.join(literals), None)
+                literals = []
+        except ValueError:
+            return template
+        parts.append(''.join(literals))
+        return cls(parts, fields)
+
+    def format_map(self, context):
+        """Format the template with the values in ``context``.
+
+        If the value of a field without a conversion or a format spec is a
+        :class:`~aspen.output.Stream`, then the result is an iterator of
+        chunks, which streams the chunks of the value instead of formatting it.
+        """
+        if self.names is not None:
+            values = list(map(context.__getitem__, self.names))
+        else:
+            values = []
+            for name, lookups, convert, spec in self.fields:
+                value = context[name]
+                for is_attr, key in lookups:
+                    value = getattr(value, key) if is_attr else value[key]
+                if convert is not None:
+                    value = convert(value)
+                values.append(value)
+        out = self.parts[:]
+        if Stream in map(type, values):
+            out[1::2] = [
+                value if not spec and type(value) is Stream else format(value, spec)
+                for value, spec in zip(values, self.specs)
+            ]
+            if Stream in map(type, out):
+                return chain_chunks(out)
+            return ''.join(out)
+        out[1::2] = map(format, values, self.specs)
+        return ''.join(out)
+
+
+class Renderer(SelfContainedRenderer):
+
+    padding = False
+    keep_source = False
+
+    def compile(self, filepath, padded):
+        return FormatTemplate.parse(padded)
+
+    def get_names(self):
+        # Attributes and items can change even if the names don't
+        if isinstance(self.compiled, FormatTemplate) and self.compiled.names is not None:
+            return set(self.compiled.names)
+        return None
 
     def render_content(self, context):
-        return self.compiled.format(**context)
+        return self.compiled.format_map(context)
 
 
 class Factory(Factory):
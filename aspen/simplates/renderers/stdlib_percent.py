@@ -1,7 +1,42 @@
-from . import Renderer, Factory
+import re
 
+from . import Factory, SelfContainedRenderer
 
-class Renderer(Renderer):
+
+CONVERSION_SPEC_RE = re.compile(
+    r'%(?:\(([^()]*)\))?[-#0 +]*(?:\*|\d+)?(?:\.(?:\*|\d+))?[hlL]?(.?)', re.DOTALL
+)
+CONVERSION_TYPES = frozenset('diouxXeEfFgGcrsa')
+
+
+def get_mapping_keys(template):
+    """Return the set of keys used by the conversion specifiers of a template,
+    or :obj:`None` if the template contains a specifier without a mapping key
+    (which would format the entire mapping) or an invalid one.
+
+    >>> sorted(get_mapping_keys('%(a)s is %(b)05.1f%%'))
+    ['a', 'b']
+    >>> get_mapping_keys('%s') is None
+    True
+    """
+    keys = set()
+    for m in CONVERSION_SPEC_RE.finditer(template):
+        key, conversion = m.groups()
+        if conversion == '%' and m.end() - m.start() == 2:
+            continue
+        if key is None or conversion not in CONVERSION_TYPES or '*' in m.group(0):
+            return None
+        keys.add(key)
+    return keys
+
+
+class Renderer(SelfContainedRenderer):
+
+    padding = False
+    keep_source = False
+
+    def get_names(self):
+        return get_mapping_keys(self.compiled)
 
     def render_content(self, context):
         return self.compiled % context
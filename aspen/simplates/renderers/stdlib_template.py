@@ -1,11 +1,79 @@
-from . import Renderer as BaseRenderer, Factory as BaseFactory
+from . import Factory as BaseFactory, SelfContainedRenderer
+from ...output import Stream, chain_chunks
 from string import Template
+from sys import intern
 
 
-class Renderer(BaseRenderer):
+class CompiledTemplate:
+    """A :class:`string.Template` that has been split in advance into literal
+    chunks and placeholders.
+
+    >>> CompiledTemplate.parse('$a costs $$${b}.').substitute({'a': 'x', 'b': 1})
+    'x costs $1.'
+    """
+
+    __slots__ = ('parts', 'names')
+
+    def __init__(self, parts, names):
+        self.parts = parts
+        "The literal chunks, with a :obj:`None` placeholder after each one but the last."
+        self.names = names
+        "The names of the placeholders."
+
+    @classmethod
+    def parse(cls, template, offset=0):
+        """Return a :class:`CompiledTemplate` for the given string, or a plain
+        :class:`~string.Template` if the string contains an invalid placeholder
+        (so that the error is raised by :meth:`~string.Template.substitute`).
+
+        The ``offset`` is the number of lines above the template in its file,
+        it's added to the line number reported by the error.
+        """
+        parts, names, literals, pos = [], [], [], 0
+        for m in Template.pattern.finditer(template):
+            literals.append(template[pos:m.start()])
+            named = m.group('named') or m.group('braced')
+            if named is not None:
+                names.append(intern(named))
+                parts += (''.join(literals), None)
+                literals = []
+            elif m.group('escaped') is not None:
+                literals.append(Template.delimiter)
+            else:
+                return Template('\n' * offset + template)
+            pos = m.end()
+        literals.append(template[pos:])
+        parts.append(''.join(literals))
+        return cls(parts, names)
+
+    def substitute(self, mapping):
+        """Substitute the values in ``mapping`` for the placeholders.
+
+        If a value is a :class:`~aspen.output.Stream`, then the result is an
+        iterator of chunks, which streams the chunks of the value instead of
+        converting it to a string.
+        """
+        out = self.parts[:]
+        values = list(map(mapping.__getitem__, self.names))
+        if Stream in map(type, values):
+            out[1::2] = [v if type(v) is Stream else str(v) for v in values]
+            return chain_chunks(out)
+        out[1::2] = map(str, values)
+        return ''.join(out)
+
+
+class Renderer(SelfContainedRenderer):
+
+    padding = False
+    keep_source = False
 
     def compile(self, filepath, padded):
-        return Template(padded)
+        return CompiledTemplate.parse(padded, self.offset)
+
+    def get_names(self):
+        if isinstance(self.compiled, CompiledTemplate):
+            return set(self.compiled.names)
+        return None
 
     def render_content(self, context):
         return self.compiled.substitute(context)
@@ -1,15 +1,37 @@
+import ast
+import builtins
+import dis
+from hashlib import sha256
+from inspect import CO_COROUTINE
 import re
 import tokenize
+from types import CodeType, FunctionType
 from typing import Any, Callable, Dict
 
+from ..exceptions import NotModified
+from ..http.compression import gzip_compress, gzip_etag, is_compressible
 from ..http.resource import Dynamic, check_resource_path
-from ..output import Output
+from ..output import Output, is_stream
 from .pagination import split_and_escape, parse_specline, Page
+from .renderers import RendererFactories, read_page
 
 
 renderer_re = re.compile(r'[a-z0-9.-_]+$')
 media_type_re = re.compile(r'[A-Za-z0-9.+*-]+/[A-Za-z0-9.+*-]+$')
 
+# The wrapper of a simplate's second page (see `page_two_as_function`), the
+# page's statements are inserted before the `return`
+PAGE_TWO_FUNCTION = """\
+%sdef page_two(__context):
+%s    return locals()
+"""
+
+# The nodes whose bodies don't run in the scope of the page they're in
+NEW_SCOPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)
+
+# Allows the second page of a simplate to `await` (Python >= 3.8)
+PyCF_ALLOW_TOP_LEVEL_AWAIT = getattr(ast, 'PyCF_ALLOW_TOP_LEVEL_AWAIT', 0)
+
 
 class SimplateDefaults:
 
@@ -31,6 +53,120 @@ class SimplateDefaults:
         self.initial_context = initial_context
 
 
+class Renderers(dict):
+    """A dict of media types to the renderers of a simplate's content pages,
+    which creates the renderers lazily.
+
+    The content pages that haven't been compiled yet are stored in
+    :attr:`pages`. A page is compiled the first time its media type is looked
+    up, so ``in`` and iteration only see the renderers that have been created.
+    Except for the first one, the content of the uncompiled pages isn't kept
+    in memory, it's read from the simplate file when they're compiled (see
+    :func:`~aspen.simplates.renderers.read_page`).
+    """
+
+    __slots__ = ('fspath', 'resources', 'pages')
+
+    def __init__(self, fspath, resources):
+        super(Renderers, self).__init__()
+        self.fspath = fspath
+        self.resources = resources
+        self.pages = {}
+        """
+        The uncompiled content pages, as ``(make_renderer, page)`` pairs keyed by
+        media type.
+        """
+
+    def __missing__(self, media_type):
+        make_renderer, page = self.pages[media_type]
+        content = page.content
+        if content is None:
+            content = read_page(self.resources, self.fspath, page.offset, media_type)
+        renderer = make_renderer(self.fspath, content, media_type, page.offset)
+        self[media_type] = renderer
+        self.pages.pop(media_type, None)
+        return renderer
+
+
+class Context(dict):
+    """The variables of a request, layered over the variables of a simplate's
+    first page, so that the latter don't have to be copied for every request.
+
+    The values that aren't in the dict itself are looked up in :attr:`page_one`.
+    It's a :class:`dict` so that it can be the globals of the second page, and
+    ``in``, :meth:`get` and the methods that iterate see both layers (the
+    latter are slower, because they merge the layers).
+    """
+
+    __slots__ = ('page_one',)
+
+    page_one: dict
+    "The variables of the first page of the simplate."
+
+    def __missing__(self, key):
+        return self.page_one[key]
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.page_one
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        return self.page_one.get(key, default)
+
+    def _merge(self):
+        merged = dict(self.page_one)
+        merged.update(dict.items(self))
+        return merged
+
+    def __iter__(self):
+        return iter(self._merge())
+
+    def __len__(self):
+        return len(self._merge())
+
+    def __repr__(self):
+        return 'Context(%r)' % self._merge()
+
+    def copy(self):
+        return self._merge()
+
+    def keys(self):
+        return self._merge().keys()
+
+    def items(self):
+        return self._merge().items()
+
+    def values(self):
+        return self._merge().values()
+
+
+def get_names(code):
+    """Return the set of the global and attribute names used by a code object,
+    including the ones used by the functions and classes it defines.
+    """
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names.update(get_names(const))
+    return names
+
+
+GLOBAL_STORES = ('STORE_GLOBAL', 'DELETE_GLOBAL')
+
+
+def get_assigned_names(code, opnames=('STORE_NAME', 'DELETE_NAME') + GLOBAL_STORES):
+    """Return the set of the global names that a module's code object assigns
+    or deletes, including the ones declared ``global`` in the functions it
+    defines.
+    """
+    names = {i.argval for i in dis.get_instructions(code) if i.opname in opnames}
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names.update(get_assigned_names(const, GLOBAL_STORES))
+    return names
+
+
 class Simplate(Dynamic):
     """A simplate is a dynamic resource with multiple syntaxes in one file.
 
@@ -41,26 +177,39 @@ class Simplate(Dynamic):
 
     __slots__ = (
         'fspath', 'default_media_type', 'renderers', 'page_one', 'page_two',
+        'page_two_is_empty', 'page_two_is_async', 'page_two_function', 'page_two_builtins',
+        'page_two_globals', 'page_two_assigned', 'compressed_outputs', 'prerendered',
     )
 
     defaults: SimplateDefaults
 
+    max_compressed_outputs = 16
+    "The maximum number of compressed outputs cached per simplate."
+
     def __init__(self, request_processor, fspath):
         self.request_processor = request_processor
         self.fspath = fspath
         self.default_media_type = request_processor.guess_media_type(fspath.rsplit('.', 1)[0])
 
-        self.renderers = {}         # mapping of media type to Renderer objects
+        resources = request_processor.resources
+        self.renderers = Renderers(fspath, resources)  # mapping of media type to Renderer objects
+        self.compressed_outputs = {}  # mapping of (media type, etag) to outputs
+        self.prerendered = {}       # mapping of media type to prerendered outputs
         self.available_types = []   # ordered sequence of media types
         with tokenize.open(check_resource_path(request_processor, fspath)) as fh:
             pages = self.parse_into_pages(fh.read())
         self.compile_pages(pages)
         self.page_one, self.page_two = pages[0], pages[1]
-        for renderer, media_type in pages[2:]:
-            if media_type in self.renderers:
+        for make_renderer, media_type, page in pages[2:]:
+            if media_type in self.renderers.pages:
                 raise SyntaxError("Two content pages defined for %s." % media_type)
+            if self.available_types:
+                # only the default page is likely to be compiled soon, the
+                # others are read again from the file if they're ever needed
+                page.content = None
             self.available_types.append(media_type)
-            self.renderers[media_type] = renderer
+            self.renderers.pages[media_type] = (make_renderer, page)
+        self.precompute_negotiation()
 
     def render_for_type(self, media_type, context):
         """Render the simplate.
@@ -69,33 +218,277 @@ class Simplate(Dynamic):
             media_type (str): the media type of the page to render
             context (dict): execution context values you wish to supply
 
-        .. warning: The ``context`` dict is updated with values from the first
-                    and second pages of the simplate.
+        The pages of the simplate don't run in the ``context`` dict itself: its
+        values are layered over the variables of the first page in a
+        :class:`Context`, so that those aren't copied for every request. Once
+        the second page has run, the variables it assigned or deleted are
+        applied to the ``context`` dict, along with ``context['output']``, but
+        the variables of the first page aren't added to it.
+
+        The state of the request is read from the ``context`` dict itself, under
+        reserved keys that the pages of the simplate can't shadow.
+
+        The second page can set ``output.etag`` and/or ``output.last_modified``.
+        If it does, and the request's ``context['__conditions__']`` say that the
+        client's copy is still valid, then :class:`NotModified` is raised
+        instead of rendering the content page.
+
+        If the second page sets ``output.etag``, the ``compress_dynamic_output``
+        configuration option is enabled, and the client accepts gzip
+        (``context['__accept_gzip__']``), then the output is compressed and cached
+        by media type and etag, so that it doesn't have to be rendered again.
+
+        If ``context['__metadata_only__']`` is true, the content page is still
+        rendered, so that the response is the same as for a full request,
+        except when the ``skip_rendering_for_metadata_only`` configuration
+        option (or a variable of the same name in the simplate) is true. Then
+        the content page isn't rendered, unless the body is needed to compute
+        the output's validators (i.e. when the ``dynamic_etags`` configuration
+        option is enabled and the second page didn't set ``output.etag``). The
+        returned output's body is :obj:`None` in that case, unless the second
+        page filled it.
+
+        If the content page doesn't depend on the request (see the
+        ``prerender_simplates`` configuration option), the output is rendered
+        once and its encoded body is reused, without running the first two
+        pages again.
 
         Returns: an :class:`Output` object.
+
+        :raises TypeError:
+            if the second page is asynchronous (see :meth:`render_for_type_async`)
         """
 
+        prerendered = self.prerendered.get(media_type)
+        if prerendered:
+            return self._output_prerendered(media_type, prerendered, context)
+        if self.page_two_is_async:
+            raise TypeError(
+                "the second page of %s uses `await`, it can only be rendered by "
+                "`render_for_type_async`" % self.fspath
+            )
+
         # create Output object and put it in the context
+        request_context = context
         output = context['output'] = Output(media_type=media_type)
-        # update the context with values from the first page
-        context.update(self.page_one)
+        # layer the context over the values from the first page
+        context = self._layer_context(context)
         # use this as the context to execute the second page in
-        exec(self.page_two, context)
+        if self.page_two_function is None:
+            exec(self.page_two, context)
+        else:
+            context.update(self._run_page_two_function(context))
+        context = self._apply_page_two_changes(request_context, context)
+        return self._render_content_page(
+            media_type, output, context, request_context, prerendered
+        )
+
+    async def render_for_type_async(self, media_type, context):
+        """Render the simplate, awaiting its second page if it's asynchronous.
+
+        A second page is asynchronous if it uses ``await`` (or ``async for``,
+        ``async with``) outside of a function. Synchronous simplates are
+        rendered by :meth:`render_for_type`.
+
+        Returns: an :class:`Output` object.
+        """
+        if not self.page_two_is_async:
+            return self.render_for_type(media_type, context)
+
+        prerendered = self.prerendered.get(media_type)
+        if prerendered:
+            return self._output_prerendered(media_type, prerendered, context)
+
+        request_context = context
+        output = context['output'] = Output(media_type=media_type)
+        context = self._layer_context(context)
+        if self.page_two_function is None:
+            # the code object of the page is a coroutine, `eval` returns it
+            await eval(self.page_two, context)
+        else:
+            variables = await FunctionType(self.page_two_function, context)(context)
+            context.update(self._export_page_two_variables(variables, context))
+        context = self._apply_page_two_changes(request_context, context)
+        return self._render_content_page(
+            media_type, output, context, request_context, prerendered
+        )
+
+    def _render_content_page(self, media_type, output, context, request_context, prerendered):
+        """Render the content page of the simplate, once its second page has
+        run in ``context``. The state of the request is read from
+        ``request_context``, the dict passed to :meth:`render_for_type`.
+        """
+        compress = False
+        if output.etag is not None or output.last_modified is not None:
+            compress = (
+                output.etag is not None and
+                request_context.get('__accept_gzip__') and
+                self.request_processor.compress_dynamic_output and
+                is_compressible(media_type)
+            )
+            if compress:
+                etag = output.etag
+                output.etag = gzip_etag(etag)
+            # skip rendering if the client already has this version of the output
+            conditions = request_context.get('__conditions__')
+            if conditions and conditions.is_not_modified(output.etag, output.last_modified):
+                output.body = None
+                raise NotModified(output)
+            # skip rendering if this version of the output is in the cache
+            if compress:
+                cached = self.compressed_outputs.get((media_type, output.etag))
+                if cached:
+                    output.body, output.media_type, output.charset = cached
+                    output.encoding = 'gzip'
+                    return output
+
+        # skip rendering if only the metadata of the output is wanted, and
+        # the simplate or the configuration allow it
+        if output.body is None and request_context.get('__metadata_only__'):
+            skip = context.get(
+                'skip_rendering_for_metadata_only',
+                self.request_processor.skip_rendering_for_metadata_only,
+            )
+            needs_body = output.etag is None and self.request_processor.dynamic_etags
+            if skip and not needs_body:
+                # renderers return text, which is encoded by the request processor
+                output.charset = self.request_processor.encode_output_as
+                if compress:
+                    output.encoding = 'gzip'
+                return output
+
         # skip rendering if the second page has already filled output.body
-        if output.body is not None:
-            return output
+        if output.body is None:
+            if '__all__' in context:
+                # templates will only see variables named in __all__
+                context = dict((k, context[k]) for k in context['__all__'])
+
+            # load the renderer
+            render = self.renderers[media_type]
+            # render
+            output.body = render(context)
+
+        if compress:
+            if is_stream(output.body):
+                # streamed outputs aren't compressed
+                output.etag = etag
+            else:
+                self._compress(output, media_type)
+        elif prerendered is None:
+            self._prerender(media_type, output)
 
-        if '__all__' in context:
-            # templates will only see variables named in __all__
-            context = dict((k, context[k]) for k in context['__all__'])
+        return output
 
-        # load the renderer
-        render = self.renderers[media_type]
-        # render
-        output.body = render(context)
+    def _layer_context(self, context):
+        """Return a :class:`Context` of the request's variables over the first
+        page's.
 
+        The variables of the first page take precedence, as if the context had
+        been updated with them. The ones that the second page uses are copied,
+        as well as the builtins it uses, so that its lookups are as fast as in
+        a plain dict.
+        """
+        page_one = self.page_one
+        layered = Context(self.page_two_builtins)
+        layered.page_one = page_one
+        layered.update(context)
+        layered.update(self.page_two_globals)
+        for key in context:
+            if key in page_one:
+                layered[key] = page_one[key]
+        return layered
+
+    def _apply_page_two_changes(self, request_context, context):
+        """Apply the changes that the second page made to the layered
+        ``context`` to the ``request_context`` dict, as if the page had run in
+        it, and return the context to render the content page with.
+        """
+        page_one, deleted = self.page_one, []
+        for key in self.page_two_assigned:
+            if dict.__contains__(context, key):
+                request_context[key] = dict.__getitem__(context, key)
+            else:
+                request_context.pop(key, None)
+                if key in page_one:
+                    deleted.append(key)
+        if deleted:
+            # the layered context would fall back to the deleted variables
+            context = context.copy()
+            for key in deleted:
+                del context[key]
+        return context
+
+    def can_prerender(self, media_type):
+        """Return :obj:`True` if the output of the given content page can't
+        depend on the request.
+        """
+        request_processor = self.request_processor
+        if request_processor.changes_reload:
+            return False
+        flag = self.page_one.get('prerender')
+        if flag is not None:
+            return bool(flag)
+        if not (request_processor.prerender_simplates and self.page_two_is_empty):
+            return False
+        names = self.renderers[media_type].get_names()
+        return names is not None and all(name in self.page_one for name in names)
+
+    def _prerender(self, media_type, output):
+        """Store the rendered output if it's request-independent.
+        """
+        if not self.can_prerender(media_type):
+            self.prerendered[media_type] = False
+            return
+        body = output.body
+        if body is None:
+            # the content page wasn't rendered
+            return
+        if not isinstance(body, str) or output.etag or output.last_modified:
+            # streamed, or its validators were set by the second page
+            self.prerendered[media_type] = False
+            return
+        charset = self.request_processor.encode_output_as
+        body = body.encode(charset)
+        etag = None
+        if self.request_processor.dynamic_etags:
+            etag = '"%s"' % sha256(body).hexdigest()
+        self.prerendered[media_type] = (body, output.media_type, charset, etag)
+
+    def _output_prerendered(self, media_type, prerendered, context):
+        """Return a new output that carries a prerendered body.
+        """
+        body, output_media_type, charset, etag = prerendered
+        output = context['output'] = Output(body, output_media_type, charset, etag)
+        compress = (
+            context.get('__accept_gzip__') and
+            self.request_processor.compress_dynamic_output and
+            is_compressible(output_media_type)
+        )
+        if compress:
+            output.etag = gzip_etag(etag) if etag else None
+            cached = self.compressed_outputs.get((media_type, output.etag))
+            if cached:
+                output.body = cached[0]
+                output.encoding = 'gzip'
+            else:
+                self._compress(output, media_type)
         return output
 
+    def _compress(self, output, media_type):
+        """Gzip the output's body, and store the result in the cache.
+        """
+        body = output.body
+        if not isinstance(body, bytes):
+            output.charset = self.request_processor.encode_output_as
+            body = body.encode(output.charset)
+        output.body = gzip_compress(body)
+        output.encoding = 'gzip'
+        cache = self.compressed_outputs
+        if len(cache) >= self.max_compressed_outputs:
+            # Evict the oldest entry
+            del cache[next(iter(cache))]
+        cache[(media_type, output.etag)] = (output.body, output.media_type, output.charset)
+
     def parse_into_pages(self, decoded):
         """Given a bytestring that is the entire simplate, return a list of pages.
 
@@ -130,8 +523,10 @@ class Simplate(Dynamic):
         Page 1 is the 'run every' page - it is compiled for easier execution
         later, and stored in :obj:`self.pages[1]`.
 
-        Subsequent pages are templates, so each one's content type and
-        respective renderer are stored as a tuple in :obj:`self.pages[n]`.
+        Subsequent pages are templates. Their speclines are parsed and
+        validated, but they aren't compiled yet: each one is replaced by a
+        :obj:`(make_renderer, media_type, page)` tuple, and its renderer is only
+        created when it's first needed (see :class:`Renderers`).
         """
 
         # Exec the first page and compile the second.
@@ -147,10 +542,94 @@ class Simplate(Dynamic):
         exec(one, context)     # mutate context
         one = context          # store it
 
-        two = compile(two.padded_content, self.fspath, 'exec')
+        tree = ast.parse(two.padded_content, self.fspath, 'exec')
+        self.page_two_is_empty = not tree.body
+        two = compile(tree, self.fspath, 'exec', flags=PyCF_ALLOW_TOP_LEVEL_AWAIT)
+        self.page_two_is_async = bool(two.co_flags & CO_COROUTINE)
+        self.page_two_function = None
+        as_function = context.get(
+            'page_two_as_function', self.request_processor.page_two_as_function
+        )
+        if as_function and tree.body:
+            self.page_two_function = self._compile_page_two_function(tree)
+        names = get_names(self.page_two_function or two)
+        self.page_two_builtins = {
+            name: value for name, value in vars(builtins).items()
+            if name in names and name not in one
+        }
+        self.page_two_globals = {name: one[name] for name in names if name in one}
+        self.page_two_assigned = tuple(get_assigned_names(two))
 
         pages[:2] = (one, two)
-        pages[2:] = [self.compile_page(page) for page in pages[2:]]
+        pages[2:] = [self._parse_specline(page.header) + (page,) for page in pages[2:]]
+
+    def _compile_page_two_function(self, tree):
+        """Given the AST of the second page, return the code object of a
+        function that runs it and returns its local variables, or :obj:`None`
+        if the page can't be the body of a function.
+
+        The function takes the request context as its only argument, and it
+        starts by loading the context's values into the local variables that
+        the page assigns, if they exist, so that a page can read a variable
+        before reassigning it (e.g. ``x += 1``), as it could in a module.
+
+        If the page is asynchronous, then the function is a coroutine function.
+
+        :raises SyntaxError: if the page uses ``return`` or ``yield`` outside
+            of a function, as it would when running as module code
+        """
+        nodes = list(tree.body)
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, (ast.Return, ast.Yield, ast.YieldFrom)):
+                keyword = 'return' if isinstance(node, ast.Return) else 'yield'
+                raise SyntaxError(
+                    "'%s' outside function" % keyword,
+                    (self.fspath, node.lineno, node.col_offset + 1, None),
+                )
+            if not isinstance(node, NEW_SCOPES):
+                nodes.extend(ast.iter_child_nodes(node))
+        prefix = 'async ' if self.page_two_is_async else ''
+
+        def make_function(prologue):
+            module = ast.parse(PAGE_TWO_FUNCTION % (prefix, prologue), self.fspath)
+            function = module.body[0]
+            function.body[-1:-1] = tree.body
+            code = compile(module, self.fspath, 'exec')
+            return next(c for c in code.co_consts if isinstance(c, CodeType))
+
+        try:
+            code = make_function('')
+        except SyntaxError:
+            # e.g. `import *`, which is only allowed at module level
+            return None
+        names = dict.fromkeys(code.co_varnames[code.co_argcount:] + code.co_cellvars)
+        prologue = ''.join(
+            "    if %r in __context: %s = __context[%r]\n" % (name, name, name)
+            for name in names
+        )
+        return make_function(prologue)
+
+    def _run_page_two_function(self, context):
+        """Run the second page as a function, and return the variables that it
+        exports.
+        """
+        variables = FunctionType(self.page_two_function, context)(context)
+        return self._export_page_two_variables(variables, context)
+
+    def _export_page_two_variables(self, variables, context):
+        """Given the local variables of the second page's function, return the
+        ones that it exports.
+        """
+        del variables['__context']
+        exported = variables.get('__all__', context.get('__all__'))
+        if exported is not None:
+            # the renderers will only see these names
+            exported = {k: variables[k] for k in exported if k in variables}
+            if '__all__' in variables:
+                exported['__all__'] = variables['__all__']
+            return exported
+        return variables
 
     def compile_page(self, page):
         """Given a :class:`Page`, return a :obj:`(renderer, media_type)` pair.
@@ -208,6 +687,8 @@ class Simplate(Dynamic):
         """
         factories = self.defaults.renderer_factories
         if renderer_re.match(renderer) is None:
+            if isinstance(factories, RendererFactories):
+                factories.load_all()
             possible = ', '.join(sorted(factories.keys()))
             msg = ("Malformed renderer %s. It must match %s. Possible "
                    "renderers (might need third-party libs): %s.")
@@ -217,6 +698,8 @@ class Simplate(Dynamic):
         if isinstance(make_renderer, ImportError):
             raise make_renderer
         elif make_renderer is None:
+            if isinstance(factories, RendererFactories):
+                factories.load_all()
             possible = []
             legend = ''
             for k, v in sorted(factories.items()):
@@ -115,11 +115,32 @@ class Harness:
 
         return self.hit(uripath, querystring, **kw)
 
-    def hit(self, path, querystring='', accept_header=None, want=None, **context):
+    def hit(
+        self, path, querystring='', accept_header=None, want=None, range_header=None,
+        if_none_match=None, if_modified_since=None, accept_encoding=None,
+        metadata_only=False, **context
+    ):
         path = context['path'] = Path(path)
         querystring = Querystring(querystring)
         dispatch_result, resource, output = self.request_processor.process(
-            path, querystring, accept_header, context
+            path, querystring, accept_header, context, range_header=range_header,
+            if_none_match=if_none_match, if_modified_since=if_modified_since,
+            accept_encoding=accept_encoding, metadata_only=metadata_only,
+        )
+        if want is None:
+            return output
+        return resolve_want(locals(), want)
+
+    async def hit_async(
+        self, path, querystring='', accept_header=None, want=None, **context
+    ):
+        """Same as :meth:`hit`, but the request is processed by
+        :meth:`~aspen.request_processor.RequestProcessor.process_async`.
+        """
+        path = context['path'] = Path(path)
+        querystring = Querystring(querystring)
+        dispatch_result, resource, output = await self.request_processor.process_async(
+            path, querystring, accept_header, context,
         )
         if want is None:
             return output
@@ -1,3 +1,18 @@
+from hashlib import sha256
+
+
+DIGEST_CHUNK_SIZE = 64 * 1024
+
+
+def file_digest(fspath):
+    """Compute the SHA-256 hex digest of a file's content.
+    """
+    h = sha256()
+    with open(fspath, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
 
 REPR_TEMPLATE = """
 def __repr__(self):
@@ -8,6 +23,8 @@ def __repr__(self):
 def auto_repr(cls):
     """Generates a `__repr__` method for the given class, using `__slots__`.
 
+    The slots of the parent classes are included, in order of definition.
+
     >>> @auto_repr
     ... class Foo:
     ...     __slots__ = ['bar']
@@ -17,7 +34,12 @@ def auto_repr(cls):
     >>> Foo(0)
     Foo(bar=0)
     """
-    slots = cls.__slots__
+    slots = []
+    for c in reversed(cls.__mro__):
+        c_slots = c.__dict__.get('__slots__', ())
+        if isinstance(c_slots, str):
+            c_slots = (c_slots,)
+        slots.extend(attr for attr in c_slots if attr not in slots)
     repr_slots = ', '.join('{}=%r'.format(attr) for attr in slots)
     repr_values = ', '.join('self.' + attr for attr in slots)
     repr_def = REPR_TEMPLATE.format(cls.__name__, repr_slots, repr_values)
@@ -0,0 +1,75 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from timeit import timeit
+
+from filesystem_tree import FilesystemTree
+
+from aspen.http.request import Path, Querystring
+from aspen.request_processor import RequestProcessor
+
+
+N = 2000
+
+SIZES = [1, 10, 100, 1000]
+
+PAGE_ONE = """\
+from html import escape
+rows = [{'id': i, 'name': 'item <%i>' % i} for i in range(%i)]
+"""
+
+# The ways of producing an HTML table: building it in page two and inserting
+# it with a stdlib renderer, or looping in an aspen_template page.
+SIMPLATES = {
+    'concatenation': """\
+[---]
+table = ''
+for row in rows:
+    table += '<tr><td>' + str(row['id']) + '</td><td>' + escape(row['name']) + '</td></tr>\\n'
+[---] text/html via stdlib_template
+<table>
+$table</table>
+""",
+    'join + format': """\
+[---]
+table = ''.join([
+    '<tr><td>{0}</td><td>{1}</td></tr>\\n'.format(row['id'], escape(row['name']))
+    for row in rows
+])
+[---] text/html via stdlib_format
+<table>
+{table}</table>
+""",
+    'aspen_template': """\
+[---]
+[---] text/html via aspen_template
+<table>
+{% for row in rows %}
+<tr><td>{{ row['id'] }}</td><td>{{ row['name'] }}</td></tr>
+{% endfor %}
+</table>
+""",
+}
+
+
+print("Time to render a table of n rows, in microseconds per request")
+print("%-6s" % 'n' + ''.join("%16s" % label for label in SIMPLATES))
+with FilesystemTree() as ft:
+    for size in SIZES:
+        for i, simplate in enumerate(SIMPLATES.values()):
+            ft.mk(('%i-%i.spt' % (size, i), PAGE_ONE.replace('%i)', '%i)' % size) + simplate))
+    request_processor = RequestProcessor(
+        www_root=ft.root, project_root=ft.root, prerender_simplates=False
+    )
+    for size in SIZES:
+        times, bodies = [], set()
+        for i in range(len(SIMPLATES)):
+            path = Path('/%i-%i' % (size, i))
+
+            def process():
+                return request_processor.process(path, Querystring(''), None, {})
+
+            bodies.add(process()[2].body)
+            n = N * 10 // size or 1
+            times.append(timeit(process, number=n) / n * 1e6)
+        assert len(bodies) == 1, bodies
+        print("%-6i" % size + ''.join("%16.2f" % t for t in times))
@@ -0,0 +1,53 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from filesystem_tree import FilesystemTree
+
+from aspen.http.request import Path, Querystring
+from aspen.request_processor import RequestProcessor
+
+
+N = 500
+
+# Second pages that wait for 10ms, like a call to an HTTP or database client
+SIMPLATES = {
+    'sync.spt': "import time\n[---]\ntime.sleep(0.01)\nx = 1\n[---] text/plain\n%(x)s",
+    'async.spt': "import asyncio\n[---]\nawait asyncio.sleep(0.01)\nx = 1\n[---] text/plain\n%(x)s",
+}
+
+
+def run_in_threads(request_processor, path, threads):
+    def process(i):
+        return request_processor.process(Path(path), Querystring(''), None, {})
+    with ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(process, range(N)))
+
+
+def run_in_loop(request_processor, path):
+    async def main():
+        return await asyncio.gather(*[
+            request_processor.process_async(Path(path), Querystring(''), None, {})
+            for i in range(N)
+        ])
+    return asyncio.run(main())
+
+
+print("Time to process %i concurrent requests that wait for 10ms, in milliseconds" % N)
+with FilesystemTree() as ft:
+    ft.mk(*SIMPLATES.items())
+    request_processor = RequestProcessor(www_root=ft.root, project_root=ft.root)
+    runs = [
+        ('threads (%i)' % threads, lambda t=threads: run_in_threads(request_processor, '/sync', t))
+        for threads in (10, 50)
+    ]
+    runs.append(('event loop', lambda: run_in_loop(request_processor, '/async')))
+    for name, run in runs:
+        run()
+        start = perf_counter()
+        results = run()
+        elapsed = perf_counter() - start
+        assert all(output.body == b'1' for _, _, output in results)
+        print("%-12s %10.1f" % (name, elapsed * 1000))
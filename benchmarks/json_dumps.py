@@ -0,0 +1,63 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import dataclasses
+import datetime
+from timeit import timeit
+
+from aspen.simplates import json_
+
+
+N = 200
+
+
+class Model:
+    __slots__ = ('id', 'name', 'active')
+
+    def __init__(self, id, name, active):
+        self.id = id
+        self.name = name
+        self.active = active
+
+
+@dataclasses.dataclass
+class Record:
+    id: int
+    name: str
+    active: bool
+
+
+PAYLOADS = {
+    'flat object': {'key%i' % i: i for i in range(100)},
+    'list of records': [
+        {'id': i, 'name': 'user %i' % i, 'email': 'user%i@example.com' % i, 'active': i % 2 == 0,
+         'score': i * 1.5, 'tags': ['a', 'b', 'c']}
+        for i in range(500)
+    ],
+    'numbers': list(range(10000)),
+    'long strings': ['Greetings, program! ' * 50 for i in range(100)],
+    'nested': {'level%i' % i: {'values': list(range(20)), 'child': {'x': i}} for i in range(200)},
+    'with datetimes': [
+        {'id': i, 'created': datetime.datetime(2020, 1, 1, 12, 0, i % 60)}
+        for i in range(500)
+    ],
+    'slotted objects': [Model(i, 'user %i' % i, i % 2 == 0) for i in range(500)],
+    'dataclasses': [Record(i, 'user %i' % i, i % 2 == 0) for i in range(500)],
+}
+
+backends = []
+for name in json_.COMPACT_BACKENDS:
+    try:
+        json_.select_compact_backend(name)
+    except ImportError:
+        print("%s isn't installed" % name)
+        continue
+    backends.append(name)
+
+print("Time to serialize each payload %i times, in seconds" % N)
+print("%-16s %10s" % ('payload', 'indented') + ''.join(' %10s' % name for name in backends))
+for label, payload in PAYLOADS.items():
+    times = [timeit(lambda: json_.dumps(payload), number=N)]
+    for name in backends:
+        json_.select_compact_backend(name)
+        times.append(timeit(lambda: json_.dumps_compact(payload), number=N))
+    print("%-16s" % label + ''.join(' %10.4f' % t for t in times))
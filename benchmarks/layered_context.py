@@ -0,0 +1,63 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from timeit import timeit
+
+from filesystem_tree import FilesystemTree
+
+from aspen.request_processor import RequestProcessor
+from aspen.simplates.simplate import Simplate
+
+
+N = 20000
+
+SIZES = [10, 100, 1000]
+
+# A first page that defines a lot of names (imports, helpers, constants), and a
+# small second page that only uses a few of them
+SIMPLATE = """\
+%s
+greeting = 'Hello'
+[---]
+name = querystring.get('name', 'world')
+[---] text/plain via stdlib_format
+{greeting}, {name}!
+"""
+
+
+class CopyingSimplate(Simplate):
+    """A simplate that copies its first page into the request context, as
+    simplates did before the context was layered.
+    """
+
+    __slots__ = ()
+
+    def _layer_context(self, context):
+        context.update(self.page_one)
+        return context
+
+    def _apply_page_two_changes(self, request_context, context):
+        return context
+
+
+print("Time to render a simplate, in microseconds")
+print("%-6s %12s %12s" % ('names', 'copied', 'layered'))
+with FilesystemTree() as ft:
+    for size in SIZES:
+        names = '\n'.join('name_%i = %i' % (i, i) for i in range(size))
+        ft.mk(('%i.spt' % size, SIMPLATE % names))
+    request_processor = RequestProcessor(www_root=ft.root, project_root=ft.root)
+    for size in SIZES:
+        fspath = ft.resolve('%i.spt' % size)
+        layered = Simplate(request_processor, fspath)
+        copying = Simplate(request_processor, fspath)
+        copying.__class__ = CopyingSimplate
+        times, bodies = [], set()
+        for simplate in (copying, layered):
+
+            def render():
+                return simplate.render_for_type('text/plain', {'querystring': {}})
+
+            bodies.add(render().body)
+            times.append(timeit(render, number=N) / N * 1e6)
+        assert len(bodies) == 1
+        print("%-6i %12.2f %12.2f" % (size, times[0], times[1]))
@@ -0,0 +1,54 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import mimetypes
+import os
+from tempfile import mkdtemp
+from timeit import timeit
+
+from aspen.request_processor import media_types
+from aspen.request_processor.media_types import BUNDLED_FILE, MediaTypeIndex
+
+
+FILENAMES = ['index.html', 'style.css', 'app.js', 'logo.png', 'data.json', 'README']
+
+N_STARTUP = 20
+N_LOOKUPS = 100000
+
+
+def init_mimetypes():
+    mimetypes.knownfiles.append(BUNDLED_FILE)
+    try:
+        mimetypes.init()
+    finally:
+        mimetypes.knownfiles.remove(BUNDLED_FILE)
+
+
+def build_index():
+    media_types._memo.clear()
+    return MediaTypeIndex.get([BUNDLED_FILE])
+
+
+cache_fspath = os.path.join(mkdtemp(), 'media_types.json')
+
+def load_index():
+    media_types._memo.clear()
+    return MediaTypeIndex.get([BUNDLED_FILE], cache_fspath=cache_fspath)
+
+load_index()
+
+
+print("Startup (%i times)" % N_STARTUP)
+print("mimetypes.init()     ", timeit(init_mimetypes, number=N_STARTUP))
+print("MediaTypeIndex build ", timeit(build_index, number=N_STARTUP))
+print("MediaTypeIndex cached", timeit(load_index, number=N_STARTUP))
+print("MediaTypeIndex memo  ", timeit(lambda: MediaTypeIndex.get([BUNDLED_FILE]), number=N_STARTUP))
+print()
+
+index = build_index()
+print("Lookups (%i times)" % (N_LOOKUPS * len(FILENAMES)))
+print("mimetypes.guess_type ", timeit(
+    lambda: [mimetypes.guess_type(f, strict=False) for f in FILENAMES], number=N_LOOKUPS
+))
+print("MediaTypeIndex       ", timeit(
+    lambda: [index.guess_type(f) for f in FILENAMES], number=N_LOOKUPS
+))
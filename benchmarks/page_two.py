@@ -0,0 +1,54 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from timeit import timeit
+
+from filesystem_tree import FilesystemTree
+
+from aspen.http.request import Path, Querystring
+from aspen.request_processor import RequestProcessor
+
+
+N = 2000
+
+SIZES = [1, 10, 100, 1000]
+
+# A loop-heavy second page, which builds rows from data defined by the first
+SIMPLATE = """\
+items = [{'id': i, 'price': i * 1.5, 'quantity': i %% 7} for i in range(%i)]
+[---]
+total = 0
+rows = []
+for item in items:
+    amount = item['price'] * item['quantity']
+    if amount:
+        total += amount
+        rows.append('%%i: %%.2f' %% (item['id'], amount))
+table = '\\n'.join(rows)
+[---] text/plain via stdlib_format
+{table}
+Total: {total:.2f}
+"""
+
+
+print("Time to process a request, in microseconds")
+print("%-6s %12s %12s" % ('items', 'exec', 'function'))
+with FilesystemTree() as ft:
+    for size in SIZES:
+        ft.mk(('%i.spt' % size, SIMPLATE % size))
+    request_processors = [
+        RequestProcessor(www_root=ft.root, project_root=ft.root, page_two_as_function=flag)
+        for flag in (False, True)
+    ]
+    for size in SIZES:
+        times, bodies = [], set()
+        path = Path('/%i' % size)
+        for request_processor in request_processors:
+
+            def process():
+                return request_processor.process(path, Querystring(''), None, {})
+
+            bodies.add(process()[2].body)
+            n = N * 10 // size or 1
+            times.append(timeit(process, number=n) / n * 1e6)
+        assert len(bodies) == 1
+        print("%-6i %12.2f %12.2f" % (size, times[0], times[1]))
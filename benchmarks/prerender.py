@@ -0,0 +1,37 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from timeit import timeit
+
+from filesystem_tree import FilesystemTree
+
+from aspen.http.request import Path, Querystring
+from aspen.request_processor import RequestProcessor
+
+
+N = 10000
+
+LINE = '<p>Greetings, {name}! Here is some filler text for the page.</p>\n'
+
+PAGES = {
+    'small': LINE,
+    '10 KiB': LINE * (10 * 1024 // len(LINE)),
+    '100 KiB': LINE * (100 * 1024 // len(LINE)),
+}
+
+
+print("Time to process %i requests, in seconds" % N)
+print("%-10s %12s %12s" % ('page', 'rendered', 'prerendered'))
+with FilesystemTree() as ft:
+    for label, page in PAGES.items():
+        ft.mk(('index.spt', "name = 'program'\n[---]\n[---] text/html via stdlib_format\n" + page))
+        times = []
+        for prerender in (False, True):
+            request_processor = RequestProcessor(
+                www_root=ft.root, project_root=ft.root, prerender_simplates=prerender
+            )
+
+            def process():
+                request_processor.process(Path('/'), Querystring(''), None, {})
+
+            times.append(timeit(process, number=N))
+        print("%-10s %12.4f %12.4f" % (label, times[0], times[1]))
@@ -0,0 +1,72 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from importlib import import_module
+import tracemalloc
+
+from filesystem_tree import FilesystemTree
+
+from aspen.request_processor import RequestProcessor
+from aspen.simplates.simplate import Simplate
+
+
+N_SIMPLATES = 100
+
+PAGE_SIZE = 100 * 1024
+
+PLACEHOLDERS = {
+    'stdlib_format': '{name}',
+    'stdlib_percent': '%(name)s',
+    'stdlib_template': '$name',
+}
+
+
+def make_page(placeholder):
+    line = '<p>Greetings, %s! Here is some filler text for the page.</p>\n' % placeholder
+    return line * (PAGE_SIZE // len(line))
+
+
+def previous_factory(module, request_processor):
+    """Return a factory whose renderers keep the source and the padded source in
+    memory alongside the compiled page, like they used to.
+    """
+    class Renderer(module.Renderer):
+        keep_source = True
+
+        def __init__(self, *args):
+            super(Renderer, self).__init__(*args)
+            self.__dict__['_padded'] = ('\n' * self.offset) + self.raw
+
+    class Factory(module.Factory):
+        pass
+
+    Factory.Renderer = Renderer
+    return Factory(request_processor)
+
+
+def measure(root, paths, renderer, previous):
+    request_processor = RequestProcessor(www_root=root, project_root=root)
+    if previous:
+        module = import_module('aspen.simplates.renderers.%s' % renderer)
+        Simplate.renderer_factories[renderer] = previous_factory(module, request_processor)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for path in paths:
+            request_processor.resources.get(path)
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+print("Memory held by the resources cache after loading %i simplates with a %i KiB page, "
+      "in MiB" % (N_SIMPLATES, PAGE_SIZE // 1024))
+print("%-16s %12s %12s" % ('renderer', 'previous', 'current'))
+for renderer, placeholder in PLACEHOLDERS.items():
+    source = '[---]\nname = "program"\n[---] text/html via %s\n%s' % (
+        renderer, make_page(placeholder)
+    )
+    with FilesystemTree() as ft:
+        ft.mk(*[('page%i.spt' % i, source) for i in range(N_SIMPLATES)])
+        paths = [ft.resolve('page%i.spt' % i) for i in range(N_SIMPLATES)]
+        sizes = [measure(ft.root, paths, renderer, previous) for previous in (True, False)]
+    print("%-16s %12.1f %12.1f" % (renderer, sizes[0] / 2**20, sizes[1] / 2**20))
@@ -0,0 +1,41 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from tempfile import mkdtemp
+from timeit import timeit
+
+from aspen.output import Output
+from aspen.request_processor import RequestProcessor
+from aspen.simplates.renderers import Renderer as BaseRenderer, json_dump
+
+
+N = 10000
+
+PAGES = {
+    'small': "{'Greetings': 'program!'}",
+    'comprehension': "{'items': [{'id': i, 'name': 'item %i' % i} for i in range(10)]}",
+    'long literal': '{%s}' % ', '.join("'key%i': %i" % (i, i) for i in range(200)),
+}
+
+
+class UncompiledRenderer(json_dump.Renderer):
+    """The previous behavior: the source string is passed to `eval` every time."""
+    compile = BaseRenderer.compile
+
+
+root = mkdtemp()
+request_processor = RequestProcessor(www_root=root, project_root=root, json_compact=True)
+factory = json_dump.Factory(request_processor)
+
+print("Time to render each page %i times, in seconds" % N)
+print("%-16s %12s %12s" % ('page', 'source', 'code object'))
+for label, source in PAGES.items():
+    times = []
+    for renderer_class in (UncompiledRenderer, json_dump.Renderer):
+        renderer = renderer_class(factory, 'bench.spt', source, 'application/json', 2)
+
+        def render():
+            context = {'output': Output(), 'request_processor': request_processor}
+            renderer(context)
+
+        times.append(timeit(render, number=N))
+    print("%-16s %12.4f %12.4f" % (label, times[0], times[1]))
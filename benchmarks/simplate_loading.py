@@ -0,0 +1,58 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from time import perf_counter
+import tracemalloc
+
+from filesystem_tree import FilesystemTree
+
+from aspen.request_processor import RequestProcessor
+
+
+N_SIMPLATES = 200
+
+FILLER = 'Here is some filler text for the page. ' * 50
+
+SIMPLATE = '''\
+[---]
+items = [{'id': i, 'name': 'item %%i' %% i} for i in range(10)]
+[---] text/html via stdlib_format
+<html><body><h1>{items[0][name]}</h1><p>%(filler)s</p></body></html>
+[---] application/json via json_dump
+{'items': items, 'filler': %(filler)r}
+[---] text/plain via stdlib_percent
+%%(items)r %(filler)s
+[---] text/csv via stdlib_template
+$items %(filler)s
+[---] application/xml via stdlib_template
+<items>$items</items><filler>%(filler)s</filler>
+''' % dict(filler=FILLER)
+
+
+def load(root, paths, eager):
+    request_processor = RequestProcessor(www_root=root, project_root=root)
+    tracemalloc.start()
+    try:
+        start = perf_counter()
+        before = tracemalloc.get_traced_memory()[0]
+        for path in paths:
+            resource = request_processor.resources.get(path)
+            if eager:
+                # Compile all the content pages, like simplates used to do
+                for media_type in resource.available_types:
+                    resource.renderers[media_type]
+            else:
+                # Only the page that is actually requested gets compiled
+                resource.renderers['text/html']
+        return perf_counter() - start, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+print("Loading %i simplates with 5 content pages and compiling one of them" % N_SIMPLATES)
+print("%-8s %12s %12s" % ('', 'time (ms)', 'memory (KiB)'))
+with FilesystemTree() as ft:
+    ft.mk(*[('page%i.spt' % i, SIMPLATE) for i in range(N_SIMPLATES)])
+    paths = [ft.resolve('page%i.spt' % i) for i in range(N_SIMPLATES)]
+    for label, eager in (('eager', True), ('lazy', False)):
+        time, memory = load(ft.root, paths, eager)
+        print("%-8s %12.2f %12.1f" % (label, time * 1000, memory / 1024))
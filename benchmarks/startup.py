@@ -0,0 +1,83 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+import subprocess
+import sys
+from tempfile import mkdtemp
+from timeit import timeit
+
+from filesystem_tree import FilesystemTree
+
+
+N = 10
+
+TREE_SIZES = [0, 100, 1000, 10000]
+
+FILES_PER_DIRECTORY = 50
+
+EMPTY_ROOT = mkdtemp()
+
+STATEMENTS = [
+    ('import aspen.simplates.renderers', 'import aspen.simplates.renderers'),
+    ('RequestProcessor()', (
+        'from aspen.request_processor import RequestProcessor; '
+        'RequestProcessor(www_root=%r, project_root=%r)' % (EMPTY_ROOT, EMPTY_ROOT)
+    )),
+]
+
+PROFILE_SCRIPT = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+import aspen
+from aspen.request_processor import RequestProcessor
+import_time = perf_counter() - start
+rp = RequestProcessor(www_root=sys.argv[1], project_root=sys.argv[1], profile_startup=True)
+print(json.dumps(dict(import_time=import_time, report=rp.startup_report.as_dict())))
+"""
+
+
+def run(statement, *args):
+    return subprocess.check_output([sys.executable, '-c', statement] + list(args), env=os.environ)
+
+
+def make_files(n):
+    for i in range(n):
+        dirpath = 'dir%i' % (i // FILES_PER_DIRECTORY)
+        if i % 3 == 0:
+            yield ('%s/page%i.spt' % (dirpath, i), '[---]\n[---] text/plain\nHello')
+        else:
+            yield ('%s/file%i.css' % (dirpath, i), 'a { color: red; }')
+
+
+print("Startup times, in seconds per process (average of %i runs)" % N)
+run('pass')
+baseline = timeit(lambda: run('pass'), number=N) / N
+print("%-40s %.4f" % ("interpreter", baseline))
+for label, statement in STATEMENTS:
+    time = timeit(lambda: run(statement), number=N) / N
+    print("%-40s %.4f (+%.4f)" % (label, time, time - baseline))
+print()
+
+for size in TREE_SIZES:
+    with FilesystemTree() as ft:
+        ft.mk(*make_files(size))
+        results = [json.loads(run(PROFILE_SCRIPT, ft.root).decode('ascii')) for i in range(N)]
+    print("Tree of %i files (median of %i runs)" % (size, N))
+    import_times = sorted(r['import_time'] for r in results)
+    print("%-16s %10.2f ms" % ('import aspen', import_times[N // 2] * 1000))
+    phases = [phase['name'] for phase in results[0]['report']['phases']] + ['total']
+    for name in phases:
+        if name == 'total':
+            times = sorted(r['report']['wall_time'] for r in results)
+            allocs = sorted(r['report']['allocated'] for r in results)
+        else:
+            times = sorted(
+                p['wall_time'] for r in results for p in r['report']['phases'] if p['name'] == name
+            )
+            allocs = sorted(
+                p['allocated'] for r in results for p in r['report']['phases'] if p['name'] == name
+            )
+        print("%-16s %10.2f ms %10.1f KiB" % (name, times[N // 2] * 1000, allocs[N // 2] / 1024))
+    print()
@@ -0,0 +1,48 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import builtins
+from string import Template
+from timeit import timeit
+
+from aspen.simplates.renderers.stdlib_format import FormatTemplate
+from aspen.simplates.renderers.stdlib_template import CompiledTemplate
+
+
+N = 100000
+
+SIZES = [1, 10, 100, 1000]
+
+# A render context is a simplate's namespace, so it's usually fairly big.
+CONTEXT = dict(('var%i' % i, i) for i in range(100))
+CONTEXT.update(__builtins__=builtins.__dict__, name='program', count=42)
+
+LINES = {
+    'stdlib_format': 'Greetings, {name}! You have {count} new messages.\n',
+    'stdlib_percent': 'Greetings, %(name)s! You have %(count)s new messages.\n',
+    'stdlib_template': 'Greetings, $name! You have ${count} new messages.\n',
+}
+
+
+def renderers(kind, source):
+    """Return the previous and current ways of rendering the given template."""
+    if kind == 'stdlib_format':
+        compiled = FormatTemplate.parse(source)
+        return (lambda: source.format(**CONTEXT)), (lambda: compiled.format_map(CONTEXT))
+    if kind == 'stdlib_percent':
+        return (lambda: source % CONTEXT), None
+    template, compiled = Template(source), CompiledTemplate.parse(source)
+    return (lambda: template.substitute(CONTEXT)), (lambda: compiled.substitute(CONTEXT))
+
+
+print("Time to render a template of n lines, in microseconds per render")
+print("%-16s %6s %12s %12s" % ('renderer', 'n', 'previous', 'precompiled'))
+for kind, line in LINES.items():
+    for size in SIZES:
+        n = N // size
+        previous, current = renderers(kind, line * size)
+        if current is not None:
+            assert previous() == current()
+        times = [timeit(f, number=n) / n * 1e6 if f else None for f in (previous, current)]
+        print("%-16s %6i %12.2f %12s" % (
+            kind, size, times[0], '-' if times[1] is None else '%.2f' % times[1]
+        ))
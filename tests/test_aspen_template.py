@@ -0,0 +1,163 @@
+import traceback
+
+from pytest import raises
+
+from aspen.simplates.renderers.aspen_template import Markup, find_operators
+
+
+def render(harness, page, logic='', media_type='text/html', **kw):
+    simplate = "%s\n[---]\n[---] %s via aspen_template\n%s" % (logic, media_type, page)
+    return harness.simple(simplate, filepath='index.spt', **kw).text
+
+
+# expressions
+
+def test_expressions_are_rendered(harness):
+    assert render(harness, "Greetings, {{ name }}!", "name = 'program'") == "Greetings, program!"
+
+def test_expressions_are_escaped_in_html(harness):
+    output = render(harness, "<p>{{ x }}</p>", "x = '<a href=\"?\">&'")
+    assert output == "<p>&lt;a href=&quot;?&quot;&gt;&amp;</p>"
+
+def test_expressions_arent_escaped_in_plain_text(harness):
+    assert render(harness, "{{ x }}", "x = '<b>'", media_type='text/plain') == "<b>"
+
+def test_safe_values_arent_escaped(harness):
+    logic = "from aspen.simplates.renderers.aspen_template import Markup\nx = Markup('<b>')"
+    assert render(harness, "{{ x }} {{ '<i>' | safe }}", logic) == "<b> <i>"
+
+def test_filters_are_applied_in_order(harness):
+    logic = "names = ['a', 'b']"
+    output = render(harness, "{{ names | join(', ') | upper }} {{ (1 | 2) }}", logic)
+    assert output == "A, B 3"
+
+def test_filters_can_come_from_the_context(harness):
+    logic = "def shout(s, n=1):\n    return s + '!' * n"
+    assert render(harness, "{{ 'hi' | shout(n=2) }}", logic) == "hi!!"
+
+def test_escape_filter_doesnt_escape_twice(harness):
+    assert render(harness, "{{ '<' | escape }}") == "&lt;"
+
+def test_markup_is_a_string():
+    assert Markup('<b>') == '<b>'
+    assert Markup('<b>').__html__() == '<b>'
+
+
+# statements
+
+TABLE = """\
+<ul>
+{% for i, name in rows %}
+    {# one list item per row #}
+    {% if i % 2 %}
+    <li class="odd">{{ name }}</li>
+    {% elif i == 0 %}
+    <li class="first">{{ name }}</li>
+    {% else %}
+    <li>{{ name }}</li>
+    {% endif %}
+{% endfor %}
+</ul>
+{% set count = rows | length %}{{ count }} rows
+"""
+
+def test_statements_are_executed(harness):
+    output = render(harness, TABLE, "rows = list(enumerate(['a', 'b', '<c>']))")
+    assert output == (
+        '<ul>\n'
+        '    <li class="first">a</li>\n'
+        '    <li class="odd">b</li>\n'
+        '    <li>&lt;c&gt;</li>\n'
+        '</ul>\n'
+        '3 rows\n'
+    )
+
+def test_statements_can_use_request_variables(harness):
+    page = "{% if querystring.get('x') %}x{% else %}no x{% endif %}"
+    assert render(harness, page) == "no x"
+    assert render(harness, page, querystring='x=1') == "x"
+
+def test_find_operators_ignores_nested_operators():
+    assert find_operators("f(a | b) | g", '|') == [9]
+    assert find_operators("x in [y in z]", 'in') == [2]
+    assert find_operators("'|'", '|') == []
+
+
+# errors
+
+def test_unknown_statements_are_syntax_errors(harness):
+    with raises(SyntaxError) as e:
+        render(harness, "a\n{% while x %}")
+    assert e.value.lineno == 5
+    assert e.value.filename.endswith('index.spt')
+
+def test_mismatched_blocks_are_syntax_errors(harness):
+    with raises(SyntaxError) as e:
+        render(harness, "{% for x in y %}\n{% if x %}\n{% endfor %}")
+    assert "unexpected 'endfor'" in e.value.msg
+
+def test_unclosed_blocks_are_syntax_errors(harness):
+    with raises(SyntaxError) as e:
+        render(harness, "{% if x %}\n")
+    assert "unclosed 'if' block" in e.value.msg
+
+def test_invalid_expressions_are_syntax_errors_with_correct_line_numbers(harness):
+    with raises(SyntaxError) as e:
+        render(harness, "a\nb\n{{ 1 + }}")
+    assert e.value.lineno == 6
+
+def test_tracebacks_have_correct_line_numbers(harness):
+    with raises(ZeroDivisionError) as e:
+        render(harness, "a\n{% for x in [0] %}\n{{ 1 / x }}\n{% endfor %}")
+    assert traceback.extract_tb(e.tb)[-1].lineno == 6
+
+def test_names_can_be_read_from_the_context_before_theyre_set(harness):
+    page = "{{ x }}{% set x = 'b' %}{{ x }} {% for i in [i] %}{{ i }}{% endfor %}"
+    assert render(harness, page, "x = 'a'\ni = 0") == "ab 0"
+
+def test_names_set_in_a_block_that_didnt_run_are_read_from_the_context(harness):
+    page = "{% if False %}{% set x = 'b' %}{% endif %}{{ x }}"
+    assert render(harness, page, "x = 'a'") == "a"
+
+def test_undefined_names_raise_NameError(harness):
+    with raises(NameError):
+        render(harness, "{{ undefined }}")
+
+
+# prerendering
+
+PRERENDER = {'prerender_simplates': True}
+
+def test_request_independent_pages_are_prerendered(harness):
+    render(
+        harness, "{% for x in xs %}{{ x }}{% endfor %}", "xs = [1, 2]",
+        request_processor_configuration=PRERENDER,
+    )
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    assert resource.renderers['text/html'].get_names() == {'xs'}
+    assert resource.prerendered['text/html'][0] == b'12'
+
+def test_names_that_can_be_read_before_theyre_set_are_tracked(harness):
+    render(
+        harness, "{% if xs %}{% set x = 1 %}{% endif %}{{ x }}", "x = xs = 0",
+        request_processor_configuration=PRERENDER,
+    )
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    assert resource.renderers['text/html'].get_names() == {'x', 'xs'}
+
+def test_pages_that_call_functions_arent_prerendered(harness):
+    render(harness, "{{ len(xs) }}", "xs = [1, 2]", request_processor_configuration=PRERENDER)
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    assert resource.renderers['text/html'].get_names() is None
+    assert resource.prerendered == {'text/html': False}
+
+def test_pages_that_access_attributes_or_items_arent_prerendered(harness):
+    logic = (
+        "class Counter:\n    n = 0\n    @property\n    def next(self):\n"
+        "        Counter.n += 1\n        return Counter.n\ncounter = Counter()\nd = {'a': 1}"
+    )
+    page = "{{ counter.next }} {{ d['a'] }}"
+    assert render(harness, page, logic, request_processor_configuration=PRERENDER) == "1 1"
+    assert render(harness, page, logic) == "2 1"
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    assert resource.renderers['text/html'].get_names() is None
@@ -0,0 +1,145 @@
+import gzip
+import os
+
+from pytest import raises
+
+from aspen.exceptions import NotModified
+from aspen.http.compression import accepts_gzip, gzip_compress, is_compressible
+
+
+CSS = 'body { color: black; }\n' * 100
+
+
+def test_accepts_gzip():
+    assert accepts_gzip('gzip')
+    assert accepts_gzip('deflate, GZIP;q=0.5')
+    assert accepts_gzip('x-gzip')
+    assert accepts_gzip('*')
+    assert not accepts_gzip('')
+    assert not accepts_gzip('br, deflate')
+    assert not accepts_gzip('gzip;q=0')
+    assert not accepts_gzip('gzip;q=0.0, *;q=1')
+    assert not accepts_gzip('gzip;q=foo')
+
+def test_is_compressible():
+    assert is_compressible('text/css')
+    assert is_compressible('application/javascript')
+    assert is_compressible('application/vnd.api+json')
+    assert not is_compressible('image/png')
+    assert not is_compressible(None)
+
+def test_gzip_compress_produces_gzip_data():
+    assert gzip.decompress(gzip_compress(b'foo' * 100)) == b'foo' * 100
+
+
+# Static files
+
+def make_precompressed(harness, **config):
+    harness.fs.www.mk(('style.css', CSS), ('logo.png', 'x' * 2000), ('small.css', 'a{}'))
+    config.setdefault('compress_static_files', True)
+    rp = harness.hydrate_request_processor(**config)
+    return rp, rp.precompress_static_files()
+
+def test_precompress_static_files_creates_siblings(harness):
+    rp, written = make_precompressed(harness)
+    fspath = harness.fs.www.resolve('style.css')
+    assert written == [fspath + '.gz']
+    with gzip.open(fspath + '.gz') as f:
+        assert f.read() == CSS.encode('ascii')
+    # The siblings are up-to-date, so they're not rewritten
+    assert rp.precompress_static_files() == []
+
+def test_precompressed_siblings_arent_routes(harness):
+    rp, written = make_precompressed(harness)
+    rp.dispatcher.build_dispatch_tree()
+    assert harness.hit('/style.css.gz', want='dispatch_result').status.name == 'missing'
+
+def test_precompressed_sibling_is_served_to_clients_that_accept_gzip(harness):
+    make_precompressed(harness)
+    output = harness.hit('/style.css', accept_encoding='gzip, deflate')
+    assert output.encoding == 'gzip'
+    assert output.media_type == 'text/css'
+    assert gzip.decompress(output.body) == CSS.encode('ascii')
+    assert output.etag.endswith('-gzip"')
+
+def test_precompressed_sibling_isnt_served_to_other_clients(harness):
+    make_precompressed(harness)
+    output = harness.hit('/style.css', accept_encoding='br')
+    assert output.encoding is None
+    assert output.body == CSS.encode('ascii')
+
+def test_precompressed_sibling_can_be_handed_off(harness):
+    make_precompressed(harness, static_file_handoff=True)
+    output = harness.hit('/style.css', accept_encoding='gzip')
+    assert output.encoding == 'gzip'
+    assert gzip.decompress(b''.join(output)) == CSS.encode('ascii')
+
+def test_precompressed_sibling_can_be_stored_in_ram(harness):
+    make_precompressed(harness, store_static_files_in_ram=True)
+    output = harness.hit('/style.css', accept_encoding='gzip')
+    assert gzip.decompress(output.body) == CSS.encode('ascii')
+
+def test_stale_precompressed_sibling_is_ignored(harness):
+    make_precompressed(harness)
+    fspath = harness.fs.www.resolve('style.css')
+    os.utime(fspath + '.gz', ns=(0, 0))
+    output = harness.hit('/style.css', accept_encoding='gzip')
+    assert output.encoding is None
+
+def test_precompressed_sibling_has_its_own_etag(harness):
+    make_precompressed(harness)
+    etag = harness.hit('/style.css').etag
+    with raises(NotModified):
+        harness.hit('/style.css', if_none_match=etag)
+    output = harness.hit('/style.css', if_none_match=etag, accept_encoding='gzip')
+    assert output.encoding == 'gzip'
+    with raises(NotModified) as x:
+        harness.hit('/style.css', if_none_match=output.etag, accept_encoding='gzip')
+    assert x.value.output.encoding == 'gzip'
+
+def test_precompressed_siblings_are_ignored_by_default(harness):
+    harness.fs.www.mk(('style.css', CSS))
+    fspath = harness.fs.www.resolve('style.css')
+    with open(fspath + '.gz', 'wb') as f:
+        f.write(gzip_compress(CSS.encode('ascii')))
+    output = harness.hit('/style.css', accept_encoding='gzip')
+    assert output.encoding is None
+    assert harness.hit('/style.css.gz').media_type == 'text/css'
+
+
+# Dynamic resources
+
+COUNTING_SIMPLATE = """
+    class Counter:
+        n = 0
+        def __str__(self):
+            Counter.n += 1
+            return str(Counter.n)
+    counter = Counter()
+    [---]
+    output.etag = '"v1"'
+    [---] text/plain
+    Rendered %(counter)s time(s).
+"""
+
+def test_compressed_dynamic_output_is_cached(harness):
+    harness.fs.www.mk(('index.spt', COUNTING_SIMPLATE))
+    harness.hydrate_request_processor(compress_dynamic_output=True)
+    for i in range(3):
+        output = harness.hit('/', accept_encoding='gzip')
+        assert output.encoding == 'gzip'
+        assert output.etag == '"v1-gzip"'
+        assert gzip.decompress(output.body) == b'Rendered 1 time(s).\n'
+    # Clients that don't accept gzip get uncompressed output
+    output = harness.hit('/')
+    assert output.encoding is None
+    assert output.body == b'Rendered 2 time(s).\n'
+    # The compressed output has its own etag
+    with raises(NotModified):
+        harness.hit('/', if_none_match='"v1-gzip"', accept_encoding='gzip')
+
+def test_dynamic_output_isnt_compressed_by_default(harness):
+    harness.fs.www.mk(('index.spt', COUNTING_SIMPLATE))
+    output = harness.hit('/', accept_encoding='gzip')
+    assert output.encoding is None
+    assert output.etag == '"v1"'
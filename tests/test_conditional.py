@@ -0,0 +1,132 @@
+from pytest import raises
+
+from aspen.exceptions import NotModified
+from aspen.http.conditional import Conditions
+
+
+LAST_MODIFIED = 'Sun, 06 Nov 1994 08:49:37 GMT'
+LAST_MODIFIED_TS = 784111777
+
+
+# Conditions
+
+def test_conditions_are_false_without_headers():
+    assert not Conditions()
+    assert not Conditions(None, 'not a date')
+
+def test_if_none_match_uses_weak_comparison():
+    conditions = Conditions('"foo", W/"bar"')
+    assert conditions.is_not_modified('"foo"', None)
+    assert conditions.is_not_modified('W/"foo"', None)
+    assert conditions.is_not_modified('"bar"', None)
+    assert not conditions.is_not_modified('"baz"', None)
+    assert not conditions.is_not_modified(None, None)
+
+def test_if_none_match_star_matches_any_etag():
+    assert Conditions('*').is_not_modified('"foo"', None)
+    assert Conditions('*').is_not_modified(None, None)
+
+def test_if_modified_since_compares_timestamps():
+    conditions = Conditions(None, LAST_MODIFIED)
+    assert conditions.is_not_modified(None, LAST_MODIFIED_TS)
+    assert conditions.is_not_modified(None, LAST_MODIFIED_TS - 1)
+    assert not conditions.is_not_modified(None, LAST_MODIFIED_TS + 1)
+    assert not conditions.is_not_modified('"foo"', None)
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    conditions = Conditions('"foo"', LAST_MODIFIED)
+    assert not conditions.is_not_modified('"bar"', LAST_MODIFIED_TS)
+
+
+# Static files
+
+def test_static_output_carries_validators(harness):
+    output = harness.simple('Greetings, program!', 'index.html')
+    fspath = harness.fs.www.resolve('index.html')
+    node = harness.request_processor.get_file_node(fspath)
+    assert output.etag == '"%x-%x"' % (node.mtime_ns, node.size)
+    assert output.last_modified == node.mtime_ns // 1000000000
+
+def test_static_etag_can_be_a_digest(harness):
+    output = harness.simple(
+        'Greetings, program!', 'index.html',
+        request_processor_configuration={'static_etags': 'digest'},
+    )
+    digest = '53e98d5dd08ef9cd56b85f5829a5ac13140372dea83076a2411ac913ccb3f775'
+    assert output.etag == '"%s"' % digest
+
+def test_static_etag_can_be_disabled(harness):
+    output = harness.simple(
+        'Greetings, program!', 'index.html',
+        request_processor_configuration={'static_etags': None},
+    )
+    assert output.etag is None
+
+def test_static_file_isnt_read_when_not_modified(harness, monkeypatch):
+    etag = harness.simple('Greetings, program!', 'index.html').etag
+    monkeypatch.setattr('aspen.http.resource.open_resource', None)
+    with raises(NotModified) as x:
+        harness.hit('/', if_none_match=etag)
+    assert x.value.output.body is None
+    assert x.value.output.etag == etag
+    assert x.value.output.media_type == 'text/html'
+
+def test_static_file_is_sent_when_modified(harness):
+    harness.simple('Greetings, program!', 'index.html')
+    output = harness.hit('/', if_none_match='"foo"', if_modified_since=LAST_MODIFIED)
+    assert output.body == b'Greetings, program!'
+
+def test_static_file_honors_if_modified_since(harness):
+    harness.simple('Greetings, program!', 'index.html')
+    with raises(NotModified):
+        harness.hit('/', if_modified_since='Thu, 01 Jan 2199 00:00:00 GMT')
+
+
+# Dynamic resources
+
+def test_simplate_can_provide_validators_to_skip_rendering(harness):
+    harness.fs.www.mk(('index.html.spt', """
+        [---]
+        output.etag = '"v1"'
+        [---] via stdlib_format
+        {nope}
+    """))
+    with raises(NotModified) as x:
+        harness.hit('/', if_none_match='"v1"')
+    assert x.value.output.etag == '"v1"'
+    assert x.value.output.body is None
+    # A stale client gets the full output
+    with raises(KeyError):
+        harness.hit('/', if_none_match='"v0"')
+
+def test_simplate_variables_dont_shadow_the_request_state(harness):
+    harness.fs.www.mk(('index.html.spt', """
+        conditions = ['a']
+        metadata_only = True
+        accept_gzip = True
+        [---]
+        output.etag = '"v1"'
+        [---] via stdlib_format
+        {conditions} {metadata_only}
+    """))
+    output = harness.hit('/', if_none_match='"v0"')
+    assert output.body == b"['a'] True\n"
+    assert output.encoding is None
+    with raises(NotModified):
+        harness.hit('/', if_none_match='"v1"')
+
+def test_dynamic_etags_hash_the_output(harness):
+    output = harness.simple(
+        '[---]\n[---]\nGreetings, program!', 'index.html.spt',
+        request_processor_configuration={'dynamic_etags': True},
+    )
+    assert output.etag == '"%s"' % (
+        '53e98d5dd08ef9cd56b85f5829a5ac13140372dea83076a2411ac913ccb3f775'
+    )
+    with raises(NotModified) as x:
+        harness.hit('/', if_none_match=output.etag)
+    assert x.value.output.body is None
+
+def test_dynamic_etags_are_off_by_default(harness):
+    output = harness.simple('[---]\n[---]\nGreetings, program!', 'index.html.spt')
+    assert output.etag is None
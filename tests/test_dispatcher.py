@@ -6,7 +6,8 @@ from filesystem_tree import FilesystemTree
 from aspen.exceptions import SlugCollision, WildcardCollision
 from aspen.http.request import Path
 from aspen.request_processor.dispatcher import (
-    DISPATCHER_CLASSES, DispatchStatus, legacy_collision_handler
+    DISPATCHER_CLASSES, DispatchStatus, HybridDispatcher, UserlandDispatcher,
+    legacy_collision_handler,
 )
 
 
@@ -85,6 +86,51 @@ def test_dispatcher_returns_unindexed_for_unindexed_directory(dispatcher_class):
     assert r.status == DispatchStatus.unindexed
     assert r.match == www.root + os.path.sep
 
+@pytest.mark.parametrize('dispatcher_class', [HybridDispatcher, UserlandDispatcher])
+def test_dispatcher_collects_file_metadata(dispatcher_class):
+    www = FilesystemTree()
+    www.mk(('index.html', 'Greetings, program!'), ('%foo/bar.spt', '[---]\n[---]\n'))
+    dispatcher = dispatcher_class(
+        www_root=www.root,
+        is_dynamic=lambda n: n.endswith('.spt'),
+        indices=['index.html'],
+        typecasters={},
+        guess_media_type=lambda fspath: 'text/html',
+    )
+    dispatcher.build_dispatch_tree()
+    static = dispatcher.file_nodes[www.resolve('index.html')]
+    st = os.stat(static.fspath)
+    assert (static.size, static.mtime_ns) == (19, st.st_mtime_ns)
+    assert static.media_type == 'text/html'
+    expected = '53e98d5dd08ef9cd56b85f5829a5ac13140372dea83076a2411ac913ccb3f775'
+    assert static.digest == expected
+    dynamic = dispatcher.file_nodes[www.resolve('%foo/bar.spt')]
+    assert (dynamic.type, dynamic.size, dynamic.media_type) == ('dynamic', 12, None)
+    # Updating the node resets the digest
+    www.mk(('index.html', 'Greetings, user!'))
+    static.update(os.stat(static.fspath))
+    assert static.size == 16
+    assert static.digest != expected
+
+@pytest.mark.parametrize('dispatcher_class', [HybridDispatcher, UserlandDispatcher])
+def test_dispatcher_skips_broken_symlinks(dispatcher_class):
+    www = FilesystemTree()
+    www.mk(('index.html', 'Greetings, program!'))
+    try:
+        os.symlink('missing', www.resolve('broken.html'))
+    except (NotImplementedError, OSError):
+        pytest.skip("symlinks aren't supported")
+    dispatcher = dispatcher_class(
+        www_root=www.root,
+        is_dynamic=lambda n: n.endswith('.spt'),
+        indices=['index.html'],
+        typecasters={},
+    )
+    dispatcher.build_dispatch_tree()
+    assert www.resolve('broken.html') not in dispatcher.file_nodes
+    assert dispatcher.dispatch('/broken.html', ['broken.html']).status == DispatchStatus.missing
+    assert dispatcher.dispatch('/', ['']).status == DispatchStatus.okay
+
 def test_dispatch_when_filesystem_has_been_modified():
     # Create an empty www_root
     www = FilesystemTree()
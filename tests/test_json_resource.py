@@ -1,7 +1,16 @@
+import datetime
+import decimal
 import io
 
-from pytest import raises
+from pytest import fixture, mark, raises
 
+try:
+    import dataclasses
+except ImportError:
+    # Python < 3.7
+    dataclasses = None
+
+from aspen.output import Output, encode_chunks
 from aspen.simplates import json_
 
 
@@ -151,6 +160,254 @@ def test_aspen_json_dumps_dumps():
     actual = json_.dumps({'cheese': 'puffs'})
     assert actual == '''{\n    "cheese": "puffs"\n}'''
 
+
+# compact
+
+def available_backends():
+    backends = []
+    for name in json_.COMPACT_BACKENDS:
+        try:
+            json_.COMPACT_BACKENDS[name]()
+        except (ImportError, TypeError):
+            continue
+        backends.append(name)
+    return backends
+
+@fixture(params=available_backends())
+def compact_backend(request):
+    previous = json_.compact_backend
+    json_.select_compact_backend(request.param)
+    yield request.param
+    json_.select_compact_backend(previous)
+
+def test_json_can_be_compact(harness, compact_backend):
+    actual = harness.simple(
+        "[---]\n[---] application/json\n{'b': [1, 2], 'a': 'program!'}",
+        filepath="foo.json.spt",
+        request_processor_configuration={'json_compact': True},
+    ).text
+    assert actual == '{"b":[1,2],"a":"program!"}'
+
+def test_json_compactness_is_per_page_configurable(harness):
+    SPT = """
+        json_compact = %s
+        [---]
+        [---] application/json
+        {'Greetings': 'program!'}
+    """
+    actual = harness.simple(SPT % 'True', filepath="foo.json.spt").text
+    assert actual == '{"Greetings":"program!"}'
+    actual = harness.simple(
+        SPT % 'False', filepath="bar.json.spt",
+        request_processor_configuration={'json_compact': True},
+    ).text
+    assert actual == '{\n    "Greetings": "program!"\n}'
+
+def test_compact_jsonp(harness):
+    harness.hydrate_request_processor(json_compact=True)
+    actual = harness.simple(
+        JSONP_SIMPLATE, filepath="index.spt", querystring="jsonp=foo",
+    ).text
+    assert actual == '/**/ foo({"Greetings":"program!"});'
+
+def test_compact_json_uses_registered_encoders(compact_backend):
+    obj = {
+        'complex': complex(1, 2),
+        'datetime': datetime.datetime(2011, 5, 9, 0, 0),
+        'date': datetime.date(2011, 5, 9),
+        'time': datetime.time(12, 30),
+    }
+    assert json_.loads(json_.dumps_compact(obj)) == {
+        'complex': [1.0, 2.0],
+        'datetime': '2011-05-09T00:00:00',
+        'date': '2011-05-09',
+        'time': '12:30:00',
+    }
+
+def test_compact_json_handles_unicode_and_slashes(compact_backend):
+    actual = json_.dumps_compact({'url': '/foo/bar', 'text': '\u2603'})
+    assert json_.loads(actual) == {'url': '/foo/bar', 'text': '\u2603'}
+    assert '\\/' not in actual
+
+def test_compact_json_handles_int_keys_and_big_ints(compact_backend):
+    actual = json_.dumps_compact({1: 2 ** 70})
+    assert json_.loads(actual) == {'1': 2 ** 70}
+
+def test_compact_json_raises_TypeError_on_unknown_types(compact_backend):
+    class Foo:
+        pass
+    with raises(TypeError):
+        json_.dumps_compact({'foo': Foo()})
+
+def test_selecting_an_unknown_compact_backend_fails():
+    with raises(ValueError):
+        json_.select_compact_backend('simdjson')
+
+def test_compact_backend_is_autodetected():
+    previous = json_.compact_backend
+    try:
+        assert json_.select_compact_backend() == available_backends()[0]
+    finally:
+        json_.select_compact_backend(previous)
+
+
+# encoder resolution
+
+class MyDatetime(datetime.datetime):
+    pass
+
+class Money(decimal.Decimal):
+    pass
+
+if dataclasses is not None:
+    @dataclasses.dataclass
+    class Point:
+        x: int
+        y: int
+
+class Slotted:
+    __slots__ = ('name', 'tags', '_secret')
+
+    def __init__(self, name, tags=None):
+        self.name = name
+        if tags is not None:
+            self.tags = tags
+        self._secret = 'hunter2'
+
+class SlottedChild(Slotted):
+    __slots__ = ('extra',)
+
+class Dicted(Slotted):
+    pass
+
+@fixture
+def decimal_encoder():
+    json_.register_encoder(decimal.Decimal, str)
+    yield
+    json_.unregister_encoder(decimal.Decimal)
+
+def test_encoders_apply_to_subclasses():
+    obj = [MyDatetime(2011, 5, 9, 0, 0)]
+    assert json_.dumps(obj, indent=None) == '["2011-05-09T00:00:00"]'
+    assert json_.dumps_compact(obj) == '["2011-05-09T00:00:00"]'
+
+def test_encoder_resolution_is_memoized_and_invalidated(decimal_encoder):
+    assert json_.find_encoder(Money) is str
+    assert json_.dumps_compact([Money('1.10')]) == '["1.10"]'
+    json_.register_encoder(Money, float)
+    try:
+        assert json_.find_encoder(Money) is float
+        assert json_.dumps_compact([Money('1.10')]) == '[1.1]'
+    finally:
+        json_.unregister_encoder(Money)
+    assert json_.find_encoder(Money) is str
+
+def test_unregistering_an_encoder_invalidates_the_cache():
+    json_.register_encoder(decimal.Decimal, str)
+    assert json_.find_encoder(Money) is str
+    json_.unregister_encoder(decimal.Decimal)
+    assert json_.find_encoder(Money) is None
+    with raises(TypeError):
+        json_.dumps_compact([Money('1')])
+
+@mark.skipif(dataclasses is None, reason="dataclasses aren't available")
+def test_dataclasses_are_encoded(compact_backend):
+    actual = json_.loads(json_.dumps_compact([Point(1, 2)]))
+    assert actual == [{'x': 1, 'y': 2}]
+    assert json_.loads(json_.dumps([Point(1, 2)])) == [{'x': 1, 'y': 2}]
+
+def test_slotted_objects_are_encoded(compact_backend):
+    obj = [Slotted('foo', ['a']), Slotted('bar'), SlottedChild('baz')]
+    assert json_.loads(json_.dumps_compact(obj)) == [
+        {'name': 'foo', 'tags': ['a']}, {'name': 'bar'}, {'name': 'baz'},
+    ]
+
+def test_objects_with_a_dict_arent_encoded_automatically():
+    assert json_.find_encoder(Dicted) is None
+    with raises(TypeError):
+        json_.dumps(Dicted('foo'))
+
+
+# streaming
+
+BIG_SIMPLATE = """
+    [---]
+    [---] application/json
+    {'items': [{'id': i, 'name': 'item %i' % i} for i in range(1000)]}
+"""
+
+def test_json_can_be_streamed(harness):
+    harness.fs.www.mk(('foo.json.spt', BIG_SIMPLATE))
+    harness.hydrate_request_processor(json_stream=True, json_stream_chunk_size=1024)
+    output = harness.hit('/foo.json')
+    assert output.is_streamed
+    assert output.content_length is None
+    assert output.text is None
+    chunks = list(output.body)
+    assert len(chunks) > 10
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    assert all(len(chunk) >= 1024 for chunk in chunks[:-1])
+    expected = json_.dumps({'items': [{'id': i, 'name': 'item %i' % i} for i in range(1000)]})
+    assert b''.join(chunks) == expected.encode('ascii')
+
+def test_json_streaming_is_per_page_configurable(harness):
+    output = harness.simple(
+        "json_stream = True\n[---]\n[---] application/json\n{'Greetings': 'program!'}",
+        filepath="foo.json.spt",
+    )
+    assert output.is_streamed
+    assert b''.join(output.body) == b'{\n    "Greetings": "program!"\n}'
+
+def test_compact_json_can_be_streamed(harness):
+    output = harness.simple(
+        "[---]\n[---] application/json\n{'b': 1, 'a': ['\u2603']}",
+        filepath="foo.json.spt",
+        request_processor_configuration={'json_stream': True, 'json_compact': True},
+    )
+    assert b''.join(output.body) == b'{"b":1,"a":["\\u2603"]}'
+
+def test_jsonp_can_be_streamed(harness):
+    harness.hydrate_request_processor(json_stream=True, json_compact=True)
+    output = harness.simple(JSONP_SIMPLATE, filepath="index.spt", querystring="callback=foo")
+    assert output.is_streamed
+    assert b''.join(output.body) == b'/**/ foo({"Greetings":"program!"});'
+
+def test_streamed_json_isnt_compressed(harness):
+    harness.fs.www.mk(('foo.json.spt', """
+        [---]
+        output.etag = '"foo"'
+        [---] application/json
+        {'Greetings': 'program!'}
+    """))
+    harness.hydrate_request_processor(json_stream=True, compress_dynamic_output=True)
+    output = harness.hit('/foo.json', accept_encoding='gzip')
+    assert output.encoding is None
+    assert output.etag == '"foo"'
+    assert b''.join(output.body) == b'{\n    "Greetings": "program!"\n}'
+
+def test_streamed_json_doesnt_get_a_dynamic_etag(harness):
+    harness.fs.www.mk(('foo.json.spt', BIG_SIMPLATE))
+    harness.hydrate_request_processor(json_stream=True, dynamic_etags=True)
+    output = harness.hit('/foo.json')
+    assert output.etag is None
+    output.close()
+
+def test_closing_a_streamed_output_closes_the_iterator():
+    closed = []
+
+    def chunks():
+        try:
+            yield 'foo'
+            yield 'bar'
+        finally:
+            closed.append(True)
+
+    output = Output(body=encode_chunks(chunks(), 'ascii'))
+    assert next(output.body) == b'foo'
+    output.close()
+    assert closed == [True]
+
+
 # jsonp
 
 JSONP_SIMPLATE = """
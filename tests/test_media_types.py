@@ -0,0 +1,102 @@
+import json
+import mimetypes
+import os
+
+from pytest import raises
+
+from aspen.request_processor.media_types import MediaTypeIndex
+
+
+def test_index_includes_bundled_types(harness):
+    media_types = harness.request_processor.media_types
+    assert media_types.guess_type('foo.py') == 'text/plain'
+    assert media_types.guess_type('foo.ico') == 'image/x-icon'
+    assert media_types.guess_type('foo.css') == 'text/css'
+    assert media_types.guess_type('foo.unknown') is None
+    assert '.json' in media_types.guess_extensions('application/json')
+
+def test_index_includes_project_types(harness):
+    harness.fs.project.mk(('mime.types', 'text/x-foo    foo\n'))
+    harness.fs.www.mk(('bar.foo', 'bar'))
+    assert harness.request_processor.media_types.guess_type('a.foo') == 'text/x-foo'
+    assert harness.hit('/bar.foo').media_type == 'text/x-foo'
+
+def test_overrides_take_precedence(harness):
+    harness.fs.project.mk(('mime.types', 'text/x-foo    foo\n'))
+    rp = harness.hydrate_request_processor(
+        media_type_overrides={'foo': 'text/x-bar', '.py': 'text/x-python'},
+    )
+    assert rp.media_types.guess_type('a.foo') == 'text/x-bar'
+    assert rp.media_types.guess_type('a.py') == 'text/x-python'
+
+def test_index_is_frozen(harness):
+    media_types = harness.request_processor.media_types
+    with raises(TypeError):
+        media_types.types_map['.foo'] = 'text/x-foo'
+
+def test_index_is_memoized(harness):
+    rp1 = harness.hydrate_request_processor()
+    rp2 = harness.hydrate_request_processor(media_type_overrides={})
+    assert rp1.media_types is rp2.media_types
+    rp3 = harness.hydrate_request_processor(media_type_overrides={'foo': 'text/x-foo'})
+    assert rp3.media_types is not rp1.media_types
+
+def test_index_is_cached_on_disk(harness, monkeypatch):
+    cache_fspath = harness.fs.project.resolve('media_types.json')
+    files = [harness.fs.project.resolve('mime.types')]
+    harness.fs.project.mk(('mime.types', 'text/x-foo    foo\n'))
+    index = MediaTypeIndex.load(cache_fspath, files)
+    with open(cache_fspath) as f:
+        assert json.load(f)['types']['.foo'] == 'text/x-foo'
+
+    def fail(*a, **kw):
+        raise AssertionError("the index shouldn't be rebuilt")
+
+    monkeypatch.setattr(MediaTypeIndex, 'build', fail)
+    cached = MediaTypeIndex.load(cache_fspath, files)
+    assert dict(cached.types_map) == dict(index.types_map)
+    assert cached.guess_type('a.tgz') == index.guess_type('a.tgz')
+
+def test_stale_cache_is_rebuilt(harness):
+    cache_fspath = harness.fs.project.resolve('media_types.json')
+    files = [harness.fs.project.resolve('mime.types')]
+    harness.fs.project.mk(('mime.types', 'text/x-foo    foo\n'))
+    MediaTypeIndex.load(cache_fspath, files)
+    harness.fs.project.mk(('mime.types', 'text/x-bar    foo\n'))
+    os.utime(files[0], ns=(0, 0))
+    assert MediaTypeIndex.load(cache_fspath, files).guess_type('a.foo') == 'text/x-bar'
+    index = MediaTypeIndex.load(cache_fspath, files, overrides={'foo': 'text/x-baz'})
+    assert index.guess_type('a.foo') == 'text/x-baz'
+
+def test_corrupt_cache_is_rebuilt(harness):
+    harness.fs.project.mk(('media_types.json', '{"version": 1, "truncated'))
+    cache_fspath = harness.fs.project.resolve('media_types.json')
+    assert MediaTypeIndex.load(cache_fspath).guess_type('a.css') == 'text/css'
+
+def test_request_processor_uses_cache_file(harness):
+    cache_fspath = harness.fs.project.resolve('media_types.json')
+    rp = harness.hydrate_request_processor(
+        media_type_index_cache=cache_fspath, media_type_overrides={'foo': 'text/x-foo'},
+    )
+    assert os.path.exists(cache_fspath)
+    assert rp.media_types.guess_type('a.foo') == 'text/x-foo'
+
+def test_index_includes_the_types_registered_with_add_type(harness, monkeypatch):
+    if not mimetypes.inited:
+        mimetypes.init()
+    # like `mimetypes.add_type('text/x-aspen', '.aspen')`, but undone after the test
+    monkeypatch.setitem(mimetypes.types_map, '.aspen', 'text/x-aspen')
+    assert MediaTypeIndex.build(system_files=False).guess_type('a.aspen') == 'text/x-aspen'
+    rp = harness.hydrate_request_processor(changes_reload=False)
+    assert rp.media_types.guess_type('a.aspen') == 'text/x-aspen'
+    # the memoized index is rebuilt when the registry changes
+    monkeypatch.setitem(mimetypes.types_map, '.aspen', 'text/x-aspen-2')
+    rp = harness.hydrate_request_processor(changes_reload=False)
+    assert rp.media_types.guess_type('a.aspen') == 'text/x-aspen-2'
+
+def test_overrides_take_precedence_over_the_types_registered_with_add_type(monkeypatch):
+    if not mimetypes.inited:
+        mimetypes.init()
+    monkeypatch.setitem(mimetypes.types_map, '.aspen', 'text/x-aspen')
+    index = MediaTypeIndex.build(overrides={'aspen': 'text/x-other'})
+    assert index.guess_type('a.aspen') == 'text/x-other'
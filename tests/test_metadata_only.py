@@ -0,0 +1,121 @@
+from pytest import raises
+
+from aspen.exceptions import NotModified
+
+
+def test_metadata_only_static_file_isnt_read(harness, monkeypatch):
+    harness.fs.www.mk(('foo.css', 'a { color: red; }\n'))
+    harness.hydrate_request_processor()
+    monkeypatch.setattr('builtins.open', None)
+    output = harness.hit('/foo.css', metadata_only=True)
+    assert output.body is None
+    assert output.media_type == 'text/css'
+    assert output.length == output.content_length == 18
+    assert output.etag
+    assert output.last_modified
+
+def test_metadata_only_static_file_stored_in_ram(harness):
+    harness.fs.www.mk(('foo.txt', 'Greetings, program!'))
+    harness.hydrate_request_processor(store_static_files_in_ram=True)
+    output = harness.hit('/foo.txt', metadata_only=True)
+    assert output.body is None
+    assert output.length == 19
+
+def test_metadata_only_static_file_isnt_handed_off(harness):
+    harness.fs.www.mk(('foo.txt', 'Greetings, program!'))
+    harness.hydrate_request_processor(static_file_handoff=True)
+    output = harness.hit('/foo.txt', metadata_only=True, range_header='bytes=0-1')
+    assert output.body is None
+    assert output.length == 19
+
+def test_metadata_only_precompressed_static_file(harness):
+    harness.fs.www.mk(('style.css', 'body { color: black; }\n' * 100))
+    rp = harness.hydrate_request_processor(compress_static_files=True)
+    rp.precompress_static_files()
+    output = harness.hit('/style.css', metadata_only=True, accept_encoding='gzip')
+    assert output.encoding == 'gzip'
+    assert output.length == len(harness.hit('/style.css', accept_encoding='gzip').body)
+
+def test_metadata_only_static_file_not_modified(harness):
+    harness.fs.www.mk(('foo.txt', 'Greetings, program!'))
+    etag = harness.hit('/foo.txt').etag
+    with raises(NotModified):
+        harness.hit('/foo.txt', metadata_only=True, if_none_match=etag)
+
+
+COUNTING_SIMPLATE = """
+    class Counter:
+        n = 0
+        def __str__(self):
+            Counter.n += 1
+            return str(Counter.n)
+    counter = Counter()
+    [---]
+    [---] text/plain
+    Rendered %(counter)s time(s).
+"""
+
+def test_metadata_only_simplate_is_rendered_and_discarded(harness):
+    harness.fs.www.mk(('index.spt', COUNTING_SIMPLATE))
+    output = harness.hit('/', metadata_only=True)
+    assert output.body is None
+    assert output.length == len(b'Rendered 1 time(s).\n')
+    assert harness.hit('/').body == b'Rendered 2 time(s).\n'
+
+def test_metadata_only_simplate_fails_like_a_full_request(harness):
+    harness.fs.www.mk(('index.spt', "[---]\n[---] text/plain\n%(missing)s"))
+    with raises(KeyError):
+        harness.hit('/', metadata_only=True)
+
+def test_metadata_only_simplate_isnt_rendered_when_configured(harness):
+    harness.fs.www.mk(('index.spt', COUNTING_SIMPLATE))
+    harness.hydrate_request_processor(skip_rendering_for_metadata_only=True)
+    output = harness.hit('/', metadata_only=True)
+    assert output.body is None
+    assert output.length is None
+    assert output.media_type == 'text/plain'
+    assert output.charset == 'UTF-8'
+    assert harness.hit('/').body == b'Rendered 1 time(s).\n'
+
+def test_metadata_only_simplate_can_opt_out_of_rendering(harness):
+    harness.fs.www.mk(('index.spt', COUNTING_SIMPLATE.replace(
+        '[---]', 'skip_rendering_for_metadata_only = True\n    [---]', 1
+    )))
+    output = harness.hit('/', metadata_only=True)
+    assert (output.body, output.length) == (None, None)
+
+def test_metadata_only_simplate_runs_page_two(harness):
+    harness.fs.www.mk(('index.spt', """
+        [---]
+        output.etag = '"foo"'
+        output.last_modified = 1234567890
+        [---] text/plain
+        Greetings, program!
+    """))
+    output = harness.hit('/', metadata_only=True)
+    assert output.body is None
+    assert output.etag == '"foo"'
+    assert output.last_modified == 1234567890
+
+def test_metadata_only_simplate_with_body_filled_by_page_two(harness):
+    harness.fs.www.mk(('index.spt', """
+        [---]
+        output.body = 'Greetings, program!'
+        [---] text/plain
+    """))
+    output = harness.hit('/', metadata_only=True)
+    assert output.body is None
+    assert output.length == 19
+    assert output.charset == 'UTF-8'
+
+def test_metadata_only_simplate_is_rendered_for_dynamic_etags(harness):
+    harness.fs.www.mk(('index.spt', """
+        [---]
+        [---] text/plain
+        Greetings, program!
+    """))
+    harness.hydrate_request_processor(dynamic_etags=True)
+    output = harness.hit('/', metadata_only=True)
+    assert output.body is None
+    assert output.length == 20
+    assert output.etag == harness.hit('/').etag
@@ -0,0 +1,150 @@
+import gzip
+
+from pytest import raises
+
+from aspen.exceptions import NotModified
+
+
+STATIC_SIMPLATE = """\
+greeting = 'Greetings'
+[---]
+[---] text/plain via stdlib_format
+{greeting}, program!
+[---] text/html via stdlib_template
+<h1>$greeting, program!</h1>
+[---] text/css via stdlib_percent
+h1:after { content: "%(greeting)s"; }
+"""
+
+
+def get_resource(harness, fspath='index.spt'):
+    return harness.request_processor.resources.get(harness.fs.www.resolve(fspath))
+
+def break_renderers(resource):
+    for media_type in resource.available_types:
+        renderer = resource.renderers[media_type]
+        renderer.render_content = lambda context: 1 / 0
+
+
+def test_request_independent_pages_are_prerendered(harness):
+    harness.fs.www.mk(('index.spt', STATIC_SIMPLATE))
+    harness.hydrate_request_processor(prerender_simplates=True)
+    for accept in ('text/plain', 'text/html', 'text/css'):
+        output = harness.hit('/', accept_header=accept)
+        assert output.media_type == accept
+        assert output.charset == 'UTF-8'
+    resource = get_resource(harness)
+    assert resource.prerendered['text/plain'] == (
+        b'Greetings, program!\n', 'text/plain', 'UTF-8', None
+    )
+    break_renderers(resource)
+    assert harness.hit('/').body == b'Greetings, program!\n'
+    assert harness.hit('/', accept_header='text/html').body == b'<h1>Greetings, program!</h1>\n'
+    assert harness.hit('/', accept_header='text/css').text == 'h1:after { content: "Greetings"; }\n'
+
+def test_pages_are_prerendered_only_when_they_are_first_requested(harness):
+    harness.fs.www.mk(('index.spt', STATIC_SIMPLATE))
+    harness.hydrate_request_processor(prerender_simplates=True)
+    harness.hit('/', accept_header='text/html')
+    assert list(get_resource(harness).prerendered) == ['text/html']
+
+def test_pages_that_use_request_variables_arent_prerendered(harness):
+    harness.fs.www.mk(('index.spt', "[---]\n[---] text/plain via stdlib_format\n{path.raw}"))
+    harness.hydrate_request_processor(prerender_simplates=True)
+    assert harness.hit('/').text == '/'
+    assert get_resource(harness).prerendered == {'text/plain': False}
+    assert harness.hit('/', accept_header='text/plain').text == '/'
+
+def test_pages_with_request_logic_arent_prerendered(harness):
+    harness.fs.www.mk(('index.spt', "x = 0\n[---]\nx = querystring['x']\n[---] text/plain\n%(x)s"))
+    harness.hydrate_request_processor(prerender_simplates=True)
+    assert harness.hit('/', querystring='x=1').text == '1'
+    assert harness.hit('/', querystring='x=2').text == '2'
+    assert get_resource(harness).prerendered == {'text/plain': False}
+
+def test_pages_that_access_attributes_or_items_arent_prerendered(harness):
+    harness.fs.www.mk(('index.spt', "x = 1\n[---]\n[---] text/plain via stdlib_format\n{x.real}"))
+    harness.hydrate_request_processor(prerender_simplates=True)
+    assert harness.hit('/').text == '1'
+    assert get_resource(harness).prerendered == {'text/plain': False}
+
+def test_pages_with_unknown_names_arent_prerendered(harness):
+    harness.fs.www.mk(('index.spt', "[---]\n[---] text/plain via stdlib_percent\n%s"))
+    harness.hydrate_request_processor(prerender_simplates=True)
+    harness.hit('/')
+    assert get_resource(harness).prerendered == {'text/plain': False}
+
+def test_json_pages_arent_prerendered_by_default(harness):
+    harness.fs.www.mk(('index.spt', "x = 1\n[---]\n[---] application/json\n{'x': x}"))
+    harness.hydrate_request_processor(prerender_simplates=True)
+    harness.hit('/')
+    assert get_resource(harness).prerendered == {'application/json': False}
+
+def test_simplates_can_opt_in(harness):
+    harness.fs.www.mk(('index.spt', "prerender = True\n[---]\n[---] application/json\n{'x': 1}"))
+    harness.hit('/')
+    resource = get_resource(harness)
+    break_renderers(resource)
+    output = harness.hit('/')
+    assert output.text == '{\n    "x": 1\n}'
+    assert output.media_type == 'application/json'
+
+def test_simplates_can_opt_out(harness):
+    harness.fs.www.mk(('index.spt', "prerender = False\n[---]\n[---] text/plain\nfoo"))
+    harness.hydrate_request_processor(prerender_simplates=True)
+    harness.hit('/')
+    assert get_resource(harness).prerendered == {'text/plain': False}
+
+def test_prerendering_is_disabled_by_default(harness):
+    harness.fs.www.mk(('index.spt', STATIC_SIMPLATE))
+    harness.hit('/')
+    assert get_resource(harness).prerendered == {'text/plain': False}
+
+def test_pages_arent_prerendered_when_changes_reload_is_on(harness):
+    harness.fs.www.mk(('index.spt', STATIC_SIMPLATE))
+    harness.hydrate_request_processor(prerender_simplates=True, changes_reload=True)
+    harness.hit('/')
+    assert get_resource(harness).prerendered == {'text/plain': False}
+
+def test_prerendered_pages_have_dynamic_etags(harness):
+    harness.fs.www.mk(('index.spt', STATIC_SIMPLATE))
+    harness.hydrate_request_processor(prerender_simplates=True, dynamic_etags=True)
+    etag = harness.hit('/').etag
+    assert etag
+    break_renderers(get_resource(harness))
+    assert harness.hit('/').etag == etag
+    with raises(NotModified):
+        harness.hit('/', if_none_match=etag)
+
+def test_prerendered_pages_are_compressed(harness):
+    harness.fs.www.mk(('index.spt', STATIC_SIMPLATE))
+    harness.hydrate_request_processor(
+        prerender_simplates=True, compress_dynamic_output=True, dynamic_etags=True,
+    )
+    etag = harness.hit('/').etag
+    output = harness.hit('/', accept_encoding='gzip')
+    assert output.encoding == 'gzip'
+    assert output.etag != etag
+    assert gzip.decompress(output.body) == b'Greetings, program!\n'
+    assert harness.hit('/', accept_encoding='gzip').body is output.body
+    head = harness.hit('/', accept_encoding='gzip', metadata_only=True)
+    assert (head.body, head.encoding, head.length) == (None, 'gzip', len(output.body))
+
+def test_metadata_only_requests_are_prerendered(harness):
+    harness.fs.www.mk(('index.spt', STATIC_SIMPLATE))
+    harness.hydrate_request_processor(prerender_simplates=True)
+    output = harness.hit('/', metadata_only=True)
+    assert output.body is None
+    assert get_resource(harness).prerendered['text/plain'][0] == b'Greetings, program!\n'
+
+def test_skipped_metadata_only_requests_dont_prevent_prerendering(harness):
+    harness.fs.www.mk(('index.spt', STATIC_SIMPLATE))
+    harness.hydrate_request_processor(
+        prerender_simplates=True, skip_rendering_for_metadata_only=True,
+    )
+    output = harness.hit('/', metadata_only=True)
+    assert output.body is None
+    assert get_resource(harness).prerendered == {}
+    harness.hit('/')
+    output = harness.hit('/', metadata_only=True)
+    assert (output.body, output.length) == (None, len(b'Greetings, program!\n'))
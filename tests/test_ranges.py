@@ -0,0 +1,41 @@
+from pytest import raises
+
+from aspen.exceptions import RangeNotSatisfiable
+from aspen.http.ranges import parse_byte_ranges
+
+
+def test_parse_byte_ranges_parses_a_single_range():
+    assert parse_byte_ranges('bytes=0-499', 1000) == [(0, 500)]
+
+def test_parse_byte_ranges_parses_multiple_ranges():
+    actual = parse_byte_ranges('bytes=0-99, 200-299,,-100', 1000)
+    assert actual == [(0, 100), (200, 100), (900, 100)]
+
+def test_parse_byte_ranges_parses_open_ended_range():
+    assert parse_byte_ranges('bytes=900-', 1000) == [(900, 100)]
+
+def test_parse_byte_ranges_truncates_ranges_to_size():
+    assert parse_byte_ranges('bytes=900-5000', 1000) == [(900, 100)]
+    assert parse_byte_ranges('bytes=-5000', 1000) == [(0, 1000)]
+
+def test_parse_byte_ranges_skips_unsatisfiable_ranges():
+    assert parse_byte_ranges('bytes=5000-6000, 0-0', 1000) == [(0, 1)]
+
+def test_parse_byte_ranges_ignores_other_units():
+    assert parse_byte_ranges('items=0-9', 1000) is None
+
+def test_parse_byte_ranges_ignores_invalid_ranges():
+    assert parse_byte_ranges('bytes=', 1000) is None
+    assert parse_byte_ranges('bytes=-', 1000) is None
+    assert parse_byte_ranges('bytes=5-4', 1000) is None
+    assert parse_byte_ranges('bytes=a-b', 1000) is None
+    assert parse_byte_ranges('bytes=١-٢', 1000) is None
+
+def test_parse_byte_ranges_raises_RangeNotSatisfiable():
+    with raises(RangeNotSatisfiable) as x:
+        parse_byte_ranges('bytes=1000-', 1000)
+    assert x.value.size == 1000
+
+def test_parse_byte_ranges_raises_RangeNotSatisfiable_for_empty_suffix():
+    with raises(RangeNotSatisfiable):
+        parse_byte_ranges('bytes=-0', 1000)
@@ -1,7 +1,19 @@
+import io
+import os
+import sys
+import traceback
+import types
+from string import Template
+
 from pytest import raises
 
+from aspen.exceptions import AttemptedBreakout
+from aspen.output import Output, Stream
 from aspen.simplates import json_
+from aspen.simplates import renderers
 from aspen.simplates.renderers import Factory, Renderer
+from aspen.simplates.renderers.stdlib_format import FormatTemplate
+from aspen.simplates.renderers.stdlib_template import CompiledTemplate
 from aspen.simplates.simplate import Simplate
 
 
@@ -91,3 +103,419 @@ def test_renderer_padding_achieves_correct_line_numbers_in_tracebacks(harness):
     '''))
     actual = str(raises(ValueError, harness.hit, '/').value)
     assert 'line 3' in actual
+
+BUILTIN_RENDERERS_SIMPLATE = '''\
+[---]
+[---] application/json via json_dump
+"x"
+[---] text/plain via stdlib_format
+"x"
+[---] text/html via stdlib_percent
+"x"
+[---] text/css via stdlib_template
+"x"
+'''
+
+def test_builtin_renderers_dont_pad_their_content(harness):
+    harness.fs.www.mk(('index.spt', BUILTIN_RENDERERS_SIMPLATE))
+    request_processor = harness.request_processor
+    resource = request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    assert len(resource.available_types) == 4
+    for media_type in resource.available_types:
+        renderer = resource.renderers[media_type]
+        assert renderer.padded == renderer.raw == '"x"\n'
+        result = renderer({'output': Output(), 'request_processor': request_processor})
+        assert result.strip('"\n') == 'x'
+
+def test_builtin_renderers_dont_keep_the_source_in_memory(harness):
+    harness.fs.www.mk(('index.spt', BUILTIN_RENDERERS_SIMPLATE))
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    for media_type in resource.available_types:
+        renderer = resource.renderers[media_type]
+        assert 'raw' not in renderer.__dict__
+        assert 'padded' not in renderer.__dict__
+    harness.fs.www.mk(('index.spt', BUILTIN_RENDERERS_SIMPLATE.replace('"x"', '"y"')))
+    # without `changes_reload` the cached source is only dropped when it's evicted
+    harness.request_processor.resources.sources.clear()
+    assert resource.renderers['text/plain'].raw == '"y"\n'
+
+def test_content_pages_are_read_again_when_theyre_compiled(harness):
+    harness.fs.www.mk(('index.spt', BUILTIN_RENDERERS_SIMPLATE))
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    pages = resource.renderers.pages
+    default, others = resource.available_types[0], resource.available_types[1:]
+    assert pages[default][1].content is not None
+    assert all(pages[media_type][1].content is None for media_type in others)
+    output = harness.hit('/index.txt')
+    assert output.text == '"x"\n'
+    assert 'text/plain' not in pages
+
+def test_page_source_is_cached_until_the_file_changes(harness, monkeypatch):
+    harness.fs.www.mk(('index.spt', BUILTIN_RENDERERS_SIMPLATE))
+    harness.hydrate_request_processor(changes_reload=True)
+    fspath = harness.fs.www.resolve('index.spt')
+    resource = harness.request_processor.resources.get(fspath)
+    renderer = resource.renderers['text/plain']
+    assert renderer.raw == '"x"\n'
+    monkeypatch.setattr('tokenize.open', None)
+    assert renderer.raw == '"x"\n'
+    monkeypatch.undo()
+    harness.fs.www.mk(('index.spt', BUILTIN_RENDERERS_SIMPLATE.replace('"x"', '"y"')))
+    os.utime(fspath, ns=(0, 0))
+    assert renderer.raw == '"y"\n'
+
+def test_page_source_is_read_through_the_resource_path_checks(harness, monkeypatch):
+    harness.fs.www.mk(('index.spt', BUILTIN_RENDERERS_SIMPLATE))
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    harness.request_processor.resources.sources.clear()
+
+    def check_resource_path(request_processor, fspath):
+        raise AttemptedBreakout(fspath, '/elsewhere')
+
+    monkeypatch.setattr('aspen.http.resource.check_resource_path', check_resource_path)
+    with raises(AttemptedBreakout):
+        resource.renderers['text/plain'].raw
+
+def test_page_source_is_found_after_it_moves(harness):
+    harness.fs.www.mk(('index.spt', BUILTIN_RENDERERS_SIMPLATE))
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    renderer = resource.renderers['text/plain']
+    harness.fs.www.mk(('index.spt', 'x = 1\n' + BUILTIN_RENDERERS_SIMPLATE.replace('"x"', '"y"')))
+    harness.request_processor.resources.sources.clear()
+    assert renderer.raw == '"y"\n'
+    harness.fs.www.mk(('index.spt', '[---]\n[---] text/html\n'))
+    harness.request_processor.resources.sources.clear()
+    with raises(LookupError):
+        renderer.raw
+
+def test_renderers_keep_the_source_in_memory_by_default(harness):
+    class TestFactory(Factory):
+        Renderer = Renderer
+
+    renderer = TestFactory(harness.request_processor)('nonexistent.spt', 'foo', 'text/plain', 2)
+    assert renderer.raw == 'foo'
+    assert renderer.padded == '\n\nfoo'
+    assert 'padded' not in renderer.__dict__
+
+def test_unpadded_output_is_returned_as_is(harness):
+    class TestRenderer(Renderer):
+        padding = False
+
+        def render_content(self, context):
+            return context['result']
+
+    class TestFactory(Factory):
+        Renderer = TestRenderer
+
+    renderer = TestFactory(harness.request_processor)('index.spt', 'foo', 'text/plain', 2)
+    result = '\n\nfoo'
+    assert renderer({'result': result}) is result
+
+
+# recompilation under changes_reload
+
+def make_counting_factory(meta_dependencies=None, page_dependencies=None):
+    counts = {'meta': 0, 'page': 0}
+
+    class TestRenderer(Renderer):
+
+        def compile(self, filepath, padded):
+            counts['page'] += 1
+            return padded
+
+        def get_dependencies(self):
+            return page_dependencies
+
+    class TestFactory(Factory):
+        Renderer = TestRenderer
+
+        def compile_meta(self, configuration):
+            counts['meta'] += 1
+
+        def get_dependencies(self):
+            return meta_dependencies
+
+    return TestFactory, counts
+
+def test_builtin_renderers_arent_recompiled_when_nothing_changed(harness):
+    harness.hydrate_request_processor(changes_reload=True)
+    harness.simple('[---]\nx = 1\n[---] text/plain via stdlib_format\n{x}', 'index.spt')
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    compiled = resource.renderers['text/plain'].compiled
+    assert harness.hit('/').text == '1'
+    assert resource.renderers['text/plain'].compiled is compiled
+
+def test_renderers_without_dependencies_are_recompiled_every_time(harness):
+    TestFactory, counts = make_counting_factory()
+    try:
+        Simplate.renderer_factories['x'] = TestFactory(
+            harness.hydrate_request_processor(changes_reload=True)
+        )
+        harness.simple("[---]\n[---] text/plain via x\nfoo", 'index.spt')
+        harness.hit('/')
+        assert counts == {'meta': 4, 'page': 3}
+    finally:
+        del Simplate.renderer_factories['x']
+
+def test_renderers_are_recompiled_when_a_dependency_changes(harness):
+    harness.fs.project.mk(('meta.conf', ''), ('page.inc', ''))
+    meta_dependency = harness.fs.project.resolve('meta.conf')
+    page_dependency = harness.fs.project.resolve('page.inc')
+    TestFactory, counts = make_counting_factory([meta_dependency], [page_dependency])
+    try:
+        Simplate.renderer_factories['x'] = TestFactory(
+            harness.hydrate_request_processor(changes_reload=True)
+        )
+        harness.simple("[---]\n[---] text/plain via x\nfoo", 'index.spt')
+        harness.hit('/')
+        assert counts == {'meta': 1, 'page': 1}
+        os.utime(page_dependency, ns=(0, 0))
+        harness.hit('/')
+        harness.hit('/')
+        assert counts == {'meta': 1, 'page': 2}
+        os.utime(meta_dependency, ns=(0, 0))
+        harness.hit('/')
+        harness.hit('/')
+        assert counts == {'meta': 2, 'page': 3}
+    finally:
+        del Simplate.renderer_factories['x']
+
+def test_renderers_arent_recompiled_without_changes_reload(harness):
+    TestFactory, counts = make_counting_factory()
+    try:
+        Simplate.renderer_factories['x'] = TestFactory(harness.request_processor)
+        harness.simple("[---]\n[---] text/plain via x\nfoo", 'index.spt')
+        harness.hit('/')
+        assert counts == {'meta': 1, 'page': 1}
+    finally:
+        del Simplate.renderer_factories['x']
+
+
+# discovery
+
+class FakeEntryPoint:
+
+    def __init__(self, name, module):
+        self.name = name
+        self.module = module
+
+    def load(self):
+        return self.module
+
+
+def test_renderer_factories_are_created_lazily(harness):
+    harness.simple("[---]\n[---] text/plain via stdlib_format\nGreetings, program!")
+    assert sorted(Simplate.renderer_factories) == ['stdlib_format']
+
+def test_load_all_creates_all_the_factories(harness):
+    harness.hydrate_request_processor()
+    factories = Simplate.renderer_factories.load_all()
+    assert sorted(factories) == renderers.renderer_names()
+    assert set(renderers.BUILTIN_RENDERERS) <= set(factories)
+
+def test_unknown_renderer_errors_list_available_renderers(harness):
+    harness.fs.www.mk(('index.spt', "[---]\n[---] text/plain via glubber\nfoo"))
+    message = str(raises(ValueError, harness.hit, '/').value)
+    assert message.startswith("Unknown renderer for text/plain: glubber.")
+    assert 'stdlib_template' in message
+
+def test_renderers_are_discovered_through_entry_points(harness, monkeypatch):
+    class PluginRenderer(Renderer):
+        def render_content(self, context):
+            return 'plugged in'
+
+    class PluginFactory(Factory):
+        Renderer = PluginRenderer
+
+    module = type(sys)('aspen_plugin')
+    module.Factory = PluginFactory
+    monkeypatch.setattr(renderers, '_plugins', None)
+    monkeypatch.setattr(
+        renderers, 'iter_entry_points',
+        lambda group: [FakeEntryPoint('plugin', module)] if group == 'aspen.renderers' else [],
+    )
+    assert 'plugin' in renderers.renderer_names()
+    assert 'plugin' in renderers.RENDERERS
+    output = harness.simple("[---]\n[---] text/plain via plugin\nfoo")
+    assert output.text == 'plugged in'
+    assert isinstance(Simplate.renderer_factories['plugin'], PluginFactory)
+
+def test_plugins_override_builtin_renderers(harness, monkeypatch):
+    class PluginFactory(Factory):
+        class Renderer(Renderer):
+            def render_content(self, context):
+                return 'overridden'
+
+    module = type(sys)('aspen_plugin')
+    module.Factory = PluginFactory
+    monkeypatch.setattr(renderers, '_plugins', None)
+    monkeypatch.setattr(
+        renderers, 'iter_entry_points',
+        lambda group: [FakeEntryPoint('stdlib_format', module)],
+    )
+    output = harness.simple("[---]\n[---] text/plain via stdlib_format\nfoo")
+    assert output.text == 'overridden'
+
+def test_iter_entry_points_doesnt_import_pkg_resources(monkeypatch):
+    monkeypatch.delitem(sys.modules, 'pkg_resources', raising=False)
+    assert isinstance(renderers.iter_entry_points('aspen.renderers'), list)
+    assert 'pkg_resources' not in sys.modules
+
+
+# json_dump
+
+def test_json_dump_compiles_its_expression_once(harness):
+    harness.fs.www.mk(('index.spt', "[---]\n[---] application/json\n{'foo': 'bar'}"))
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    assert isinstance(resource.renderers['application/json'].compiled, types.CodeType)
+    assert harness.hit('/').text == '{\n    "foo": "bar"\n}'
+
+def test_json_dump_tracebacks_have_correct_line_numbers(harness):
+    harness.fs.www.mk(('index.spt', '''\
+    [---]
+    [---] application/json
+    {'foo':
+        1 / 0}
+    '''))
+    tb = raises(ZeroDivisionError, harness.hit, '/').tb
+    frame = traceback.extract_tb(tb)[-1]
+    assert frame.filename == harness.fs.www.resolve('index.spt')
+    assert frame.lineno == 4
+
+def test_json_dump_tracebacks_have_correct_line_numbers_in_nested_scopes(harness):
+    harness.fs.www.mk(('index.spt', '''\
+    [---]
+    [---] application/json
+    [
+        1 / x for x in [1, 0]
+    ]
+    '''))
+    tb = raises(ZeroDivisionError, harness.hit, '/').tb
+    assert traceback.extract_tb(tb)[-1].lineno == 4
+
+def test_json_dump_syntax_errors_have_correct_line_numbers(harness):
+    harness.fs.www.mk(('index.spt', "[---]\n[---] application/json\n{'foo': }"))
+    error = raises(SyntaxError, harness.hit, '/').value
+    assert error.lineno == 3
+
+
+# stdlib_format
+
+FORMAT_TEMPLATES = [
+    '', 'no fields', '{a}', '{a}{b}', '{{literal}} {a}', '{a!r} {a!s} {a!a}', '{a:>10}|{b:.3f}',
+    '{c.real} {d[0]} {d[1][k]}', '{a:{b}}', '{0}', '{}', '{a!x}', '{a', 'a}', 'é{a}ø\n',
+]
+
+def test_precompiled_format_templates_give_the_same_output_as_str_format():
+    context = {'a': 'é', 'b': 3.14159, 'c': 2j, 'd': ['x', {'k': 'v'}]}
+    for template in FORMAT_TEMPLATES:
+        try:
+            expected = template.format(**context)
+        except Exception as e:
+            with raises(type(e) if not isinstance(e, IndexError) else ValueError):
+                FormatTemplate.parse(template).format_map(context)
+        else:
+            assert FormatTemplate.parse(template).format_map(context) == expected
+
+def test_precompiled_format_templates_raise_KeyError_for_missing_names():
+    with raises(KeyError):
+        FormatTemplate.parse('{missing}').format_map({})
+
+def test_stdlib_format_renderer_is_precompiled(harness):
+    harness.fs.www.mk(('index.spt', '[---]\nx = 1\n[---] text/plain via stdlib_format\n{x}'))
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    assert isinstance(resource.renderers['text/plain'].compiled, FormatTemplate)
+    assert harness.hit('/').text == '1'
+
+
+# stdlib_template
+
+TEMPLATE_TEMPLATES = [
+    '', 'no placeholders', '$a', '${a}b', '$$a $a', '$a$b', '$ a', '${a', 'é$a\n', '$a.$b$',
+]
+
+def test_precompiled_templates_give_the_same_output_as_string_Template():
+    context = {'a': 'é', 'b': 3}
+    for template in TEMPLATE_TEMPLATES:
+        try:
+            expected = Template(template).substitute(context)
+        except Exception as e:
+            with raises(type(e)):
+                CompiledTemplate.parse(template).substitute(context)
+        else:
+            assert CompiledTemplate.parse(template).substitute(context) == expected
+
+
+# streaming
+
+STREAMING_SIMPLATE = """\
+from aspen.output import Stream
+[---]
+rows = Stream('<li>%%i</li>' %% i for i in range(3))
+[---] text/html via %s
+<ul>%s</ul>
+"""
+
+def test_stream_values_are_streamed_by_stdlib_format(harness):
+    harness.fs.www.mk(('index.spt', STREAMING_SIMPLATE % ('stdlib_format', '{rows}')))
+    output = harness.hit('/')
+    assert output.is_streamed
+    assert output.charset == 'UTF-8'
+    assert list(output.body) == [b'<ul>', b'<li>0</li>', b'<li>1</li>', b'<li>2</li>', b'</ul>\n']
+
+def test_stream_values_are_streamed_by_stdlib_template(harness):
+    harness.fs.www.mk(('index.spt', STREAMING_SIMPLATE % ('stdlib_template', '$rows')))
+    output = harness.hit('/')
+    assert output.is_streamed
+    assert b''.join(output.body) == b'<ul><li>0</li><li>1</li><li>2</li></ul>\n'
+
+def test_other_iterators_are_formatted_not_streamed():
+    f = io.StringIO('contents')
+    assert FormatTemplate.parse('<{f}>').format_map({'f': f}) == '<%s>' % f
+    assert CompiledTemplate.parse('<$f>').substitute({'f': f}) == '<%s>' % f
+    assert not f.closed
+    rows = iter([])
+    assert FormatTemplate.parse('{rows}').format_map({'rows': rows}) == str(rows)
+
+def test_format_fields_with_a_spec_or_conversion_arent_streamed():
+    rows = Stream([])
+    assert FormatTemplate.parse('{rows!r}').format_map({'rows': rows}) == repr(rows)
+    rows = Stream(iter(['a', 'b']))
+    assert FormatTemplate.parse('[{rows:>4}]').format_map({'rows': rows}) == '[  ab]'
+
+def test_streamed_templates_mix_str_and_bytes_chunks():
+    chunks = FormatTemplate.parse('{a} {b} {c}').format_map(
+        {'a': 1, 'b': Stream(['é', b'\xc3\xa9']), 'c': 'x'}
+    )
+    assert list(chunks) == ['1', ' ', 'é', b'\xc3\xa9', ' ', 'x']
+
+def test_closing_a_streamed_template_closes_its_streams():
+    closed = []
+
+    def rows():
+        try:
+            yield 'a'
+            yield 'b'
+        finally:
+            closed.append(True)
+
+    chunks = CompiledTemplate.parse('<ul>$rows</ul>').substitute({'rows': Stream(rows())})
+    assert next(chunks) == '<ul>'
+    assert next(chunks) == 'a'
+    chunks.close()
+    assert closed == [True]
+
+def test_page_two_can_stream_the_body(harness):
+    harness.fs.www.mk(('index.spt', """\
+        [---]
+        output.body = (chunk for chunk in ['Greetings, ', b'program!'])
+        [---] text/plain
+    """))
+    output = harness.hit('/')
+    assert output.is_streamed
+    assert list(output.body) == [b'Greetings, ', b'program!']
+
+def test_streamed_pages_arent_buffered_for_metadata_only_requests(harness):
+    harness.fs.www.mk(('index.spt', STREAMING_SIMPLATE % ('stdlib_format', '{rows}')))
+    output = harness.hit('/', metadata_only=True)
+    assert (output.body, output.length) == (None, None)
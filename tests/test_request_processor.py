@@ -1,6 +1,12 @@
+import json
 import os
+import sys
+import tracemalloc
+
+from pytest import raises
 
 from aspen.request_processor import RequestProcessor
+from aspen.request_processor.startup import StartupProfiler
 from aspen.testing import chdir
 
 
@@ -27,3 +33,76 @@ def test_resources_can_import_from_project_root(harness):
         Greetings, %(bar)s!
     """, 'index.html.spt')
     assert r.text == "Greetings, baz!\n"
+
+
+# startup profiling
+
+def test_startup_isnt_profiled_by_default(harness):
+    assert harness.hydrate_request_processor().startup_report is None
+
+def test_startup_can_be_profiled(harness):
+    harness.fs.www.mk(('index.spt', '[---]\n[---]\nGreetings, program!'), ('foo.css', 'a{}'))
+    rp = harness.hydrate_request_processor(profile_startup=True)
+    report = rp.startup_report
+    assert [phase.name for phase in report.phases] == [
+        'configuration', 'simplates', 'media_types', 'dispatcher', 'resources',
+    ]
+    assert all(phase.wall_time >= 0 for phase in report.phases)
+    assert report.wall_time == sum(phase.wall_time for phase in report.phases)
+    assert report['dispatcher'].allocated > 0
+    assert not tracemalloc.is_tracing()
+    d = json.loads(json.dumps(report.as_dict()))
+    assert [phase['name'] for phase in d['phases']][-1] == 'resources'
+    lines = report.format().splitlines()
+    assert lines[-1].startswith('total')
+    assert len(lines) == 7
+
+def test_startup_profiler_records_imports(harness, monkeypatch):
+    harness.fs.project.mk(('startup_profiling_module.py', 'x = [0] * 100000'))
+    monkeypatch.syspath_prepend(harness.fs.project.root)
+    monkeypatch.delitem(sys.modules, 'startup_profiling_module', raising=False)
+    profiler = StartupProfiler()
+    profiler.phase('nothing')
+    profiler.phase('import')
+    import startup_profiling_module  # noqa: F401
+    report = profiler.stop()
+    assert report['nothing'].imports == []
+    assert report['import'].imports == ['startup_profiling_module']
+    assert report['import'].allocated > 100000 * 8
+
+def test_startup_profiler_does_nothing_when_disabled():
+    profiler = StartupProfiler(enabled=False)
+    profiler.phase('foo')
+    assert profiler.stop() is None
+
+def test_startup_profiler_stops_tracing_after_an_error(harness):
+    class BrokenDispatcher:
+        def __init__(self, *a, **kw):
+            raise ZeroDivisionError
+
+    with raises(ZeroDivisionError):
+        harness.hydrate_request_processor(profile_startup=True, dispatcher_class=BrokenDispatcher)
+    assert not tracemalloc.is_tracing()
+
+def test_startup_profiler_errors_dont_mask_the_original_error(harness, monkeypatch):
+    class BrokenDispatcher:
+        def __init__(self, *a, **kw):
+            raise ZeroDivisionError
+
+    stop = StartupProfiler.stop
+
+    def broken_stop(self):
+        stop(self)
+        raise RuntimeError
+
+    monkeypatch.setattr(StartupProfiler, 'stop', broken_stop)
+    with raises(ZeroDivisionError):
+        harness.hydrate_request_processor(profile_startup=True, dispatcher_class=BrokenDispatcher)
+
+def test_startup_profiler_doesnt_stop_tracing_it_didnt_start(harness):
+    tracemalloc.start()
+    try:
+        harness.hydrate_request_processor(profile_startup=True)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
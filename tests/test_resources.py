@@ -2,8 +2,10 @@ import os
 import sys
 from warnings import catch_warnings
 
-from aspen.exceptions import AttemptedBreakout, PossibleBreakout
-from aspen.http.resource import open_resource
+from aspen.exceptions import AttemptedBreakout, PossibleBreakout, RangeNotSatisfiable
+from aspen.http.resource import Static, open_resource
+from aspen.output import FileOutput
+from aspen.resources import Dependencies
 from aspen.simplates.pagination import split
 import pytest
 from pytest import raises
@@ -51,6 +53,90 @@ def test_encode_output_as_barely_working(harness):
     assert output.media_type == 'text/html'
     assert output.charset == 'ascii'
 
+def test_static_file_handoff_returns_a_file_output(harness):
+    output = harness.simple(
+        'Greetings, program!',
+        'index.html',
+        request_processor_configuration={'static_file_handoff': True},
+    )
+    assert isinstance(output, FileOutput)
+    assert output.body is None
+    assert output.media_type == 'text/html'
+    assert output.size == output.content_length == 19
+    assert output.ranges is None
+    assert b''.join(output) == b'Greetings, program!'
+    assert output.file.closed
+
+def test_static_file_handoff_serves_byte_ranges(harness):
+    output = harness.simple(
+        'Greetings, program!',
+        'index.html',
+        range_header='bytes=11-',
+        request_processor_configuration={'static_file_handoff': True},
+    )
+    assert output.ranges == [(11, 8)]
+    assert output.content_length == 8
+    assert b''.join(output.iter_range(11, 8, chunk_size=3)) == b'program!'
+    assert b''.join(output) == b'program!'
+
+def test_static_file_handoff_parses_multiple_byte_ranges(harness):
+    output = harness.simple(
+        'Greetings, program!',
+        'index.html',
+        range_header='bytes=0-8, -8',
+        request_processor_configuration={'static_file_handoff': True},
+    )
+    assert output.ranges == [(0, 9), (11, 8)]
+    assert [b''.join(output.iter_range(*r)) for r in output.ranges] == [b'Greetings', b'program!']
+    with raises(ValueError):
+        list(output)
+    output.close()
+
+def test_static_file_handoff_raises_RangeNotSatisfiable(harness):
+    with raises(RangeNotSatisfiable):
+        harness.simple(
+            'Greetings, program!',
+            'index.html',
+            range_header='bytes=100-',
+            request_processor_configuration={'static_file_handoff': True},
+        )
+
+def test_static_file_handoff_ignores_files_stored_in_ram(harness):
+    output = harness.simple(
+        'Greetings, program!',
+        'index.html',
+        range_header='bytes=11-',
+        request_processor_configuration={
+            'static_file_handoff': True, 'store_static_files_in_ram': True,
+        },
+    )
+    assert not isinstance(output, FileOutput)
+    assert output.body == b'Greetings, program!'
+
+def test_static_metadata_comes_from_the_dispatch_tree(harness, monkeypatch):
+    harness.fs.www.mk(('index.html', 'Greetings, program!'))
+    fspath = harness.fs.www.resolve('index.html')
+    node = harness.request_processor.get_file_node(fspath)
+    assert node.media_type == 'text/html'
+
+    def fail(*a, **kw):
+        raise AssertionError("the file shouldn't be stat'ed")
+
+    monkeypatch.setattr(os, 'stat', fail)
+    static = harness.request_processor.resources.get(fspath)
+    assert (static.size, static.mtime_ns) == (node.size, node.mtime_ns)
+    assert static.media_type == 'text/html'
+
+def test_static_metadata_is_refreshed_when_changes_reload_is_on(harness):
+    harness.fs.www.mk(('index.html', 'Greetings, program!'))
+    fspath = harness.fs.www.resolve('index.html')
+    resources = harness.hydrate_request_processor(changes_reload=True).resources
+    assert resources.get(fspath).size == 19
+    harness.fs.www.mk(('index.html', 'Greetings!'))
+    os.utime(fspath, ns=(0, 0))
+    assert resources.get(fspath).size == 10
+    assert harness.request_processor.get_file_node(fspath).size == 10
+
 def test_resource_pages_work(harness):
     actual = harness.simple("[---]\nfoo = 'bar'\n[--------]\nGreetings, %(foo)s!").text
     assert actual == "Greetings, bar!"
@@ -178,3 +264,79 @@ def test_open_resource_raises_exception_when_file_is_outside(harness):
     # Attempt to open the resource.
     with raises(AttemptedBreakout):
         open_resource(harness.request_processor, fspath)
+
+
+def test_check_resource_path_caches_real_paths(harness, monkeypatch):
+    harness.fs.www.mk(('index.html', 'foo'))
+    fspath = harness.fs.www.resolve('index.html')
+    harness.hydrate_request_processor()
+    calls = []
+    realpath = os.path.realpath
+    monkeypatch.setattr(os.path, 'realpath', lambda p: calls.append(p) or realpath(p))
+    for i in range(3):
+        with open_resource(harness.request_processor, fspath) as f:
+            assert f.read() == b'foo'
+    assert calls == [fspath]
+
+# `realpath` doesn't work on Windows in Python < 3.8: https://bugs.python.org/issue9949
+@pytest.mark.xfail('os.path.realpath is os.path.abspath')
+def test_modified_symlinks_are_checked_again(harness):
+    harness.fs.www.mk(('target.html', 'foo'))
+    harness.fs.project.mk(('outside.html', 'bar'))
+    fspath = harness.fs.www.resolve('index.html')
+    try:
+        os.symlink(harness.fs.www.resolve('target.html'), fspath)
+    except NotImplementedError:
+        return
+    resources = harness.hydrate_request_processor(changes_reload=True).resources
+    resources.request_processor.resource_directories.remove(harness.fs.project.root)
+    assert resources.get(fspath).render().body == b'foo'
+    outside = harness.fs.project.resolve('outside.html')
+    os.utime(outside, ns=(0, 0))
+    os.remove(fspath)
+    os.symlink(outside, fspath)
+    with raises(AttemptedBreakout):
+        resources.get(fspath).render()
+
+# `realpath` doesn't work on Windows in Python < 3.8: https://bugs.python.org/issue9949
+@pytest.mark.xfail('os.path.realpath is os.path.abspath')
+def test_static_digests_arent_computed_for_files_outside(harness):
+    harness.fs.www.mk(('index.html', 'foo'))
+    harness.fs.project.mk(('outside.html', 'bar'))
+    fspath = harness.fs.www.resolve('index.html')
+    request_processor = harness.hydrate_request_processor(static_etags='digest')
+    request_processor.resource_directories.remove(harness.fs.project.root)
+    os.remove(fspath)
+    try:
+        os.symlink(harness.fs.project.resolve('outside.html'), fspath)
+    except NotImplementedError:
+        return
+    with raises(AttemptedBreakout):
+        Static(request_processor, fspath)
+    assert request_processor.get_file_node(fspath)._digest is None
+
+
+# Test the `Dependencies` class
+
+def test_dependencies_detect_modified_created_and_deleted_files(harness):
+    harness.fs.project.mk(('foo.txt', 'foo'))
+    foo, bar = harness.fs.project.resolve('foo.txt'), harness.fs.project.resolve('bar.txt')
+    resources = harness.hydrate_request_processor(changes_reload=True).resources
+    dependencies = Dependencies(resources, [foo, bar])
+    assert not dependencies.changed()
+    os.utime(foo, ns=(0, 0))
+    assert dependencies.changed()
+    dependencies = Dependencies(resources, [foo, bar])
+    harness.fs.project.mk(('bar.txt', 'bar'))
+    assert dependencies.changed()
+    dependencies = Dependencies(resources, [foo, bar])
+    os.remove(bar)
+    assert dependencies.changed()
+
+def test_unknown_dependencies_have_always_changed(harness):
+    dependencies = Dependencies(harness.request_processor.resources, None)
+    assert dependencies.changed()
+
+def test_no_dependencies_never_change(harness):
+    dependencies = Dependencies(harness.request_processor.resources, ())
+    assert not dependencies.changed()
@@ -1,8 +1,13 @@
-from pytest import raises, fixture
+import ast
+import asyncio
+import sys
+
+from pytest import raises, fixture, mark
 
 from aspen.exceptions import NegotiationFailure, NotFound
-from aspen.http.resource import mimetypes
-from aspen.simplates.simplate import Simplate
+from aspen.http.request import Path
+from aspen.http.resource import Dynamic, mimeparse
+from aspen.simplates.simplate import Context, Simplate
 from aspen.simplates.pagination import Page
 from aspen.simplates.renderers import Renderer, Factory
 from aspen.simplates.renderers.stdlib_template import Factory as TemplateFactory
@@ -27,6 +32,52 @@ def test_duplicate_media_type_causes_SyntaxError(make_simplate):
         make_simplate(raw=b"[---]\n[---] text/plain\n[---] text/plain\n")
 
 
+# lazy compilation
+
+LAZY_SIMPLATE = b"""\
+[---]
+x = 1
+[---] text/plain via stdlib_format
+{x}
+[---] application/json
+{'x':
+[---] text/html via stdlib_percent
+%(x)s
+"""
+
+def test_content_pages_are_compiled_lazily(make_simplate):
+    simplate = make_simplate(raw=LAZY_SIMPLATE)
+    assert simplate.available_types == ['text/plain', 'application/json', 'text/html']
+    assert len(simplate.renderers) == 0
+    assert sorted(simplate.renderers.pages) == ['application/json', 'text/html', 'text/plain']
+    output = simplate.render_for_type('text/html', {})
+    assert output.body == '1\n'
+    assert list(simplate.renderers) == ['text/html']
+    assert sorted(simplate.renderers.pages) == ['application/json', 'text/plain']
+
+def test_content_pages_are_compiled_once(make_simplate):
+    simplate = make_simplate(raw=LAZY_SIMPLATE)
+    renderer = simplate.renderers['text/plain']
+    assert simplate.renderers['text/plain'] is renderer
+    assert 'text/plain' not in simplate.renderers.pages
+
+def test_content_page_errors_are_raised_when_the_page_is_first_used(make_simplate):
+    simplate = make_simplate(raw=LAZY_SIMPLATE)
+    with raises(SyntaxError):
+        simplate.render_for_type('application/json', {})
+
+def test_speclines_of_unused_content_pages_are_validated_when_loading(make_simplate):
+    with raises(SyntaxError):
+        make_simplate(raw=b"[---]\n[---] text/plain\nfoo\n[---] text/html via bad renderer\n")
+    with raises(ValueError):
+        make_simplate(raw=b"[---]\n[---] text/plain\nfoo\n[---] text/html via glubber\n")
+
+def test_unknown_media_types_are_still_not_found(make_simplate):
+    simplate = make_simplate(raw=LAZY_SIMPLATE)
+    with raises(KeyError):
+        simplate.renderers['image/png']
+
+
 # compile_page
 
 def test_compile_page_compiles_empty_page(make_simplate):
@@ -148,21 +199,56 @@ def test_render_negotation_failures_include_available_types(harness):
     assert actual == expected
 
 def test_treat_media_type_variants_as_equivalent(harness):
-    guess_type = mimetypes.guess_type
-
-    def _guess_type(url, **kw):
-        return ('application/x-javascript' if url.endswith('.js') else '', None)
-
-    mimetypes.guess_type = _guess_type
-    try:
-        output = harness.simple(
-            filepath='foobar.spt',
-            contents="[---]\n[---] application/javascript\n[---] text/plain\n",
-            uripath='/foobar.js',
-        )
-        assert output.media_type == "application/javascript"
-    finally:
-        mimetypes.guess_type = guess_type
+    output = harness.simple(
+        filepath='foobar.spt',
+        contents="[---]\n[---] application/javascript\n[---] text/plain\n",
+        uripath='/foobar.js',
+        request_processor_configuration={
+            'media_type_overrides': {'js': 'application/x-javascript'},
+        },
+    )
+    assert output.media_type == "application/javascript"
+
+
+def test_negotiation_results_are_cached(harness, monkeypatch):
+    harness.fs.www.mk(('index.spt', SIMPLATE),)
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    assert resource.extension_types['txt'] == 'text/plain'
+    assert resource.extension_types['html'] == 'text/html'
+    calls = []
+    best_match = mimeparse.best_match
+    monkeypatch.setattr(mimeparse, 'best_match', lambda *a: calls.append(a) or best_match(*a))
+    for i in range(3):
+        assert harness.hit('/', accept_header='text/html').media_type == 'text/html'
+        assert harness.hit('/index.txt').media_type == 'text/plain'
+        with raises(NegotiationFailure):
+            harness.hit('/', accept_header='cheese/head')
+        with raises(NotFound):
+            harness.hit('/index.jpg')
+    assert len(calls) == 3
+
+def test_dynamic_subclasses_dont_have_to_precompute_negotiation(harness):
+    class Resource(Dynamic):
+        def __init__(self, request_processor):
+            self.request_processor = request_processor
+            self.available_types = ['text/plain', 'text/html']
+
+        def render_for_type(self, media_type, context):
+            return media_type
+
+    resource = Resource(harness.request_processor)
+    result = harness.request_processor.dispatch(Path('/'))
+    assert resource.render({}, result, 'text/html') == 'text/html'
+    result.extension = 'txt'
+    assert resource.render({}, result, None) == 'text/plain'
+
+def test_negotiation_cache_is_bounded(harness):
+    harness.fs.www.mk(('index.spt', SIMPLATE),)
+    resource = harness.request_processor.resources.get(harness.fs.www.resolve('index.spt'))
+    for i in range(resource.max_negotiations + 10):
+        harness.hit('/', accept_header='text/x-%i, text/html' % i)
+    assert len(resource.accept_types) == resource.max_negotiations
+    assert 'text/x-0, text/html' not in resource.accept_types
 
 
 class Glubber(Renderer):
@@ -317,3 +403,231 @@ python_code = True
 [---]
 Template""")
     assert output.text == 'Template'
+
+
+# page two as a function
+
+LOOP_SIMPLATE = """\
+total = 10
+[---]
+squares = []
+for i in range(int(querystring.get('n', '3'))):
+    squares.append(i * i)
+total += sum(squares)
+def describe():
+    return '%i squares' % len(squares)
+description = describe()
+[---] text/plain via stdlib_format
+{squares} {total} {description}"""
+
+def get_simplate(harness, fspath='index.spt'):
+    return harness.request_processor.resources.get(harness.fs.www.resolve(fspath))
+
+def test_page_two_runs_the_same_as_a_function(harness):
+    harness.fs.www.mk(('a.spt', LOOP_SIMPLATE), ('b.spt', LOOP_SIMPLATE))
+    expected = harness.hit('/a').text
+    harness.hydrate_request_processor(page_two_as_function=True)
+    assert harness.hit('/b').text == expected == '[0, 1, 4] 15 3 squares'
+    assert get_simplate(harness, 'b.spt').page_two_function is not None
+
+def test_page_two_isnt_a_function_by_default(harness):
+    harness.simple(LOOP_SIMPLATE, filepath='index.spt')
+    assert get_simplate(harness).page_two_function is None
+
+def test_page_two_as_a_function_doesnt_change_page_one(harness):
+    harness.fs.www.mk(('index.spt', LOOP_SIMPLATE))
+    harness.hydrate_request_processor(page_two_as_function=True)
+    assert harness.hit('/', querystring='n=2').text.endswith(' 11 2 squares')
+    assert harness.hit('/', querystring='n=2').text.endswith(' 11 2 squares')
+    assert get_simplate(harness).page_one['total'] == 10
+
+def test_page_two_as_a_function_is_per_simplate_configurable(harness):
+    output = harness.simple("page_two_as_function = True\n" + LOOP_SIMPLATE, filepath='index.spt')
+    assert output.text == '[0, 1, 4] 15 3 squares'
+    assert get_simplate(harness).page_two_function is not None
+
+def test_page_two_as_a_function_respects___all__(harness):
+    harness.fs.www.mk(
+        ('x.spt', "[---]\nx = 1\ny = 2\n__all__ = ['x']\n[---]\n%(x)s"),
+        ('y.spt', "[---]\nx = 1\ny = 2\n__all__ = ['x']\n[---]\n%(y)s"),
+    )
+    harness.hydrate_request_processor(page_two_as_function=True)
+    assert harness.hit('/x').text == '1'
+    with raises(KeyError):
+        harness.hit('/y')
+
+def test_undefined_names_in_page_two_as_a_function_raise_NameError(harness):
+    harness.fs.www.mk(
+        ('a.spt', "[---]\nx = undefined\n[---]\n%(x)s"),
+        ('b.spt', "[---]\nx += 1\n[---]\n%(x)s"),
+    )
+    harness.hydrate_request_processor(page_two_as_function=True)
+    with raises(NameError):
+        harness.hit('/a')
+    with raises(NameError):
+        harness.hit('/b')
+
+def test_page_two_cant_return_or_yield_in_either_mode(harness, make_simplate):
+    pages = ("x = 1\nif x:\n    return\n", "x = 1\nfor y in [x]:\n    yield y\n")
+    for i, page in enumerate(pages):
+        harness.fs.www.mk(('%i.spt' % i, "[---]\n%s[---] text/plain\n%%(x)s" % page))
+        for as_function in (False, True):
+            harness.hydrate_request_processor(page_two_as_function=as_function)
+            with raises(SyntaxError) as e:
+                harness.hit('/%i' % i)
+            assert e.value.lineno == 4
+    # the function is checked even if the module code isn't compiled first
+    tree = ast.parse("def f():\n    return 1\nreturn f()\n", mode='exec')
+    with raises(SyntaxError) as e:
+        make_simplate()._compile_page_two_function(tree)
+    assert e.value.lineno == 3
+
+def test_page_two_falls_back_to_exec_when_it_cant_be_a_function(harness):
+    harness.fs.www.mk(('index.spt', "[---]\nfrom os.path import *\nx = sep\n[---]\n%(x)s"))
+    harness.hydrate_request_processor(page_two_as_function=True)
+    assert harness.hit('/').text == '/'
+    assert get_simplate(harness).page_two_function is None
+
+def test_page_two_as_a_function_has_correct_line_numbers(harness):
+    harness.fs.www.mk(('index.spt', "x = 0\n[---]\ny = 1\ny = 1 / x\n[---]\n%(y)s"))
+    harness.hydrate_request_processor(page_two_as_function=True)
+    with raises(ZeroDivisionError) as e:
+        harness.hit('/')
+    assert e.traceback[-1].lineno + 1 == 4
+
+
+# layered context
+
+def test_context_falls_back_to_page_one():
+    context = Context(b=3)
+    context.page_one = {'a': 1, 'b': 2}
+    assert context['a'] == 1
+    assert context['b'] == 3
+    assert 'a' in context and 'c' not in context
+    assert context.get('a') == 1 and context.get('c', 4) == 4
+    assert dict(context) == context.copy() == {'a': 1, 'b': 3}
+    assert sorted(context) == ['a', 'b'] and len(context) == 2
+    with raises(KeyError):
+        context['c']
+
+def test_page_one_isnt_copied_into_the_request_context(make_simplate):
+    simplate = make_simplate(raw=b"x = 1\n[---]\ny = x + 1\n[---] text/plain\n%(x)s %(y)s")
+    context = {}
+    assert simplate.render_for_type('text/plain', context).body == '1 2'
+    assert set(context) == {'output', 'y'}
+
+def test_page_two_changes_are_applied_to_the_request_context(make_simplate):
+    raw = b"page_two_as_function = %s\n[---]\ny = len('ab')\nz = path\n[---] text/plain\n%%(y)s"
+    for i, as_function in enumerate((b'False', b'True')):
+        simplate = make_simplate('index%i.spt' % i, raw % as_function)
+        context = {'path': '/'}
+        assert simplate.render_for_type('text/plain', context).body == '2'
+        assert context == {'output': context['output'], 'path': '/', 'y': 2, 'z': '/'}
+
+def test_request_variables_deleted_by_page_two_are_deleted(make_simplate):
+    simplate = make_simplate(raw=b"[---]\ndel q\n[---] text/plain\n%(path)s")
+    context = {'path': '/', 'q': 'a'}
+    assert simplate.render_for_type('text/plain', context).body == '/'
+    assert 'q' not in context
+
+def test_page_one_variables_deleted_by_page_two_stay_deleted(make_simplate):
+    simplate = make_simplate(raw=b"x = 1\n[---]\ndel x\n[---] text/plain\n%(x)s")
+    with raises(KeyError):
+        simplate.render_for_type('text/plain', {})
+
+def test_page_one_overrides_request_variables(make_simplate):
+    simplate = make_simplate(raw=b"x = 1\n[---]\n[---] text/plain via stdlib_format\n{x}")
+    assert simplate.render_for_type('text/plain', {'x': 0}).body == '1'
+
+def test_functions_in_page_two_see_page_one_and_page_two(make_simplate):
+    simplate = make_simplate(raw=(
+        b"x = 1\ndef f():\n    return x\n[---]\ny = 2\ndef g():\n    return f() + y + len('ab')\n"
+        b"z = g()\n[---] text/plain via stdlib_template\n$z"
+    ))
+    assert simplate.render_for_type('text/plain', {}).body == '5'
+
+def test_all_filters_the_layered_context(make_simplate):
+    raw = b"x = 1\n__all__ = ['x', 'y']\n[---]\ny = 2\nz = 3\n[---] text/plain\n%(x)s %(y)s"
+    assert make_simplate(raw=raw).render_for_type('text/plain', {}).body == '1 2'
+    raw = raw.replace(b'%(y)s', b'%(z)s')
+    with raises(KeyError):
+        make_simplate('other.spt', raw).render_for_type('text/plain', {})
+
+def test_renderer_flags_are_read_from_page_one(make_simplate):
+    simplate = make_simplate(raw=(
+        b"json_compact = True\n[---]\n[---] application/json via json_dump\n{'a': [1]}"
+    ))
+    assert simplate.render_for_type('application/json', {}).body == '{"a":[1]}'
+
+
+# async simplates
+
+# `await` outside of functions can only be compiled by Python >= 3.8
+requires_top_level_await = mark.skipif(
+    sys.version_info < (3, 8), reason="async simplates require Python 3.8 or later"
+)
+
+def run(coroutine):
+    # `asyncio.run` requires Python >= 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+ASYNC_SIMPLATE = """\
+import asyncio
+async def fetch(x):
+    await asyncio.sleep(0)
+    return x * 2
+[---]
+n = int(querystring.get('n', '1'))
+doubled = await fetch(n)
+async def numbers():
+    for i in range(n):
+        yield i
+numbers = [i async for i in numbers()]
+[---] text/plain via stdlib_format
+{doubled} {numbers}"""
+
+@requires_top_level_await
+def test_async_simplates_are_rendered_by_process_async(harness):
+    harness.fs.www.mk(('index.spt', ASYNC_SIMPLATE))
+    output = run(harness.hit_async('/', querystring='n=3'))
+    assert output.text == '6 [0, 1, 2]'
+    assert get_simplate(harness).page_two_is_async
+
+@requires_top_level_await
+def test_async_simplates_cant_be_rendered_by_process(harness):
+    harness.fs.www.mk(('index.spt', ASYNC_SIMPLATE))
+    with raises(TypeError):
+        harness.hit('/')
+
+@requires_top_level_await
+def test_async_simplates_can_run_as_functions(harness):
+    harness.fs.www.mk(('index.spt', ASYNC_SIMPLATE))
+    harness.hydrate_request_processor(page_two_as_function=True)
+    output = run(harness.hit_async('/', querystring='n=2'))
+    assert output.text == '4 [0, 1]'
+    assert get_simplate(harness).page_two_function is not None
+
+def test_sync_simplates_are_rendered_by_process_async(harness):
+    harness.fs.www.mk(('index.spt', LOOP_SIMPLATE), ('static.txt', 'Greetings!'))
+    assert not get_simplate(harness).page_two_is_async
+    output = run(harness.hit_async('/'))
+    assert output.text == '[0, 1, 4] 15 3 squares'
+    assert run(harness.hit_async('/static.txt')).body == b'Greetings!'
+    assert run(harness.hit_async('/missing', want='resource')) is None
+
+@requires_top_level_await
+def test_async_requests_share_the_event_loop(harness):
+    harness.fs.www.mk(('index.spt', (
+        "import asyncio\nevents = []\n[---]\nevents.append(querystring['i'])\n"
+        "await asyncio.sleep(0)\nevents.append(querystring['i'])\n[---] text/plain\n"
+    )))
+
+    async def main():
+        await asyncio.gather(*[harness.hit_async('/', querystring='i=%i' % i) for i in range(2)])
+
+    run(main())
+    assert get_simplate(harness).page_one['events'] == ['0', '1', '0', '1']